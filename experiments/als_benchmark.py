@@ -0,0 +1,69 @@
+"""Benchmark the ALS baseline fit for different scan lengths.
+
+Compares the banded solver used by srttools.fit._als with the original
+implementation, that built the second-difference operator from a dense
+identity matrix. The original implementation is only run when its dense
+matrix fits in less than 1 GB of memory.
+
+Usage: python als_benchmark.py [length1 length2 ...]
+"""
+from __future__ import (absolute_import, division,
+                        print_function)
+
+import sys
+import time
+import numpy as np
+from scipy import sparse
+from scipy.sparse.linalg import spsolve
+
+from srttools.fit import _als, baseline_als
+
+
+def dense_identity_als(y, lam, p, niter=30):
+    """The original ALS implementation, quadratic in memory."""
+    L = len(y)
+    D = sparse.csc_matrix(np.diff(np.eye(L), 2))
+    w = np.ones(L)
+    for _ in range(niter):
+        W = sparse.spdiags(w, 0, L, L)
+        Z = W + lam * D.dot(D.transpose())
+        z = spsolve(Z, w*y)
+        w = p * (y > z) + (1-p) * (y < z)
+    return z
+
+
+def synthetic_scan(length):
+    """A drifting baseline, with noise and a source in the middle."""
+    x = np.arange(length)
+    y = 3 * np.sin(x / length * 4) + np.random.normal(0, 0.1, length)
+    y += 10 * np.exp(-(x - length / 2) ** 2 / (length / 100) ** 2)
+    return x, y
+
+
+def timeit(func, *args, **kwargs):
+    t0 = time.time()
+    result = func(*args, **kwargs)
+    return time.time() - t0, result
+
+
+def main(lengths=(1000, 10000, 100000)):
+    lam, p = 1e11, 0.001
+    print('{:>8s} {:>12s} {:>15s} {:>12s} {:>12s}'.format(
+        'Length', 'Banded (s)', 'Dense eye (s)', 'Max diff', 'Full fit (s)'))
+    for length in lengths:
+        x, y = synthetic_scan(length)
+        banded_time, z = timeit(_als, y, lam, p)
+        dense_time = diff = np.nan
+        if 8 * length ** 2 < 1024 ** 3:
+            dense_time, z_dense = timeit(dense_identity_als, y, lam, p)
+            diff = np.max(np.abs(z - z_dense))
+        full_time, _ = timeit(baseline_als, x, y)
+        print('{:8d} {:12.3f} {:15.3f} {:12.2e} {:12.3f}'.format(
+            length, banded_time, dense_time, diff, full_time))
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        main([int(float(a)) for a in sys.argv[1:]])
+    else:
+        main()
@@ -0,0 +1,87 @@
+"""Benchmark the HDF5 options of Scan.write and ScanSet.write.
+
+Writes a synthetic 7-feed dataset with different compression, chunking and
+data type options, and reports write time, file size, and the time needed to
+read the full table, a single channel and a range of rows.
+
+Usage: python hdf5_options_benchmark.py [nrows]
+"""
+from __future__ import (absolute_import, division,
+                        print_function)
+
+import os
+import sys
+import time
+import numpy as np
+from astropy.table import Table
+import astropy.units as u
+
+from srttools.io import (write_hdf5_table, read_hdf5_table, cast_columns,
+                         hdf5_write_options)
+
+
+def synthetic_map_table(nrows, nfeeds=7):
+    """Table with the columns of a processed 7-feed ScanSet."""
+    table = Table()
+    table['time'] = 57000 + np.arange(nrows) / 86400 / 25
+    for coord in ['ra', 'dec', 'az', 'el']:
+        base = np.cumsum(np.random.normal(0, 1e-6, nrows))
+        offsets = np.linspace(0, 1e-3, nfeeds)
+        table[coord] = (base[:, np.newaxis] + offsets[np.newaxis, :]) * u.rad
+    table['Scan_id'] = np.arange(nrows) // 2000
+    for feed in range(nfeeds):
+        for pol in ['LCP', 'RCP']:
+            ch = 'Feed{}_{}'.format(feed, pol)
+            table[ch] = 100 + np.sin(np.arange(nrows) / 300) + \
+                np.random.normal(0, 0.1, nrows)
+            table[ch + '-filt'] = np.ones(nrows, dtype=bool)
+    table.meta['SOURCE'] = 'Dummy'
+    return table
+
+
+CONFIGURATIONS = [
+    ('default', {}),
+    ('gzip', {'hdf5_compression': 'gzip'}),
+    ('gzip+shuffle', {'hdf5_compression': 'gzip', 'hdf5_shuffle': True}),
+    ('lzf', {'hdf5_compression': 'lzf'}),
+    ('lzf+shuffle', {'hdf5_compression': 'lzf', 'hdf5_shuffle': True}),
+    ('gzip+shuffle, 4096-row chunks',
+     {'hdf5_compression': 'gzip', 'hdf5_shuffle': True,
+      'hdf5_chunk_rows': 4096}),
+    ('float32 channels, gzip+shuffle',
+     {'hdf5_compression': 'gzip', 'hdf5_shuffle': True,
+      'hdf5_dtypes': [['Feed*_?CP', 'float32']]}),
+]
+
+
+def timeit(func, *args, **kwargs):
+    t0 = time.time()
+    func(*args, **kwargs)
+    return time.time() - t0
+
+
+def main(nrows=200000):
+    table = synthetic_map_table(nrows)
+    fname = 'hdf5_benchmark.hdf5'
+    print('{} rows, 7 feeds'.format(nrows))
+    print('{:32s} {:>9s} {:>9s} {:>9s} {:>9s} {:>9s}'.format(
+        'Options', 'Size (MB)', 'Write (s)', 'Read (s)', '1 ch (s)',
+        'Rows (s)'))
+    for label, config in CONFIGURATIONS:
+        options = hdf5_write_options(config)
+        to_write = cast_columns(table, config.get('hdf5_dtypes', None))
+        write_time = timeit(write_hdf5_table, to_write, fname, 'scanset',
+                            overwrite=True, **options)
+        size = os.path.getsize(fname) / 1024 ** 2
+        read_time = timeit(read_hdf5_table, fname, 'scanset')
+        chan_time = timeit(read_hdf5_table, fname, 'scanset',
+                           columns=['Feed3_LCP'])
+        rows_time = timeit(read_hdf5_table, fname, 'scanset',
+                           rows=slice(nrows // 2, nrows // 2 + 2000))
+        print('{:32s} {:9.1f} {:9.3f} {:9.3f} {:9.3f} {:9.3f}'.format(
+            label, size, write_time, read_time, chan_time, rows_time))
+    os.unlink(fname)
+
+
+if __name__ == '__main__':
+    main(*[int(a) for a in sys.argv[1:]])
@@ -0,0 +1,49 @@
+"""Benchmark the running median of srttools.utils against scipy's medfilt.
+
+Filters a set of synthetic 16k-bin spectral variability curves, like the
+ones of the RFI cleaning in srttools.scan, with different window sizes.
+Without Numba, running_median falls back to medfilt and the times are
+the same.
+
+Usage: python running_median_benchmark.py [nbin [nchan]]
+"""
+from __future__ import (absolute_import, division,
+                        print_function)
+
+import sys
+import time
+import numpy as np
+from scipy.signal import medfilt, medfilt2d
+
+from srttools.utils import running_median, HAS_NUMBA
+
+
+WINDOWS = [11, 51, 201, 801, 3201]
+
+
+def timeit(func, *args, **kwargs):
+    t0 = time.time()
+    result = func(*args, **kwargs)
+    return time.time() - t0, result
+
+
+def main(nbin=16384, nchan=4):
+    spectra = np.random.normal(0, 1, (nchan, nbin)) + \
+        np.sin(np.arange(nbin) / nbin * 10)
+    # Compile before timing
+    running_median(spectra[:, :100], 3)
+    print('{} channels x {} bins, Numba: {}'.format(nchan, nbin, HAS_NUMBA))
+    print('{:>8s} {:>13s} {:>15s} {:>16s} {:>6s}'.format(
+        'Window', 'medfilt (s)', 'medfilt2d (s)', 'running (s)', 'Same'))
+    for window in WINDOWS:
+        medfilt_time, _ = timeit(
+            lambda: [medfilt(s, window) for s in spectra])
+        medfilt2d_time, expected = timeit(medfilt2d, spectra, [1, window])
+        running_time, median = timeit(running_median, spectra, window)
+        print('{:8d} {:13.3f} {:15.3f} {:16.3f} {:>6s}'.format(
+            window, medfilt_time, medfilt2d_time, running_time,
+            str(np.all(median == expected))))
+
+
+if __name__ == '__main__':
+    main(*[int(a) for a in sys.argv[1:]])
@@ -12,8 +12,9 @@ from __future__ import (absolute_import, division,
 
 from .scan import Scan, list_scans
 from .read_config import read_config, sample_config_file, get_config_file
-from .fit import fit_baseline_plus_bell
-from .io import mkdir_p
+from .fit import fit_baselines_plus_bells
+from .io import mkdir_p, read_many
+from .plotter import wait_for_plots
 from .utils import standard_string, standard_byte, compare_strings
 from .utils import HAS_STATSM, calculate_moments, scantype
 
@@ -160,7 +161,76 @@ def _get_calibrator_flux(calibrator, frequency, bandwidth=1, time=0):
         return _calc_flux_from_coeffs(conf, frequency, bandwidth, time)
 
 
+def _plot_scan_fit(x, y, model_y, outfile, fit_mean, pnt, fit_label,
+                   label="Fit"):
+    """Plot the fit of a calibrator scan and its residuals."""
+    fig = plt.figure("Fit information")
+    gs = GridSpec(2, 1, height_ratios=(3, 1))
+    ax0 = plt.subplot(gs[0])
+    ax1 = plt.subplot(gs[1], sharex=ax0)
+
+    ax0.plot(x, y, label="Data")
+    ax0.plot(x, model_y, label=label)
+    ax1.plot(x, y - model_y)
+
+    ax0.axvline(fit_mean, label=fit_label + " Fit", ls="-")
+    ax0.axvline(pnt, label=fit_label + " Pnt", ls="--")
+    ax0.set_xlim([min(x), max(x)])
+    ax1.set_xlabel(fit_label)
+    ax0.set_ylabel("Counts")
+    ax1.set_ylabel("Residual (cts)")
+
+    ax0.legend()
+    ax1.legend()
+    plt.savefig(outfile)
+    plt.close(fig)
+
+
+def _plot_scan_temperature_fit(x, temperature, model_temperature, outfile,
+                               pnt, fit_label):
+    """Plot the fit of the temperature along a calibrator scan."""
+    fig = plt.figure("Fit information - temperature")
+    gs = GridSpec(2, 1, height_ratios=(3, 1))
+    ax0 = plt.subplot(gs[0])
+    ax1 = plt.subplot(gs[1], sharex=ax0)
+
+    ax0.plot(x, temperature, label="Data")
+    ax0.plot(x, model_temperature, label="Fit")
+    ax1.plot(x, temperature - model_temperature)
+
+    ax0.axvline(pnt, label=fit_label + " Pnt", ls="--")
+    ax0.set_xlim([min(x), max(x)])
+    ax1.set_xlabel(fit_label)
+    ax0.set_ylabel("Counts")
+    ax1.set_ylabel("Residual (cts)")
+
+    plt.legend()
+    plt.savefig(outfile)
+    plt.close(fig)
+
+
 def _treat_scan(scan_path, plot=False, **kwargs):
+    """Fit the calibrator in all channels of a scan.
+
+    Returns
+    -------
+    success : bool
+        False if the scan could not be loaded
+    rows : list
+        One row of the :class:`CalibratorTable` per channel
+
+    Notes
+    -----
+    All channels are fitted together by
+    :func:`srttools.fit.fit_baselines_plus_bells`. On noisy scans where the
+    calibrator is off-center or missing, the results can differ from the
+    per-channel fits of earlier versions: the fit can find the bell where
+    the previous one stopped at zero amplitude, or the other way round.
+    Fits ending at zero amplitude still produce a row, with zero
+    ``Counts``; the width and center of the bell are then undetermined, and
+    their uncertainties are zero (see
+    :func:`srttools.fit.fit_baselines_plus_bells`).
+    """
     scandir, sname = os.path.split(scan_path)
     if plot and HAS_MPL:
         outdir = os.path.splitext(sname)[0] + "_scanfit"
@@ -181,6 +251,7 @@ def _treat_scan(scan_path, plot=False, **kwargs):
         warnings.warn(traceback.format_exc())
         return False, None
 
+    plotter = scan.get_plotter()
     feeds = np.arange(scan['ra'].shape[1])
     chans = scan.chan_columns()
 
@@ -188,12 +259,29 @@ def _treat_scan(scan_path, plot=False, **kwargs):
     F, N = np.meshgrid(feeds, chan_nums)
     F = F.flatten()
     N = N.flatten()
-    rows = []
-    for feed, nch in zip(F, N):
-        channel = chans[nch]
 
+    # All the fits of the scan, on the temperature (for gain curves) and
+    # on RA and/or Dec, are done together
+    temperature_xs, xs, scan_types = [], [], []
+    for feed in F:
         ras = np.degrees(scan['ra'][:, feed])
         decs = np.degrees(scan['dec'][:, feed])
+        els = np.degrees(scan['el'][:, feed])
+        azs = np.degrees(scan['az'][:, feed])
+        temperature_xs.append(scantype(ras, decs, els, azs)[0])
+        x, scan_type = scantype(ras, decs)
+        xs.append(x)
+        scan_types.append(scan_type)
+    temperatures = [scan[chans[nch] + '-Temp'] for nch in N]
+    ys = [scan[chans[nch]] for nch in N]
+    fits = fit_baselines_plus_bells(temperature_xs + xs, temperatures + ys,
+                                    kind='gauss')
+    temperature_fits, fits = fits[:len(F)], fits[len(F):]
+
+    rows = []
+    for i, (feed, nch) in enumerate(zip(F, N)):
+        channel = chans[nch]
+
         els = np.degrees(scan['el'][:, feed])
         azs = np.degrees(scan['az'][:, feed])
         time = np.mean(scan['time'][:])
@@ -204,19 +292,15 @@ def _treat_scan(scan_path, plot=False, **kwargs):
         pnt_dec = np.degrees(scan.meta['Dec'])
         frequency = scan[channel].meta['frequency']
         bandwidth = scan[channel].meta['bandwidth']
-        temperature = scan[channel + '-Temp']
+        temperature = temperatures[i]
 
-        y = scan[channel]
+        y = ys[i]
 
-        # Fit for gain curves
-        x, _ = scantype(ras, decs, els, azs)
-        temperature_model, _ = \
-            fit_baseline_plus_bell(x, temperature, kind='gauss')
+        temperature_model, _ = temperature_fits[i]
         source_temperature = temperature_model['Bell'].amplitude.value
 
-        # Fit RA and/or Dec
-        x, scan_type = scantype(ras, decs)
-        model, fit_info = fit_baseline_plus_bell(x, y, kind='gauss')
+        x, scan_type = xs[i], scan_types[i]
+        model, fit_info = fits[i]
 
         try:
             uncert = fit_info['param_cov'].diagonal() ** 0.5
@@ -280,51 +364,20 @@ def _treat_scan(scan_path, plot=False, **kwargs):
                      dec_err, skewness, kurtosis])
 
         if plot and HAS_MPL:
-            fig = plt.figure("Fit information")
-            gs = GridSpec(2, 1, height_ratios=(3, 1))
-            ax0 = plt.subplot(gs[0])
-            ax1 = plt.subplot(gs[1], sharex=ax0)
-
-            ax0.plot(x, y, label="Data")
-            ax0.plot(x, bell(x),
-                     label="Fit: Amp: {}, Wid: {}".format(counts, fit_width))
-            ax1.plot(x, y - bell(x))
-
-            ax0.axvline(fit_mean, label=fit_label + " Fit", ls="-")
-            ax0.axvline(pnt.to(u.deg).value, label=fit_label + " Pnt",
-                        ls="--")
-            ax0.set_xlim([min(x), max(x)])
-            ax1.set_xlabel(fit_label)
-            ax0.set_ylabel("Counts")
-            ax1.set_ylabel("Residual (cts)")
-
-            ax0.legend()
-            ax1.legend()
-            plt.savefig(os.path.join(outdir,
-                                     "Feed{}_chan{}.png".format(feed,
-                                                                nch)))
-            plt.close(fig)
-            fig = plt.figure("Fit information - temperature")
-            gs = GridSpec(2, 1, height_ratios=(3, 1))
-            ax0 = plt.subplot(gs[0])
-            ax1 = plt.subplot(gs[1], sharex=ax0)
-
-            ax0.plot(x, temperature, label="Data")
-            ax0.plot(x, temperature_model['Bell'](x), label="Fit")
-            ax1.plot(x, temperature - temperature_model['Bell'](x))
-
-            ax0.axvline(pnt.to(u.deg).value, label=fit_label + " Pnt",
-                        ls="--")
-            ax0.set_xlim([min(x), max(x)])
-            ax1.set_xlabel(fit_label)
-            ax0.set_ylabel("Counts")
-            ax1.set_ylabel("Residual (cts)")
-
-            plt.legend()
-            plt.savefig(os.path.join(outdir,
-                                     "Feed{}_chan{}_temp.png".format(feed,
-                                                                     nch)))
-            plt.close(fig)
+            pnt_value = pnt.to(u.deg).value
+            outfile = os.path.join(outdir,
+                                   "Feed{}_chan{}.png".format(feed, nch))
+            plotter.submit(
+                _plot_scan_fit, np.asarray(x), np.asarray(y),
+                np.asarray(bell(x)), outfile, fit_mean, pnt_value, fit_label,
+                label="Fit: Amp: {}, Wid: {}".format(counts, fit_width))
+            outfile = os.path.join(outdir,
+                                   "Feed{}_chan{}_temp.png".format(feed, nch))
+            plotter.submit(
+                _plot_scan_temperature_fit, np.asarray(x),
+                np.asarray(temperature),
+                np.asarray(temperature_model['Bell'](x)), outfile, pnt_value,
+                fit_label)
 
     return True, rows
 
@@ -374,7 +427,7 @@ class CalibratorTable(Table):
                 self.add_column(Column(name=n, dtype=d))
 
     def from_scans(self, scan_list=None, debug=False, freqsplat=None,
-                   config_file=None, nofilt=False, plot=False):
+                   config_file=None, nofilt=False, plot=False, jobs=None):
         """Load source table from a list of scans.
 
         For each scan, a fit is performed. Since we are assuming point-like
@@ -401,6 +454,9 @@ class CalibratorTable(Table):
             :class:`srttools.scan.clean_scan_using_variability`
         plot : bool
             Plot diagnostic plots? Default False, True if debug is True.
+        jobs : int
+            Number of processes used to load and fit the scans. See
+            :func:`srttools.io.read_many`
 
         Returns
         -------
@@ -428,17 +484,24 @@ class CalibratorTable(Table):
         nscan = len(scan_list)
 
         out_retval = False
-        for i_s, s in enumerate(scan_list):
-            logging.info('{}/{}: Loading {}'.format(i_s + 1, nscan, s))
-
-            retval, rows = _treat_scan(s, plot=plot, debug=debug,
-                                       freqsplat=freqsplat, nofilt=nofilt)
+        # _treat_scan already skips the scans that cannot be loaded. Errors
+        # in the fits are raised, as when the scans are treated one by one
+        results = read_many(scan_list, jobs=jobs, reader=_treat_scan,
+                            catch=(IOError, OSError), plot=plot, debug=debug,
+                            freqsplat=freqsplat, nofilt=nofilt)
+        for i_s, result in enumerate(results):
+            logging.info('{}/{}: Loaded {}'.format(i_s + 1, nscan,
+                                                   scan_list[i_s]))
+            if result is None:
+                continue
+            retval, rows = result
 
             if retval:
                 out_retval = True
 
                 for r in rows:
                     self.add_row(r)
+        wait_for_plots()
 
         return out_retval
 
@@ -1121,6 +1184,9 @@ def main_cal(args=None):
     parser.add_argument("--check", action='store_true', default=False,
                         help='Check consistency of calibration')
 
+    parser.add_argument("--jobs", type=int, default=None,
+                        help="Number of processes used to load the scans")
+
     args = parser.parse_args(args)
 
     if args.sample_config:
@@ -1152,7 +1218,7 @@ def main_cal(args=None):
         outfile = args.config.replace(".ini", "_cal.hdf5")
     caltable = CalibratorTable()
     caltable.from_scans(scan_list, freqsplat=args.splat, nofilt=args.nofilt,
-                        plot=args.show)
+                        plot=args.show, jobs=args.jobs)
     caltable.update()
 
     if args.check:
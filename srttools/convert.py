@@ -4,7 +4,6 @@ import astropy.units as u
 from astropy.time import Time
 from astropy.table import Table
 import numpy as np
-import copy
 import warnings
 import os
 import glob
@@ -16,15 +15,17 @@ from .converters.mbfits import MBFITS_creator
 from .converters.classfits import CLASSFITS_creator
 
 
-def convert_to_complete_fitszilla(fname, outname):
+def convert_to_complete_fitszilla(fname, outname, coordinate_tolerance=None):
     if outname == fname:
         raise ValueError('Files cannot have the same name')
     with fits.open(fname, memmap=False) as lchdulist:
-        _convert_to_complete_fitszilla(lchdulist, outname)
+        _convert_to_complete_fitszilla(
+            lchdulist, outname, coordinate_tolerance=coordinate_tolerance)
         lchdulist.writeto(outname + '.fits', overwrite=True)
 
 
-def _convert_to_complete_fitszilla(lchdulist, outname):
+def _convert_to_complete_fitszilla(lchdulist, outname,
+                                   coordinate_tolerance=None):
 
     feed_input_data = lchdulist['FEED TABLE'].data
     xoffsets = feed_input_data['xOffset'] * u.rad
@@ -52,33 +53,51 @@ def _convert_to_complete_fitszilla(lchdulist, outname):
     derot_angle.unit = u.rad
     times = new_table['time']
 
-    for i, (xoffset, yoffset) in enumerate(zip(xoffsets, yoffsets)):
-        obs_angle = observing_angle(rest_angles[i], derot_angle)
-
-        # offsets < 0.001 arcseconds: don't correct (usually feed 0)
-        if np.abs(xoffset) < np.radians(0.001 / 60.) * u.rad and \
-                np.abs(yoffset) < np.radians(0.001 / 60.) * u.rad:
-            continue
-        el = copy.deepcopy(el_save)
-        az = copy.deepcopy(az_save)
-        xoffs, yoffs = correct_offsets(obs_angle, xoffset, yoffset)
-        obstimes = Time(times * u.day, format='mjd', scale='utc')
-
-        # el and az are also changed inside this function (inplace is True)
-        ra, dec = \
-            get_coords_from_altaz_offset(obstimes, el, az, xoffs, yoffs,
-                                         location=location, inplace=True)
-        ra = fits.Column(array=ra, name='raj2000', format='1D')
-        dec = fits.Column(array=dec, name='decj2000', format='1D')
-        el = fits.Column(array=el, name='el', format='1D')
-        az = fits.Column(array=az, name='az', format='1D')
+    # offsets < 0.001 arcseconds: don't correct (usually feed 0)
+    min_offset = np.radians(0.001 / 60.) * u.rad
+    feeds = [i for i, (xoffset, yoffset) in enumerate(zip(xoffsets, yoffsets))
+             if not (np.abs(xoffset) < min_offset and
+                     np.abs(yoffset) < min_offset)]
+    if len(feeds) == 0:
+        return
+
+    # Convert all feeds at once, with one column per feed
+    feeds = np.array(feeds)
+    obs_angle = observing_angle(rest_angles[feeds][np.newaxis, :],
+                                np.asarray(derot_angle)[:, np.newaxis] * u.rad)
+    xoffs, yoffs = correct_offsets(obs_angle,
+                                   xoffsets[feeds][np.newaxis, :],
+                                   yoffsets[feeds][np.newaxis, :])
+    obstimes = Time(times * u.day, format='mjd', scale='utc')
+
+    el = np.tile(np.asarray(el_save, dtype=float)[:, np.newaxis],
+                 (1, feeds.size))
+    az = np.tile(np.asarray(az_save, dtype=float)[:, np.newaxis],
+                 (1, feeds.size))
+    # el and az are also changed inside this function (inplace is True)
+    ra, dec, max_deviation = \
+        get_coords_from_altaz_offset(obstimes, el, az, xoffs, yoffs,
+                                     location=location, inplace=True,
+                                     tolerance=coordinate_tolerance,
+                                     return_deviation=True)
+
+    for icol, i in enumerate(feeds):
+        columns = [
+            fits.Column(array=ra[:, icol], name='raj2000', format='1D'),
+            fits.Column(array=dec[:, icol], name='decj2000', format='1D'),
+            fits.Column(array=el[:, icol], name='el', format='1D'),
+            fits.Column(array=az[:, icol], name='az', format='1D')]
         new_data_extension = \
-            fits.BinTableHDU.from_columns([ra, dec, el, az])
+            fits.BinTableHDU.from_columns(columns)
         new_data_extension.name = 'Coord{}'.format(i)
+        if coordinate_tolerance is not None:
+            new_data_extension.header['COORDERR'] = \
+                (max_deviation.to(u.arcsec).value,
+                 'Max. coordinate interpolation error (arcsec)')
         lchdulist.append(new_data_extension)
 
 
-def launch_convert_coords(name, label):
+def launch_convert_coords(name, label, coordinate_tolerance=None):
     allfiles = []
     if os.path.isdir(name):
         allfiles += glob.glob(os.path.join(name, '*.fits'))
@@ -89,7 +108,8 @@ def launch_convert_coords(name, label):
         if 'summary.fits' in fname:
             continue
         outroot = fname.replace('.fits', '_' + label)
-        convert_to_complete_fitszilla(fname, outroot)
+        convert_to_complete_fitszilla(
+            fname, outroot, coordinate_tolerance=coordinate_tolerance)
     return outroot
 
 
@@ -98,7 +118,8 @@ def launch_convert_coords(name, label):
 # precision = 10
 #
 # @profile(precision=precision, stream=fp)
-def launch_mbfits_creator(name, label, test=False, wrap=False, detrend=False):
+def launch_mbfits_creator(name, label, test=False, wrap=False, detrend=False,
+                          jobs=None):
     if not os.path.isdir(name):
         raise ValueError('Input for MBFITS conversion must be a directory.')
     name = name.rstrip('/')
@@ -108,10 +129,9 @@ def launch_mbfits_creator(name, label, test=False, wrap=False, detrend=False):
     if os.path.exists(summary):
         mbfits.fill_in_summary(summary)
 
-    for fname in sorted(glob.glob(os.path.join(name, '*.fits'))):
-        if 'summary.fits' in fname:
-            continue
-        mbfits.add_subscan(fname, detrend=detrend)
+    fnames = [f for f in sorted(glob.glob(os.path.join(name, '*.fits')))
+              if 'summary.fits' not in f]
+    mbfits.add_subscans(fnames, detrend=detrend, jobs=jobs)
 
     mbfits.update_scan_info()
     if os.path.exists(name + '_' + label):
@@ -126,7 +146,7 @@ def launch_mbfits_creator(name, label, test=False, wrap=False, detrend=False):
     return outname, mbfits
 
 
-def launch_classfits_creator(name, label, test=False):
+def launch_classfits_creator(name, label, test=False, jobs=None):
     if not os.path.isdir(name):
         raise ValueError('Input for CLASSFITS conversion must be a directory.')
     name = name.rstrip('/')
@@ -134,7 +154,8 @@ def launch_classfits_creator(name, label, test=False):
     if os.path.exists(outname):
         shutil.rmtree(outname)
     random_name = 'tmp_' + str(np.random.random())
-    classfits = CLASSFITS_creator(random_name, scandir=name, average=True)
+    classfits = CLASSFITS_creator(random_name, scandir=name, average=True,
+                                  jobs=jobs)
     shutil.move(random_name, outname)
     return outname, classfits
 
@@ -188,17 +209,31 @@ def main_convert(args=None):
                         help="Detrend data before converting to MBFITS",
                         action='store_true', default=False)
 
+    parser.add_argument("--coordinate-tolerance",
+                        help="Interpolate the conversion of the feed "
+                             "coordinates within this tolerance, in arcsec "
+                             "(fitsmod only). Default: exact conversion",
+                        type=float, default=None)
+
+    parser.add_argument("--jobs",
+                        help="Number of processes used to read the subscans "
+                             "(mbfits and classfits only)",
+                        type=int, default=None)
+
     args = parser.parse_args(args)
 
     outnames = []
     for fname in args.files:
         if args.format == 'fitsmod':
-            outname = launch_convert_coords(fname, args.format)
+            outname = launch_convert_coords(
+                fname, args.format,
+                coordinate_tolerance=args.coordinate_tolerance)
             outnames.append(outname)
         elif args.format == 'mbfits':
             outname, mbfits = \
                 launch_mbfits_creator(fname, args.format, test=args.test,
-                                      wrap=False, detrend=args.detrend)
+                                      wrap=False, detrend=args.detrend,
+                                      jobs=args.jobs)
 
             matchobj = match_srt_name(fname)
             if matchobj:
@@ -215,11 +250,13 @@ def main_convert(args=None):
         elif args.format == 'mbfitsw':
             outname, mbfits = \
                 launch_mbfits_creator(fname, args.format, test=args.test,
-                                      wrap=True, detrend=args.detrend)
+                                      wrap=True, detrend=args.detrend,
+                                      jobs=args.jobs)
             outnames.append(outname)
         elif args.format == 'classfits':
             outname, mbfits = \
-                launch_classfits_creator(fname, args.format, test=args.test)
+                launch_classfits_creator(fname, args.format, test=args.test,
+                                         jobs=args.jobs)
             outnames.append(outname)
         else:
             warnings.warn('Unknown output format')
@@ -6,7 +6,8 @@ import astropy.constants as c
 import os
 import numpy as np
 from srttools.io import mkdir_p, locations, read_data_fitszilla, \
-    get_chan_columns, classify_chan_columns, interpret_chan_name
+    get_chan_columns, classify_chan_columns, interpret_chan_name, \
+    get_channel_meta, read_many
 import glob
 from ..utils import get_mH2O
 from scipy.signal import medfilt
@@ -326,7 +327,7 @@ def normalize_on_off_cal(table, smooth=False, apply_cal=True, use_calon=False):
 class CLASSFITS_creator():
     """CLASS-compatible FITS creator obhject."""
     def __init__(self, dirname, scandir=None, average=True, use_calon=False,
-                 test=False):
+                 test=False, jobs=None):
         """Initialization.
 
         Initialization is easy. If scandir is given, the conversion is
@@ -350,6 +351,9 @@ class CLASSFITS_creator():
             with that obtained through OFF + CAL.
         test : bool
             Only use for unit tests
+        jobs : int
+            Number of processes used to read the subscans. See
+            :func:`srttools.io.read_many`
         """
         self.dirname = dirname
         self.test = test
@@ -357,6 +361,7 @@ class CLASSFITS_creator():
         self.summary = {}
         self.tables = {}
         self.average = average
+        self.jobs = jobs
         if scandir is not None:
             self.get_scan(scandir, average=average)
             self.calibrate_all(use_calon)
@@ -392,10 +397,14 @@ class CLASSFITS_creator():
         scandir = scandir.rstrip('/')
         fname = os.path.join(scandir, 'summary.fits')
         self.fill_in_summary(fname)
-        for fname in sorted(glob.glob(os.path.join(scandir, '*.fits'))):
-            if 'summary' in fname:
+        fnames = [f for f in sorted(glob.glob(os.path.join(scandir,
+                                                           '*.fits')))
+                  if 'summary' not in f]
+        subscans = read_many(fnames, jobs=self.jobs,
+                             reader=read_data_fitszilla)
+        for subscan in subscans:
+            if subscan is None:
                 continue
-            subscan = read_data_fitszilla(fname)
             location = locations[subscan.meta['site']]
             times = Time(subscan['time'] * u.day, format='mjd', scale='utc',
                          location=location)
@@ -420,7 +429,8 @@ class CLASSFITS_creator():
 
             allcolumns = get_chan_columns(subscan)
             channels = \
-                [subscan[ch].meta['channels'] for ch in allcolumns]
+                [get_channel_meta(subscan, ch)['channels']
+                 for ch in allcolumns]
             if not len(set(channels)) == 1:
                 raise ValueError("Only files with the same number of spectral "
                                  "bins in each channel are supported. Please "
@@ -470,17 +480,19 @@ class CLASSFITS_creator():
                     if baseband is None:
                         baseband = 1
                     array = subscan[ch]
+                    chan_meta = get_channel_meta(subscan, ch)
                     if average:
                         length = len(array)
                         array = Table(data=[[np.mean(array, axis=0)]],
-                                      meta=array.meta)
-                        array.meta['integration_time'] *= length
+                                      meta=chan_meta)
+                        chan_meta = array.meta
+                        chan_meta['integration_time'] *= length
 
                     length = len(array)
                     id1 = id0 + length
-                    nbin = array.meta['channels']
+                    nbin = chan_meta['channels']
 
-                    bandwidth = array.meta['bandwidth']
+                    bandwidth = chan_meta['bandwidth']
                     restfreq_label = 'RESTFREQ{}'.format(baseband + 1)
                     if restfreq_label not in self.summary:
                         restfreq_label = 'RESTFREQ1'
@@ -488,7 +500,7 @@ class CLASSFITS_creator():
                     data['MJD'][id0:id1] = mjd_col
                     data['RESTFREQ'][id0:id1] = restfreq.to(u.Hz).value
                     data['OBSTIME'][id0:id1] = \
-                        array.meta['integration_time'].value
+                        chan_meta['integration_time'].value
                     data['VELOCITY'][id0:id1] = \
                         subscan.meta['VLSR'].to("m/s").value
                     data['DATE-OBS'][id0:id1] = date_col
@@ -516,7 +528,7 @@ class CLASSFITS_creator():
                     data['CRVAL2'][id0:id1] = crval2
                     data['CRVAL3'][id0:id1] = crval3
                     data['LST'][id0:id1] = lsts
-                    data['MAXIS1'][id0:id1] = array.meta['channels']
+                    data['MAXIS1'][id0:id1] = chan_meta['channels']
                     id0 = id1
 
                 header = newhdu[1].header
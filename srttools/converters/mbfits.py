@@ -5,7 +5,7 @@ import astropy.units as u
 import os
 import numpy as np
 from srttools.io import mkdir_p, locations, read_data_fitszilla, \
-    get_chan_columns, classify_chan_columns
+    get_chan_columns, classify_chan_columns, get_channel_meta, read_many
 from srttools.utils import scantype, force_move_file, minmax, median_diff
 from srttools.fit import detrend_spectroscopic_data
 import warnings
@@ -382,10 +382,23 @@ class MBFITS_creator():
 
         force_move_file('tmp.fits', os.path.join(self.dirname, self.SCAN))
 
-    def add_subscan(self, scanfile, detrend=False):
+    def add_subscans(self, scanfiles, detrend=False, jobs=None):
+        """Add many subscans, reading them in ``jobs`` parallel processes.
+
+        Subscans that cannot be read are skipped, and the error is logged.
+        """
+        subscans = read_many(scanfiles, jobs=jobs,
+                             reader=read_data_fitszilla)
+        for i, subscan in enumerate(subscans):
+            if subscan is None:
+                continue
+            self.add_subscan(scanfiles[i], detrend=detrend, subscan=subscan)
+
+    def add_subscan(self, scanfile, detrend=False, subscan=None):
         print('Loading {}'.format(scanfile))
 
-        subscan = read_data_fitszilla(scanfile)
+        if subscan is None:
+            subscan = read_data_fitszilla(scanfile)
         subscan_info = get_subscan_info(subscan)
 
         self.scan_info.add_row(subscan_info[0])
@@ -552,7 +565,7 @@ class MBFITS_creator():
 
                     nfebe = len(list(self.FEBE.keys()))
                     new_febe = self.add_febe(febe, combinations, feed,
-                                             subscan[ch].meta,
+                                             get_channel_meta(subscan, ch),
                                              bands=bands)
 
                     grouping[0].header['FEBE{}'.format(nfebe)] = febe
@@ -573,7 +586,7 @@ class MBFITS_creator():
                     newtable.add_row(row)
                 new_hdu = fits.table_to_hdu(newtable)
                 grouping[1].data = new_hdu.data
-                grouping[0].header['INSTRUME'] = subscan[ch].meta['backend']
+                grouping[0].header['INSTRUME'] = subscan.meta['backend']
                 grouping[0].header['TELESCOP'] = self.site
 
                 grouping.writeto('tmp.fits', overwrite=True)
@@ -2,19 +2,18 @@
 from __future__ import (absolute_import, division,
                         print_function)
 from scipy.optimize import curve_fit
-from scipy.signal import medfilt
 import numpy as np
 import traceback
 import warnings
 import collections
 import copy
-from .utils import mad, HAS_MPL
+from .utils import mad, running_median, HAS_MPL
 
 
 __all__ = ["contiguous_regions", "ref_std", "ref_mad", "linear_fun",
            "linear_fit", "offset", "offset_fit", "baseline_rough",
            "purge_outliers", "baseline_als", "fit_baseline_plus_bell",
-           "total_variance", "align"]
+           "fit_baselines_plus_bells", "total_variance", "align"]
 
 
 def contiguous_regions(condition):
@@ -94,7 +93,7 @@ def ref_std(array, window):
     return np.std(np.diff(array)) / np.sqrt(2)
 
 
-def ref_mad(array, window):
+def ref_mad(array, window, axis=-1):
     """Ref. Median Absolute Deviation of an array, rolling median-subtracted.
 
     If a data series is noisy, it is difficult to determine the underlying
@@ -109,12 +108,18 @@ def ref_mad(array, window):
     window : int or float
         Number of bins of the window
 
+    Other Parameters
+    ----------------
+    axis : int
+        Axis along which the data series lie. The MAD of each series is
+        returned if the input array is multi-dimensional
+
     Returns
     -------
-    ref_std : float
+    ref_std : float or array
         The reference MAD
     """
-    return mad(np.diff(array)) / np.sqrt(2)
+    return mad(np.diff(array, axis=axis), axis=axis) / np.sqrt(2)
 
 
 def linear_fun(x, q, m):
@@ -275,7 +280,7 @@ def baseline_rough(x, y, start_pars=None, return_baseline=False, mask=None):
 
 
 def outlier_from_median_filt(y, window_size, down=True, up=True):
-    diffs = y - medfilt(y, window_size)
+    diffs = y - running_median(y, window_size)
     min_diff = mad(diffs)
 
     outliers = np.zeros(len(y), dtype=bool)
@@ -340,14 +345,64 @@ def purge_outliers(y, window_size=5, up=True, down=True, mask=None,
         fig = plt.figure()
         plt.plot(ysave)
         plt.plot(y, zorder=3)
-        plt.plot(medfilt(ysave, window_size), zorder=6, lw=1)
+        plt.plot(running_median(ysave, window_size), zorder=6, lw=1)
         plt.savefig("Bubu_" + str(np.random.randint(0, 10000000)) + '.png')
         plt.close(fig)
 
     return y
 
 
-def _als(y, lam, p, niter=30):
+def _als_penalty_bands(L, lam):
+    """Upper bands of the ALS smoothness penalty, ``lam * D^T D``.
+
+    ``D`` is the ``(L - 2) x L`` second-difference operator. The penalty is
+    pentadiagonal, and its upper bands are returned in the form used by
+    :func:`scipy.linalg.solveh_banded`: the main diagonal is in the last row
+    and the k-th superdiagonal in row ``2 - k``, right-aligned.
+
+    Examples
+    --------
+    >>> _als_penalty_bands(5, 1)
+    array([[ 0.,  0.,  1.,  1.,  1.],
+           [ 0., -2., -4., -4., -2.],
+           [ 1.,  5.,  6.,  5.,  1.]])
+    """
+    from scipy import sparse
+    bands = np.zeros((3, L))
+    if L < 3:
+        return bands
+    D = sparse.diags([1., -2., 1.], [0, 1, 2], shape=(L - 2, L))
+    penalty = lam * D.transpose().dot(D)
+    for k in range(3):
+        bands[2 - k, k:] = penalty.diagonal(k)
+    return bands
+
+
+def _solve_als_system(penalty, w, y):
+    """Solve ``(W + penalty) z = W y`` for many series at once.
+
+    ``penalty`` contains the upper bands of the ALS penalty for a single
+    series (see :func:`_als_penalty_bands`), and ``w`` and ``y`` are 2-D
+    arrays of shape (series, samples). The systems of all series are solved
+    together, as a single block-diagonal banded system: the band form of
+    each block starts with zeros in the superdiagonals, so that the blocks
+    are not coupled.
+    """
+    from scipy.linalg import solveh_banded, solve_banded, LinAlgError
+    nseries, L = y.shape
+    bands = np.tile(penalty, nseries)
+    bands[2] += w.ravel()
+    rhs = (w * y).ravel()
+    try:
+        z = solveh_banded(bands, rhs, check_finite=False)
+    except LinAlgError:
+        # Not positive definite (e.g. too few points with nonzero
+        # weight): solve the same system with a banded LU decomposition
+        z = solve_banded((2, 2), _full_bands(bands), rhs, check_finite=False)
+    return z.reshape(nseries, L)
+
+
+def _als(y, lam, p, niter=30, tol=0, z0=None, return_niter=False):
     """Baseline Correction with Asymmetric Least Squares Smoothing.
 
     Modifications to the routine from Eilers & Boelens 2005
@@ -358,10 +413,17 @@ def _als(y, lam, p, niter=30):
     http://stackoverflow.com/questions/29156532/
         python-baseline-correction-library
 
+    The system solved at each iteration is pentadiagonal, and is solved in
+    banded form, in a time and memory linear with the length of ``y``. The
+    iterations stop early when the weights of the data points stop
+    changing.
+
     Parameters
     ----------
     y : array-like
-        the data series corresponding to x
+        the data series corresponding to x. If 2-D, a set of data series of
+        the same length (series x samples), whose baselines are fitted
+        together
     lam : float
         the lambda parameter of the ALS method. This control how much the
         baseline can adapt to local changes. A higher value corresponds to a
@@ -374,28 +436,161 @@ def _als(y, lam, p, niter=30):
     Other parameters
     ----------------
     niter : int
-        The number of iterations to perform
+        The maximum number of iterations to perform
+    tol : float
+        Stop when the fraction of points whose weight changed in the last
+        iteration is not larger than this. With the default (0), stop when
+        no weight changes, giving the same result as running all iterations
+    z0 : array-like, same size as y
+        Initial guess of the baseline (e.g. from a previous fit of similar
+        data). The initial weights are calculated from it, instead of being
+        all equal. Points where the guess is NaN start with unit weight
+    return_niter : bool
+        Also return the number of iterations performed
 
     Returns
     -------
     z : array-like, same size as y
         Fitted baseline.
+    niter : int or array of ints
+        The number of iterations performed (for each series, if ``y`` is
+        2-D). Only returned if ``return_niter`` is True
+
+    Examples
+    --------
+    >>> np.random.seed(1)
+    >>> x = np.arange(200.)
+    >>> y = 0.01 * x + 3 + np.random.normal(0, 0.01, 200)
+    >>> y[100:105] += 10
+    >>> z = _als(y, 1e5, 0.01)
+    >>> np.allclose(z, 0.01 * x + 3, atol=0.05)
+    True
+    >>> z, niter = _als(y, 1e5, 0.01, niter=100, return_niter=True)
+    >>> niter < 100
+    True
+
+    Starting from the previous result, few iterations are needed
+
+    >>> y[50:52] += 10
+    >>> z_warm, niter_warm = _als(y, 1e5, 0.01, z0=z, return_niter=True)
+    >>> niter_warm < niter
+    True
+
+    Many series can be fitted at once, with the same results
+
+    >>> zs, niters = _als([y, -y], 1e5, 0.01, return_niter=True)
+    >>> np.allclose(zs[0], _als(y, 1e5, 0.01))
+    True
+    >>> np.allclose(zs[1], _als(-y, 1e5, 0.01))
+    True
     """
-    from scipy import sparse
-    L = len(y)
-    D = sparse.csc_matrix(np.diff(np.eye(L), 2))
-    w = np.ones(L)
-    for _ in range(niter):
-        W = sparse.spdiags(w, 0, L, L)
-        Z = W + lam * D.dot(D.transpose())
-        z = sparse.linalg.spsolve(Z, w*y)
-        w = p * (y > z) + (1-p) * (y < z)
+    y = np.asarray(y, dtype=float)
+    single = y.ndim == 1
+    y = np.atleast_2d(y)
+    nseries, L = y.shape
+    # The penalty is the same for all series and iterations. The system
+    # matrix only differs from it in the main diagonal
+    penalty = _als_penalty_bands(L, lam)
+    if z0 is None:
+        w = np.ones_like(y)
+    else:
+        z0 = np.atleast_2d(z0)
+        w = p * (y > z0) + (1-p) * (y < z0)
+        w[np.isnan(z0)] = 1
+    z = np.zeros_like(y)
+    niters = np.zeros(nseries, dtype=int)
+    # Only the series that did not converge yet are fitted again
+    active = np.arange(nseries)
+    for i in range(niter):
+        y_active, w_active = y[active], w[active]
+        z_active = _solve_als_system(penalty, w_active, y_active)
+        new_w = p * (y_active > z_active) + (1-p) * (y_active < z_active)
+        changed = np.sum(new_w != w_active, axis=1)
+        z[active] = z_active
+        w[active] = new_w
+        niters[active] = i + 1
+        # With the same weights, the next iteration would give the same z
+        active = active[changed > tol * L]
+        if active.size == 0:
+            break
+
+    if single:
+        z, niters = z[0], int(niters[0])
+    if return_niter:
+        return z, niters
     return z
 
 
+def _full_bands(upper_bands):
+    """Convert the upper bands of a symmetric matrix to the full band form.
+
+    Examples
+    --------
+    >>> _full_bands(np.array([[0, 0, 1], [0, 2, 3], [4, 5, 6]]))
+    array([[0, 0, 1],
+           [0, 2, 3],
+           [4, 5, 6],
+           [2, 3, 0],
+           [1, 0, 0]])
+    """
+    nbands, L = upper_bands.shape
+    full = np.zeros((2 * nbands - 1, L), dtype=upper_bands.dtype)
+    full[:nbands] = upper_bands
+    for k in range(1, nbands):
+        full[nbands - 1 + k, :L - k] = upper_bands[nbands - 1 - k, k:]
+    return full
+
+
+def _als_detrend(y, mask=None, outlier_purging=(True, True)):
+    """Subtract a rough linear trend, and purge outliers, before ALS.
+
+    Returns
+    -------
+    y : array-like
+        The input series, with the linear trend subtracted
+    approx_baseline : array-like
+        The linear trend
+    y_mod : array-like
+        ``y``, with the outliers and masked points replaced by interpolation
+    """
+    N = len(y)
+    if N > 40:
+        med_start = np.median(y[:20])
+        med_stop = np.median(y[-20:])
+        approx_m = (med_stop - med_start) / (N - 20)
+    else:
+        approx_m = (y[-1] - y[0]) / (N - 1)
+
+    approx_q = y[0]
+
+    approx_baseline = approx_m * np.arange(N) + approx_q
+    y = y - approx_baseline
+
+    y_mod = purge_outliers(y, up=outlier_purging[0],
+                           down=outlier_purging[1],
+                           mask=mask)
+    return y, approx_baseline, y_mod
+
+
+def _als_offset(ysub):
+    """Offset of the baseline-subtracted series from its typical level."""
+    std = ref_std(ysub, np.max([len(ysub) // 20, 20]))
+
+    good = np.abs(ysub) < 10 * std
+
+    if len(ysub[good]) < 20:
+        good = np.ones(len(ysub), dtype=bool)
+
+    offset = np.median(ysub[good])
+    if np.isnan(offset):
+        offset = 0
+    return offset
+
+
 def baseline_als(x, y, lam=None, p=None, niter=40, return_baseline=False,
                  offset_correction=True, mask=None,
-                 outlier_purging=True):
+                 outlier_purging=True, tol=0, baseline_guess=None,
+                 return_niter=False):
     """Baseline Correction with Asymmetric Least Squares Smoothing.
 
     Parameters
@@ -403,7 +598,10 @@ def baseline_als(x, y, lam=None, p=None, niter=40, return_baseline=False,
     x : array-like
         the sample time/number/position
     y : array-like
-        the data series corresponding to x
+        the data series corresponding to x. It can also be a 2-D array
+        containing many data series (series x samples), e.g. the channels
+        of a scan: their baselines are fitted together, solving the
+        systems of all series at each iteration in a single call
     lam : float
         the lambda parameter of the ALS method. This control how much the
         baseline can adapt to local changes. A higher value corresponds to a
@@ -424,7 +622,18 @@ def baseline_als(x, y, lam=None, p=None, niter=40, return_baseline=False,
     outlier_purging : bool
         Purge outliers before the fit?
     mask : array of bools
-        Mask indicating the good x and y data. True for good, False for bad
+        Mask indicating the good x and y data. True for good, False for bad.
+        If ``y`` is 2-D, it can be 1-D (the same for all series) or 2-D
+    tol : float
+        Tolerance for the convergence of the iterations (see :func:`_als`).
+        The default stops when the weights of the points stop changing
+    baseline_guess : array-like, same size as y
+        Initial guess of the baseline, e.g. the baseline returned by a
+        previous call on slightly different data. Iterations converge faster
+        if the guess is good. If ``y`` is 2-D, rows filled with NaNs have no
+        initial guess
+    return_niter : bool
+        return the number of iterations performed?
 
     Returns
     -------
@@ -432,6 +641,20 @@ def baseline_als(x, y, lam=None, p=None, niter=40, return_baseline=False,
         The initial time series, subtracted from the trend
     baseline : array-like, same size as y
         Fitted baseline. Only returned if return_baseline is True
+    niter : int or array of ints
+        Number of iterations performed (for each series, if ``y`` is 2-D).
+        Only returned if return_niter is True
+
+    Examples
+    --------
+    >>> x = np.arange(1000)
+    >>> trends = np.array([[0.001], [0.002]]) * x
+    >>> y = trends + np.random.normal(0, 0.01, (2, 1000))
+    >>> y_sub, baseline = baseline_als(x, y, return_baseline=True)
+    >>> y_sub.shape
+    (2, 1000)
+    >>> np.allclose(baseline, trends, atol=0.05)
+    True
     """
 
     if not isinstance(outlier_purging, collections.Iterable):
@@ -441,43 +664,50 @@ def baseline_als(x, y, lam=None, p=None, niter=40, return_baseline=False,
     if p is None:
         p = 0.001
 
-    N = len(y)
-    if N > 40:
-        med_start = np.median(y[:20])
-        med_stop = np.median(y[-20:])
-        approx_m = (med_stop - med_start) / (N - 20)
+    single = np.ndim(y) == 1
+    if single:
+        ys, masks, guesses = [y], [mask], [baseline_guess]
     else:
-        approx_m = (y[-1] - y[0]) / (N - 1)
-
-    approx_q = y[0]
-
-    approx_baseline = approx_m * np.arange(N) + approx_q
-    y = y - approx_baseline
-
-    y_mod = purge_outliers(y, up=outlier_purging[0],
-                           down=outlier_purging[1],
-                           mask=mask)
-
-    z = _als(y_mod, lam, p, niter=niter)
-
-    offset = 0
-    ysub = y_mod - z
-    if offset_correction:
-        std = ref_std(ysub, np.max([len(y) // 20, 20]))
-
-        good = np.abs(ysub) < 10 * std
-
-        if len(ysub[good]) < 20:
-            good = np.ones(len(ysub), dtype=bool)
-
-        offset = np.median(ysub[good])
-        if np.isnan(offset):
-            offset = 0
-
-    if return_baseline:
-        return y - z - offset, z + offset + approx_baseline
+        ys = y
+        masks = mask
+        if mask is None or np.ndim(mask) == 1:
+            masks = [mask] * len(y)
+        guesses = baseline_guess
+        if baseline_guess is None:
+            guesses = [None] * len(y)
+
+    detrended, approx_baselines, y_mods = \
+        zip(*[_als_detrend(yi, mask=mi, outlier_purging=outlier_purging)
+              for yi, mi in zip(ys, masks)])
+
+    z0 = None
+    if baseline_guess is not None:
+        z0 = np.array([np.nan * approx if guess is None
+                       else guess - approx
+                       for guess, approx in zip(guesses, approx_baselines)])
+
+    zs, niters = _als(np.array(y_mods), lam, p, niter=niter, tol=tol, z0=z0,
+                      return_niter=True)
+
+    y_subs, baselines = [], []
+    for yi, approx, y_mod, z in zip(detrended, approx_baselines, y_mods, zs):
+        offset = 0
+        if offset_correction:
+            offset = _als_offset(y_mod - z)
+        y_subs.append(yi - z - offset)
+        baselines.append(z + offset + approx)
+
+    if single:
+        results = [y_subs[0], baselines[0], int(niters[0])]
     else:
-        return y - z - offset
+        results = [np.array(y_subs), np.array(baselines), niters]
+    if not return_niter:
+        results.pop(2)
+    if not return_baseline:
+        results.pop(1)
+    if len(results) == 1:
+        return results[0]
+    return tuple(results)
 
 
 def detrend_spectroscopic_data(x, spectrum, kind='als', outlier_purging=True):
@@ -514,6 +744,46 @@ def detrend_spectroscopic_data(x, spectrum, kind='als', outlier_purging=True):
     return spectrum - tiled_baseline, tiled_baseline
 
 
+def _baseline_plus_bell_guess(x, y):
+    """Initial parameters of the baseline plus bell fit.
+
+    Returns
+    -------
+    params : list
+        slope and intercept of the baseline, amplitude, center and width
+        (standard deviation or FWHM) of the bell
+    """
+    approx_m = (np.median(y[-20:]) - np.median(y[:20])) / \
+               (np.mean(x[-20:]) - np.mean(x[:20]))
+
+    xrange = np.max(x) - np.min(x)
+    yrange = np.max(y) - np.min(y)
+    return [approx_m, np.min(y), yrange, np.mean(x), xrange / 20]
+
+
+def _baseline_plus_bell_model(params, kind='gauss'):
+    """Astropy model of a linear baseline plus a bell function."""
+    from astropy.modeling import models
+    slope, intercept, amplitude, center, width = params
+    base = models.Linear1D(slope=slope, intercept=intercept,
+                           name='Baseline')
+    if kind == 'gauss':
+        bell = models.Gaussian1D(mean=center, stddev=width,
+                                 amplitude=amplitude, name='Bell')
+        bell.amplitude.bounds = (0, None)
+        bell.mean.bounds = (None, None)
+        bell.stddev.bounds = (0, None)
+        # max_name = 'mean'
+    elif kind == 'lorentz':
+        bell = models.Lorentz1D(x_0=center, fwhm=width,
+                                amplitude=amplitude, name='Bell')
+        bell.amplitude.bounds = (0, None)
+        bell.x_0.bounds = (None, None)
+        bell.fwhm.bounds = (0, None)
+        # max_name = 'x_0'
+    return base + bell
+
+
 def fit_baseline_plus_bell(x, y, ye=None, kind='gauss'):
     """Fit a function composed of a linear baseline plus a bell function.
 
@@ -537,42 +807,226 @@ def fit_baseline_plus_bell(x, y, ye=None, kind='gauss'):
         The fitted model
     fit_info : dict
         Fit info from the Astropy fitting routine.
+
+    See Also
+    --------
+    fit_baselines_plus_bells : the same fit, for many data series at once
     """
     if kind not in ['gauss', 'lorentz']:
         raise ValueError('kind has to be one of: gauss, lorentz')
-    from astropy.modeling import models, fitting
+    from astropy.modeling import fitting
 
-    approx_m = (np.median(y[-20:]) - np.median(y[:20])) / \
-               (np.mean(x[-20:]) - np.mean(x[:20]))
+    mod_init = _baseline_plus_bell_model(_baseline_plus_bell_guess(x, y),
+                                         kind=kind)
 
-    base = models.Linear1D(slope=approx_m, intercept=np.min(y),
-                           name='Baseline')
+    fit = fitting.LevMarLSQFitter()
 
-    xrange = np.max(x) - np.min(x)
-    yrange = np.max(y) - np.min(y)
+    mod_out = fit(mod_init, x, y)
 
-    if kind == 'gauss':
-        bell = models.Gaussian1D(mean=np.mean(x), stddev=xrange / 20,
-                                 amplitude=yrange, name='Bell')
-        bell.amplitude.bounds = (0, None)
-        bell.mean.bounds = (None, None)
-        bell.stddev.bounds = (0, None)
-        # max_name = 'mean'
-    elif kind == 'lorentz':
-        bell = models.Lorentz1D(x_0=np.mean(x), fwhm=xrange / 20,
-                                amplitude=yrange, name='Bell')
-        bell.amplitude.bounds = (0, None)
-        bell.x_0.bounds = (None, None)
-        bell.fwhm.bounds = (0, None)
-        # max_name = 'x_0'
+    return mod_out, fit.fit_info
 
-    mod_init = base + bell
 
-    fit = fitting.LevMarLSQFitter()
+def _baseline_plus_bell_jacobian(params, x, kind='gauss'):
+    """Values and Jacobian of a linear baseline plus a bell function.
 
-    mod_out = fit(mod_init, x, y)
+    Parameters
+    ----------
+    params : array of shape (series, 5)
+        slope, intercept, amplitude, center and width of each series
+    x : array of shape (series, samples)
 
-    return mod_out, fit.fit_info
+    Returns
+    -------
+    model : array of shape (series, samples)
+    jacobian : array of shape (series, samples, 5)
+    """
+    slope, intercept, amplitude, center, width = \
+        [par[:, np.newaxis] for par in params.T]
+    dx = x - center
+    jacobian = np.empty(x.shape + (5,))
+    jacobian[..., 0] = x
+    jacobian[..., 1] = 1
+    # A bell of zero width (the lower bound) gives 0/0 values, where it has
+    # no effect on the model
+    with np.errstate(divide='ignore', invalid='ignore'):
+        if kind == 'gauss':
+            bell = np.exp(-dx ** 2 / (2 * width ** 2))
+            jacobian[..., 2] = bell
+            jacobian[..., 3] = amplitude * bell * dx / width ** 2
+            jacobian[..., 4] = amplitude * bell * dx ** 2 / width ** 3
+        else:
+            hwhm2 = (width / 2) ** 2
+            denominator = dx ** 2 + hwhm2
+            bell = hwhm2 / denominator
+            jacobian[..., 2] = bell
+            jacobian[..., 3] = 2 * amplitude * bell * dx / denominator
+            jacobian[..., 4] = \
+                2 * amplitude * bell * dx ** 2 / denominator / width
+    bell[np.isnan(bell)] = 0
+    jacobian[np.isnan(jacobian)] = 0
+    model = slope * x + intercept + amplitude * bell
+    return model, jacobian
+
+
+def fit_baselines_plus_bells(xs, ys, kind='gauss', maxiter=100, ftol=1.49e-8,
+                             xtol=1e-7):
+    """Fit a linear baseline plus a bell function to many data series.
+
+    This gives the same results as calling :func:`fit_baseline_plus_bell`
+    on each series, but all series are fitted together, with a vectorized
+    Levenberg-Marquardt algorithm and an analytic Jacobian. The amplitude
+    and the width of the bell are constrained to be non-negative.
+
+    On noisy series where the bell is far from the center or absent, the
+    two fits can end in different minima: the fitter of
+    :func:`fit_baseline_plus_bell` often stops at zero amplitude, while
+    this one can find the bell, with a lower sum of squares (or the other
+    way round). When a parameter is at its bound and the covariance matrix
+    is singular (e.g. the center and width of a bell with zero amplitude
+    are undetermined), the covariance is calculated with the
+    pseudo-inverse, and the undetermined parameters have zero variance.
+
+    Parameters
+    ----------
+    xs : list of array-like
+        the sample time/number/position of each series
+    ys : list of array-like
+        the data series corresponding to xs. Series can have different
+        lengths
+
+    Other parameters
+    ----------------
+    kind: str
+        Can be 'gauss' or 'lorentz'
+    maxiter : int
+        Maximum number of iterations
+    ftol : float
+        Stop when the relative reduction of the sum of squares is lower
+    xtol : float
+        Stop when the relative change of the parameters is lower
+
+    Returns
+    -------
+    results : list of tuples
+        For each series, the fitted ``Astropy.modeling.model`` and a fit
+        info dictionary, with the parameter covariance matrix in
+        ``param_cov`` (None if there are fewer than 6 samples or the
+        covariance cannot be calculated), ``message`` and
+        the number of iterations in ``niter``, as returned by
+        :func:`fit_baseline_plus_bell`
+
+    Examples
+    --------
+    >>> x = np.arange(100.)
+    >>> ys = [x * 0.1 + 3 + 10 * np.exp(-(x - c) ** 2 / 50) for c in [40, 60]]
+    >>> results = fit_baselines_plus_bells([x, x], ys)
+    >>> np.allclose([model.mean_1.value for model, _ in results], [40, 60])
+    True
+    >>> results[0][1]['param_cov'].shape
+    (5, 5)
+    """
+    if kind not in ['gauss', 'lorentz']:
+        raise ValueError('kind has to be one of: gauss, lorentz')
+    xs = [np.asarray(x, dtype=float) for x in xs]
+    ys = [np.asarray(y, dtype=float) for y in ys]
+    nseries = len(ys)
+    if nseries == 0:
+        return []
+
+    # Series of different length are padded, with zero weight
+    lengths = np.array([len(y) for y in ys])
+    x = np.zeros((nseries, lengths.max()))
+    y = np.zeros_like(x)
+    weight = np.zeros_like(x)
+    for i, (xi, yi) in enumerate(zip(xs, ys)):
+        x[i, :len(yi)] = xi
+        y[i, :len(yi)] = yi
+        weight[i, :len(yi)] = 1
+
+    params = np.array([_baseline_plus_bell_guess(xi, yi)
+                       for xi, yi in zip(xs, ys)])
+    lower_bounds = np.array([-np.inf, -np.inf, 0, -np.inf, 0])
+
+    def residuals(pars, idx):
+        model, jacobian = _baseline_plus_bell_jacobian(pars, x[idx], kind)
+        return (y[idx] - model) * weight[idx], \
+            jacobian * weight[idx, :, np.newaxis]
+
+    res, _ = residuals(params, slice(None))
+    cost = np.sum(res ** 2, axis=1)
+    damping = np.ones(nseries) * 1e-3
+    niter = np.zeros(nseries, dtype=int)
+    converged = np.zeros(nseries, dtype=bool)
+    active = np.arange(nseries)
+    for _ in range(maxiter):
+        res, jacobian = residuals(params[active], active)
+        alpha = np.einsum('snk,snl->skl', jacobian, jacobian)
+        beta = np.einsum('snk,sn->sk', jacobian, res)
+        # Marquardt's scaling of the damping with the curvature, avoiding
+        # singular matrices when a parameter has no effect
+        diag = np.diagonal(alpha, axis1=1, axis2=2)
+        diag = np.maximum(diag, 1e-12 * np.max(diag, axis=1)[:, np.newaxis])
+        alpha_damped = alpha.copy()
+        idx = np.arange(5)
+        alpha_damped[:, idx, idx] += damping[active, np.newaxis] * diag
+        try:
+            step = np.linalg.solve(alpha_damped,
+                                   beta[..., np.newaxis])[..., 0]
+        except np.linalg.LinAlgError:
+            step = np.array([np.linalg.pinv(a).dot(b)
+                             for a, b in zip(alpha_damped, beta)])
+
+        new_params = np.maximum(params[active] + step, lower_bounds)
+        new_res, _ = residuals(new_params, active)
+        new_cost = np.sum(new_res ** 2, axis=1)
+        niter[active] += 1
+
+        better = new_cost <= cost[active]
+        improved = active[better]
+        actual_step = new_params[better] - params[improved]
+        reduction = cost[improved] - new_cost[better]
+        params[improved] = new_params[better]
+        damping[improved] /= 10
+        small_reduction = reduction <= ftol * cost[improved]
+        small_step = np.all(np.abs(actual_step) <=
+                            xtol * (np.abs(params[improved]) + xtol), axis=1)
+        cost[improved] = new_cost[better]
+        converged[improved[small_reduction | small_step]] = True
+
+        worse = active[~better]
+        damping[worse] *= 10
+        # No step reduces the residuals any more
+        converged[worse[damping[worse] > 1e10]] = True
+
+        active = active[~converged[active]]
+        if active.size == 0:
+            break
+
+    _, jacobian = residuals(params, slice(None))
+    alpha = np.einsum('snk,snl->skl', jacobian, jacobian)
+    results = []
+    for i in range(nseries):
+        fit_info = {'niter': niter[i], 'param_cov': None}
+        if converged[i]:
+            fit_info['message'] = 'The fit converged'
+        else:
+            fit_info['message'] = \
+                'Maximum number of iterations ({}) reached'.format(maxiter)
+        dof = lengths[i] - 5
+        if dof > 0:
+            try:
+                try:
+                    inverse = np.linalg.inv(alpha[i])
+                except np.linalg.LinAlgError:
+                    # At the bounds (e.g. no bell, with zero amplitude),
+                    # some parameters have no effect on the model
+                    inverse = np.linalg.pinv(alpha[i])
+                fit_info['param_cov'] = inverse * cost[i] / dof
+            except np.linalg.LinAlgError:
+                fit_info['message'] += '; the covariance cannot be estimated'
+        results.append((_baseline_plus_bell_model(params[i], kind=kind),
+                        fit_info))
+    return results
 
 
 def total_variance(xs, ys, params):
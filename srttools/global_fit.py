@@ -13,6 +13,7 @@ from .fit import contiguous_regions
 from .utils import jit, vectorize
 
 from .histograms import histogram2d
+from .io import counts_dtype
 import numpy as np
 
 __all__ = ["fit_full_image", "display_intermediate"]
@@ -254,7 +255,8 @@ def fit_full_image(scanset, chan="Feed0_RCP", feed=0, excluded=None, par=None):
 
     X = np.array(scanset['x'][:, feed], dtype=np.float64)
     Y = np.array(scanset['y'][:, feed], dtype=np.float64)
-    counts = np.array(scanset[chan], dtype=np.float64)
+    dtype = counts_dtype(scanset.meta.get('precision', None))
+    counts = np.array(scanset[chan], dtype=dtype)
 
     count_range = np.max(counts) - np.min(counts)
 
@@ -280,6 +282,7 @@ def fit_full_image(scanset, chan="Feed0_RCP", feed=0, excluded=None, par=None):
         times[good] = filt_t
         par[i_p * 2 + 1] = counts[good][0]
 
+    # The resampled data are small: fit them in double precision
     data_to_fit = [np.array(times, dtype=np.float64), idxs, X, Y,
                    np.array(counts, dtype=np.float64)]
 
@@ -298,7 +301,7 @@ def fit_full_image(scanset, chan="Feed0_RCP", feed=0, excluded=None, par=None):
     new_counts = _align_all(times, counts, data_idx, res.x)
 
     ITERATION_COUNT = counter(0)
-    return new_counts * count_range
+    return np.asarray(new_counts * count_range, dtype=dtype)
 
 
 def display_intermediate(scanset, chan="Feed0_RCP", feed=0, excluded=None,
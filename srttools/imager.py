@@ -17,18 +17,19 @@ import astropy.units as u
 import sys
 import warnings
 import logging
-import traceback
 import six
 import copy
 import functools
 import collections
 from scipy.stats import binned_statistic_2d
-from .scan import Scan, list_scans
+from .scan import Scan, list_scans, prefetch_scan
 from .read_config import read_config, sample_config_file
 from .utils import calculate_zernike_moments, calculate_beam_fom, HAS_MAHO
 from .utils import compare_anything, ds9_like_log_scale, jit
 
-from .io import chan_re, get_channel_feed
+from .io import chan_re, get_channel_feed, read_many
+from .plotter import wait_for_plots
+from .io import hdf5_write_options, cast_columns, write_hdf5_table
 from .fit import linear_fun
 from .interactive_filter import select_data
 from .calibration import CalibratorTable
@@ -97,7 +98,8 @@ def outlier_score(x):
 
 class ScanSet(Table):
     def __init__(self, data=None, norefilt=True, config_file=None,
-                 freqsplat=None, nofilt=False, nosub=False, **kwargs):
+                 freqsplat=None, nofilt=False, nosub=False, jobs=None,
+                 prefetch=None, **kwargs):
         """Class obtained by a set of scans.
 
         Once the scans are loaded, this class contains all functionality that
@@ -122,6 +124,13 @@ class ScanSet(Table):
             See :class:`srttools.scan.clean_scan_using_variability`
         nosub : bool
             See :class:`srttools.scan.Scan`
+        jobs : int
+            Number of processes used to load the scans. See
+            :func:`srttools.io.read_many`
+        prefetch : int
+            When the scans are loaded in this process, read this number of
+            files ahead in background threads, while the previous scans are
+            processed. See :func:`srttools.io.read_many`
 
         Other Parameters
         ----------------
@@ -147,7 +156,9 @@ class ScanSet(Table):
                 not isinstance(data, six.string_types):
             alldata = [ScanSet(d, norefilt=norefilt, config_file=config_file,
                                freqsplat=freqsplat, nofilt=nofilt,
-                               nosub=nosub, **kwargs) for d in data]
+                               nosub=nosub, jobs=jobs, prefetch=prefetch,
+                               **kwargs)
+                       for d in data]
 
             scan_list = []
             max_scan_id = 0
@@ -195,7 +206,8 @@ class ScanSet(Table):
 
             for i_s, s in self.load_scans(scan_list,
                                           freqsplat=freqsplat, nofilt=nofilt,
-                                          nosub=nosub, **kwargs):
+                                          nosub=nosub, jobs=jobs,
+                                          prefetch=prefetch, **kwargs):
 
                 if 'FLAG' in s.meta.keys() and s.meta['FLAG']:
                     print(s.meta['filename'], 'FLAG')
@@ -219,7 +231,7 @@ class ScanSet(Table):
             try:
                 with warnings.catch_warnings():
                     warnings.simplefilter('ignore', MergeConflictWarning)
-                    scan_table = Table(vstack(tables))
+                    scan_table = Table(vstack(tables), copy=False)
             except TableMergeError as e:
                 warnings.warn("ERROR while merging tables. {}"
                               "Debug: tables:".format(str(e)))
@@ -230,7 +242,7 @@ class ScanSet(Table):
                     warnings.warn(t[0])
                 raise
 
-            Table.__init__(self, scan_table)
+            Table.__init__(self, scan_table, copy=False)
             self.scan_list = scan_list
 
             self.meta['scan_list_file'] = None
@@ -308,24 +320,29 @@ class ScanSet(Table):
                                                                         str(e))
                 )
 
-    def load_scans(self, scan_list, freqsplat=None, nofilt=False, **kwargs):
-        """Load the scans in the list one by ones."""
+    def load_scans(self, scan_list, freqsplat=None, nofilt=False, jobs=None,
+                   prefetch=None, **kwargs):
+        """Load the scans in the list one by ones.
+
+        If ``jobs`` is larger than one, the scans are loaded in parallel by
+        as many processes (see :func:`srttools.io.read_many`), but they are
+        still yielded in the order of ``scan_list``. Otherwise, the next
+        ``prefetch`` files are read in background threads (see
+        :func:`srttools.scan.prefetch_scan`) while each scan is processed.
+        """
         nscan = len(scan_list)
-        for i, f in enumerate(scan_list):
+        # Scans are read with the feed/channel selection of the config file
+        if 'config_file' in self.meta and 'config_file' not in kwargs:
+            kwargs['config_file'] = self.meta['config_file']
+        scans = read_many(scan_list, jobs=jobs, reader=Scan,
+                          prefetch=prefetch, prefetcher=prefetch_scan,
+                          norefilt=self.norefilt, freqsplat=freqsplat,
+                          nofilt=nofilt, **kwargs)
+        for i, s in enumerate(scans):
             print("{}/{}".format(i + 1, nscan), end="\r")
-            try:
-                s = Scan(f, norefilt=self.norefilt, freqsplat=freqsplat,
-                         nofilt=nofilt, **kwargs)
+            if s is not None:
                 yield i, s
-            except KeyError as e:
-                logging.warning(
-                    "Error while processing {}: Missing key: {}".format(f,
-                                                                        str(e))
-                )
-            except Exception as e:
-                logging.warning(traceback.format_exc())
-                logging.warning("Error while processing {}: {}".format(f,
-                                                                       str(e)))
+        wait_for_plots()
 
     def get_coordinates(self, altaz=False):
         """Give the coordinates as pairs of RA, DEC."""
@@ -467,12 +484,33 @@ class ScanSet(Table):
 
         self['x'] = np.zeros_like(self[hor])
         self['y'] = np.zeros_like(self[ver])
-        coords = np.degrees(self.get_coordinates(altaz=altaz))
+
+        # Feeds with the same offsets (e.g. all feeds with no offset) have
+        # the same pointing, and are only converted once. The pointing of
+        # feeds without channels is always converted
+        offsets = {}
+        for ch in [c for c in self.columns if chan_re.match(c)]:
+            meta = self[ch].meta
+            if 'xoffset' in meta and 'yoffset' in meta:
+                offsets[get_channel_feed(ch)] = \
+                    (u.Quantity(meta['xoffset'], u.rad).value,
+                     u.Quantity(meta['yoffset'], u.rad).value)
+
+        converted = {}
         for f in range(len(self[hor][0, :])):
-            pixcrd = self.wcs.all_world2pix(coords[:, f], 0.5)
+            key = offsets.get(f, f)
+            if key in converted:
+                self['x'][:, f] = self['x'][:, converted[key]]
+                self['y'][:, f] = self['y'][:, converted[key]]
+                continue
+
+            coords = np.degrees(np.column_stack([self[hor][:, f],
+                                                 self[ver][:, f]]))
+            pixcrd = self.wcs.all_world2pix(coords, 0.5)
 
             self['x'][:, f] = pixcrd[:, 0] + 0.5
             self['y'][:, f] = pixcrd[:, 1] + 0.5
+            converted[key] = f
         self['x'].meta['altaz'] = altaz
         self['y'].meta['altaz'] = altaz
 
@@ -532,9 +570,10 @@ class ScanSet(Table):
             elif direction == 1:
                 good = good & np.logical_not(self['direction'])
 
-            expomap, _, _ = np.histogram2d(self['x'][:, feed][good],
-                                           self['y'][:, feed][good],
-                                           bins=[xbins, ybins])
+            x = self['x'][:, feed][good]
+            y = self['y'][:, feed][good]
+
+            expomap, _, _ = np.histogram2d(x, y, bins=[xbins, ybins])
 
             counts = np.array(self[ch][good])
 
@@ -552,19 +591,17 @@ class ScanSet(Table):
                 counts = counts * u.ct * area_conversion * Jy_over_counts
                 counts = counts.to(final_unit).value
 
-            img, _, _ = np.histogram2d(self['x'][:, feed][good],
-                                       self['y'][:, feed][good],
-                                       bins=[xbins, ybins],
+            img, _, _ = np.histogram2d(x, y, bins=[xbins, ybins],
                                        weights=counts)
 
-            img_sq, _, _ = np.histogram2d(self['x'][:, feed][good],
-                                          self['y'][:, feed][good],
-                                          bins=[xbins, ybins],
-                                          weights=counts ** 2)
+            # Squares of single-precision counts would lose too many digits
+            # in the variance
+            img_sq, _, _ = np.histogram2d(
+                x, y, bins=[xbins, ybins],
+                weights=np.asarray(counts, dtype=np.float64) ** 2)
 
             img_outliers, _, _, _ = \
-                binned_statistic_2d(self['x'][:, feed][good],
-                                    self['y'][:, feed][good],
+                binned_statistic_2d(x, y,
                                     counts, statistic=outlier_score,
                                     bins=[xbins, ybins])
 
@@ -1021,6 +1058,10 @@ class ScanSet(Table):
 
         Moreover, saves the scan list to a txt file, that will be read when
         data are reloaded. This is a *temporary solution*
+
+        As in :meth:`srttools.scan.Scan.write`, the HDF5 compression,
+        chunking and column data types come from the ``hdf5_*`` config
+        options, unless overridden by ``kwargs``.
         """
         import os
         f, _ = os.path.splitext(fname)
@@ -1032,9 +1073,15 @@ class ScanSet(Table):
 
         self.update_meta_with_images()
 
+        table = cast_columns(self, self.meta.get('hdf5_dtypes', None))
         try:
-            Table.write(self, fname, path='scanset', serialize_meta=True,
-                        **kwargs)
+            if fname.endswith('.hdf5'):
+                options = hdf5_write_options(self.meta)
+                options.update(kwargs)
+                write_hdf5_table(table, fname, 'scanset', **options)
+            else:
+                Table.write(table, fname, path='scanset',
+                            serialize_meta=True, **kwargs)
         except astropy.io.registry.IORegistryError as e:
             raise astropy.io.registry.IORegistryError(fname + ': ' + str(e))
 
@@ -1373,6 +1420,13 @@ def main_imager(args=None):
                               "bin of the spectrum up to 1000 MHz above'. ':' "
                               "or 'all' for all the channels."))
 
+    parser.add_argument("--jobs", type=int, default=None,
+                        help="Number of processes used to load the scans")
+
+    parser.add_argument("--prefetch", type=int, default=None,
+                        help="Number of scans read ahead in background "
+                             "threads, while the previous ones are processed")
+
     args = parser.parse_args(args)
 
     if args.sample_config:
@@ -1399,7 +1453,8 @@ def main_imager(args=None):
         scanset = ScanSet(args.config, norefilt=not args.refilt,
                           freqsplat=args.splat, nosub=not args.sub,
                           nofilt=args.nofilt, debug=args.debug,
-                          avoid_regions=excluded_radec)
+                          avoid_regions=excluded_radec, jobs=args.jobs,
+                          prefetch=args.prefetch)
         infile = args.config
 
         if outfile is None:
@@ -1447,6 +1502,11 @@ def main_preprocess(args=None):
     parser.add_argument("--nofilt", action='store_true', default=False,
                         help='Do not filter noisy channels')
 
+    parser.add_argument("--refilt", default=False,
+                        action='store_true',
+                        help='Re-run the scan filtering, even on scans '
+                             'whose data and parameters did not change')
+
     parser.add_argument("--debug", action='store_true', default=False,
                         help='Plot stuff and be verbose')
 
@@ -1477,7 +1537,7 @@ def main_preprocess(args=None):
         for f in args.files:
             try:
                 Scan(f, freqsplat=args.splat, nosub=not args.sub,
-                     norefilt=False, debug=args.debug,
+                     norefilt=not args.refilt, debug=args.debug,
                      interactive=args.interactive,
                      avoid_regions=excluded_radec,
                      config_file=args.config)
@@ -1486,6 +1546,7 @@ def main_preprocess(args=None):
     else:
         if args.config is None:
             raise ValueError("Please specify the config file!")
-        ScanSet(args.config, norefilt=False, freqsplat=args.splat,
+        ScanSet(args.config, norefilt=not args.refilt, freqsplat=args.splat,
                 nosub=not args.sub, nofilt=args.nofilt, debug=args.debug,
                 interactive=args.interactive, avoid_regions=excluded_radec)
+    wait_for_plots()
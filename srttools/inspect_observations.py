@@ -5,11 +5,13 @@ from __future__ import (absolute_import, division,
 import os
 import glob
 import logging
+import sqlite3
+import six
 import numpy as np
 from astropy.table import Table, Column
 from astropy.time import Time
-import warnings
-from .io import read_data, chan_re
+import astropy.units as u
+from .io import read_data_fitszilla, read_many
 from .calibration import read_calibrator_config
 from .read_config import sample_config_file
 from .utils import standard_string
@@ -20,11 +22,20 @@ except ImportError:
     from configparser import ConfigParser
 
 __all__ = ["inspect_directories", "split_observation_table", "split_by_source",
-           "dump_config_files"]
+           "dump_config_files", "update_observation_index",
+           "read_observation_index"]
 
 
-def inspect_directories(directories, only_after=None, only_before=None):
-    import datetime
+_INDEX_COLUMNS = [("path", "TEXT PRIMARY KEY"), ("dir", "TEXT"),
+                  ("mtime", "REAL"), ("size", "INTEGER"),
+                  ("valid", "INTEGER"), ("source", "TEXT"),
+                  ("receiver", "TEXT"), ("backend", "TEXT"),
+                  ("time_start", "REAL"), ("time_end", "REAL"),
+                  ("frequency", "REAL"), ("bandwidth", "REAL"),
+                  ("is_skydip", "INTEGER")]
+
+
+def _empty_info_table():
     info = Table()
     names = ["Dir", "Sample File", "Source", "Receiver", "Backend",
              "Time", "Frequency", "Bandwidth", "is_skydip"]
@@ -35,6 +46,181 @@ def inspect_directories(directories, only_after=None, only_before=None):
     for n, d in zip(names, dtype):
         if n not in info.keys():
             info.add_column(Column(name=n, dtype=d))
+    return info
+
+
+def _read_subscan_summary(fname):
+    """Read the information needed by the index from a subscan.
+
+    Only the headers and the boresight pointing are read, see
+    :func:`srttools.io.read_data_fitszilla` with ``meta_only=True``.
+
+    Returns
+    -------
+    summary : tuple
+        Source, receiver, backend, start and end time (MJD), frequency and
+        bandwidth (MHz) of the first channel, skydip flag
+    """
+    data = read_data_fitszilla(fname, meta_only=True)
+    elevation = data['el'][:, 0]
+    # If range of elevation change is more than 60 degrees,
+    # this is a skydip.
+    is_skydip = np.max(elevation) - np.min(elevation) > np.pi / 3.
+    chan_meta = list(data.meta['channel_meta'].values())[0]
+
+    return (data.meta['SOURCE'], data.meta['receiver'], data.meta['backend'],
+            float(data['time'][0]), float(data['time'][-1]),
+            chan_meta['frequency'].to(u.MHz).value,
+            chan_meta['bandwidth'].to(u.MHz).value, bool(is_skydip))
+
+
+def update_observation_index(directories, index_file=None, jobs=None):
+    """Create or update a SQLite index of the subscans in some directories.
+
+    Only the subscans that are new, or whose modification time or size
+    changed since the last update, are read. Subscans that were removed are
+    also removed from the index.
+
+    Parameters
+    ----------
+    directories : list of str
+        Directories containing the subscans
+
+    Other parameters
+    ----------------
+    index_file : str
+        The SQLite database file. If None, the index is kept in memory
+    jobs : int
+        Number of processes used to read the subscans. See
+        :func:`srttools.io.read_many`
+
+    Returns
+    -------
+    index : :class:`sqlite3.Connection`
+        The connection to the index
+    """
+    if index_file is None:
+        index_file = ':memory:'
+    index = sqlite3.connect(index_file)
+    index.execute(
+        "CREATE TABLE IF NOT EXISTS subscans ({})".format(
+            ", ".join(["{} {}".format(*c) for c in _INDEX_COLUMNS])))
+
+    to_read = []
+    for d in directories:
+        dirname = os.path.abspath(d)
+        known = dict(
+            (path, (mtime, size)) for path, mtime, size in index.execute(
+                "SELECT path, mtime, size FROM subscans WHERE dir = ?",
+                (dirname,)))
+        present = []
+        for f in glob.glob(os.path.join(d, '*.fits')):
+            if "summary.fits" in f:
+                continue
+            path = os.path.abspath(f)
+            present.append(path)
+            stat = os.stat(path)
+            if known.get(path) != (stat.st_mtime, stat.st_size):
+                to_read.append((path, dirname, stat.st_mtime, stat.st_size))
+
+        index.executemany("DELETE FROM subscans WHERE path = ?",
+                          [(p,) for p in set(known) - set(present)])
+
+    summaries = read_many([r[0] for r in to_read], jobs=jobs,
+                          reader=_read_subscan_summary)
+    for i, summary in enumerate(summaries):
+        valid = summary is not None
+        if not valid:
+            summary = (None, ) * (len(_INDEX_COLUMNS) - 5)
+        index.execute(
+            "INSERT OR REPLACE INTO subscans VALUES ({})".format(
+                ", ".join(["?"] * len(_INDEX_COLUMNS))),
+            tuple(to_read[i]) + (valid, ) + tuple(summary))
+
+    index.commit()
+    return index
+
+
+def read_observation_index(index, directories=None, only_after=None,
+                           only_before=None):
+    """Get the observation table from an index of the subscans.
+
+    For each directory, the first valid subscan (in alphabetical order)
+    within the requested time interval is used.
+
+    Parameters
+    ----------
+    index : str or :class:`sqlite3.Connection`
+        The index file, or a connection to it
+        (see :func:`update_observation_index`)
+
+    Other parameters
+    ----------------
+    directories : list of str
+        Only list these directories. By default, all directories in the index
+    only_after : float
+        Only use subscans starting after this MJD
+    only_before : float
+        Only use subscans ending before this MJD
+
+    Returns
+    -------
+    info : :class:`astropy.table.Table`
+        The same table returned by :func:`inspect_directories`
+    """
+    if isinstance(index, six.string_types):
+        index = sqlite3.connect(index)
+
+    info = _empty_info_table()
+
+    if directories is None:
+        directories = [d for d, in index.execute(
+            "SELECT DISTINCT dir FROM subscans ORDER BY dir")]
+
+    for d in directories:
+        row = index.execute(
+            "SELECT path, source, receiver, backend, time_start, frequency, "
+            "bandwidth, is_skydip FROM subscans "
+            "WHERE dir = ? AND valid = 1 "
+            "AND (? IS NULL OR time_start >= ?) "
+            "AND (? IS NULL OR time_end <= ?) "
+            "ORDER BY path LIMIT 1",
+            (os.path.abspath(d), only_after, only_after,
+             only_before, only_before)).fetchone()
+        if row is None:
+            continue
+        path, source, receiver, backend, time_start, frequency, \
+            bandwidth, is_skydip = row
+        info.add_row([d, os.path.join(d, os.path.basename(path)), source,
+                      receiver, backend, time_start, frequency, bandwidth,
+                      bool(is_skydip)])
+
+    return info
+
+
+def inspect_directories(directories, only_after=None, only_before=None,
+                        jobs=None, index_file=None):
+    """Read the information of a sample subscan for each directory.
+
+    Parameters
+    ----------
+    directories : list of str
+        Directories containing the subscans
+
+    Other parameters
+    ----------------
+    only_after : str
+        Only use subscans taken after this date and time
+        (e.g. ``20150510-111020``)
+    only_before : str
+        Only use subscans taken before this date and time
+    jobs : int
+        Number of processes used to read the subscans
+    index_file : str
+        SQLite file where the information read from the headers is stored,
+        and reused in later calls. See :func:`update_observation_index`
+    """
+    import datetime
 
     if only_after is not None:
         only_after = \
@@ -49,49 +235,20 @@ def inspect_directories(directories, only_after=None, only_before=None):
         logging.warning('Filter out observations after '
                         'MJD {}'.format(only_before))
 
-    for d in directories:
-        fits_files = glob.glob(os.path.join(d, '*.fits'))
-
-        for f in fits_files:
-            if "summary.fits" in f:
-                continue
-            print("Reading {}".format(f), end="\r")
-            try:
-                data = read_data(f)
-                time_start = data[0]['time']
-                time_end = data[-1]['time']
-
-                elevation = data['el']
-                # If range of elevation change is more than 60 degrees,
-                # this is a skydip.
-                is_skydip = np.max(elevation) - np.min(elevation) > np.pi / 3.
-
-                if only_after is not None and time_start < only_after:
-                    continue
-                if only_before is not None and time_end > only_before:
-                    continue
-
-                backend = data.meta['backend']
-                receiver = data.meta['receiver']
-                chan = [ch for ch in data.colnames if chan_re.search(ch)][0]
-                frequency = data[chan].meta['frequency']
-                bandwidth = data[chan].meta['bandwidth']
-                source = data.meta['SOURCE']
-
-                info.add_row([d, f, source, receiver, backend,
-                              time_start, frequency, bandwidth,
-                              is_skydip])
-                break
-            except Exception as e:
-                warnings.warn("Errors while opening {}".format(f))
-                warnings.warn(str(e))
-                continue
+    index = update_observation_index(directories, index_file=index_file,
+                                     jobs=jobs)
+    info = read_observation_index(index, directories, only_after=only_after,
+                                  only_before=only_before)
+    index.close()
 
     return(info)
 
 
 def split_observation_table(info, max_calibrator_delay=0.4,
                             max_source_delay=0.2, group_by_entries=None):
+    if isinstance(info, six.string_types):
+        # This is an index file
+        info = read_observation_index(info)
     if group_by_entries is None:
         group_by_entries = ["Receiver", "Backend"]
     grouped_table = info.group_by(group_by_entries)
@@ -272,11 +429,18 @@ def main_inspector(args=None):
                         help='Only before a certain date and time, e.g. '
                              '``--only-before 20150510-111020`` to indicate '
                              'scans done before 11:10:20 UTC, May 10th, 2015')
+    parser.add_argument("--jobs", type=int, default=None,
+                        help="Number of processes used to read the files")
+    parser.add_argument("--index", type=str, default=None,
+                        help="SQLite file where the header information is "
+                             "saved. In later runs, only new or modified "
+                             "files are read")
 
     args = parser.parse_args(args)
 
     info = inspect_directories(args.directories, args.only_after,
-                               args.only_before)
+                               args.only_before, jobs=args.jobs,
+                               index_file=args.index)
     info.write('table.csv', overwrite=True)
 
     if args.dump_config_files:
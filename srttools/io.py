@@ -2,7 +2,7 @@
 from __future__ import (absolute_import, division,
                         print_function)
 import astropy.io.fits as fits
-from astropy.table import Table
+from astropy.table import Table, Column, MaskedColumn
 import numpy as np
 import astropy.units as u
 from astropy.coordinates import EarthLocation, AltAz, Angle, ICRS
@@ -14,13 +14,22 @@ import copy
 import re
 import six
 import collections
+import traceback
+import json
+import mmap
+import multiprocessing
+from multiprocessing.pool import ThreadPool
 
 from .utils import force_move_file
 
 
 __all__ = ["mkdir_p", "detect_data_kind", "correct_offsets", "observing_angle",
            "get_rest_angle", "print_obs_info_fitszilla", "read_data_fitszilla",
-           "read_data", "root_name", "get_chan_columns"]
+           "read_data_fitszilla_chunks", "read_data", "read_data_meta",
+           "read_many", "root_name",
+           "get_chan_columns", "get_channel_meta", "read_data_npyscan",
+           "write_data_npyscan", "read_hdf5_table", "write_hdf5_table",
+           "hdf5_write_options", "cast_columns", "counts_dtype"]
 
 
 chan_re = re.compile(r'^Ch([0-9]+)$'
@@ -130,6 +139,44 @@ def get_channel_feed(ch):
         return int(ch[4])
 
 
+def get_channel_meta(table, channel):
+    """Get the full metadata of a channel column.
+
+    The observation header is stored once, in the table metadata, and
+    shared by all channels. Channel columns only carry the keywords that are
+    specific to them (frequency, bandwidth, feed, offsets...), and these
+    take precedence over the header ones.
+
+    Parameters
+    ----------
+    table : :class:`astropy.table.Table`
+        The table containing the channel
+    channel : str
+        The name of the channel column
+
+    Returns
+    -------
+    meta : dict
+        The header metadata, updated with the channel-specific ones
+
+    Examples
+    --------
+    >>> table = Table({'Feed0_LCP': [1, 2]}, meta={'backend': 'TP',
+    ...                                            'bandwidth': 1})
+    >>> table['Feed0_LCP'].meta['bandwidth'] = 2
+    >>> meta = get_channel_meta(table, 'Feed0_LCP')
+    >>> meta['backend']
+    'TP'
+    >>> meta['bandwidth']
+    2
+    >>> table.meta['bandwidth']
+    1
+    """
+    meta = collections.OrderedDict(table.meta)
+    meta.update(table[channel].meta)
+    return meta
+
+
 def mkdir_p(path):
     """Safe mkdir function.
 
@@ -164,6 +211,8 @@ def detect_data_kind(fname):
     """Placeholder for function that recognizes data format."""
     if fname.endswith('.hdf5'):
         return 'hdf5'
+    elif fname.rstrip(os.sep).endswith('.npyscan'):
+        return 'npyscan'
     else:
         return 'fitszilla'
 
@@ -270,9 +319,239 @@ def infer_skydip_from_elevation(elevation, azimuth=None):
     return az_condition & el_condition
 
 
+def _unit_vectors(lon, lat):
+    """Cartesian unit vectors, with the cartesian axis last.
+
+    Examples
+    --------
+    >>> np.allclose(_unit_vectors(np.array([0, np.pi / 2]), np.zeros(2)),
+    ...             [[1, 0, 0], [0, 1, 0]])
+    True
+    """
+    coslat = np.cos(lat)
+    return np.stack([coslat * np.cos(lon), coslat * np.sin(lon),
+                     np.sin(lat)], axis=-1)
+
+
+def _angular_distance(vec1, vec2):
+    """Angle between two (not necessarily normalized) vectors, in radians.
+
+    The cartesian axis is the last one.
+
+    Examples
+    --------
+    >>> np.allclose(_angular_distance(np.array([1., 0, 0]),
+    ...                               np.array([0., 2., 0])), np.pi / 2)
+    True
+    """
+    cross = np.linalg.norm(np.cross(vec1, vec2), axis=-1)
+    dot = np.sum(vec1 * vec2, axis=-1)
+    return np.arctan2(cross, dot)
+
+
+def _exact_altaz_to_icrs(obstimes, az, el, location):
+    """Transform horizontal coordinates (in radians) to ICRS with Astropy.
+
+    If the coordinates have more than one dimension (e.g. one column per
+    feed), the observing times are broadcast along the other dimensions, so
+    that all columns are transformed with a single frame.
+    """
+    if np.ndim(az) > 1:
+        obstimes = obstimes.reshape(obstimes.shape +
+                                    (1,) * (np.ndim(az) - 1))
+    coords = AltAz(az=Angle(az, unit=u.rad), alt=Angle(el, unit=u.rad),
+                   location=location, obstime=obstimes)
+
+    # According to line_profiler, coords.icrs is *by far* the longest
+    # operation in this function, taking between 80 and 90% of the
+    # execution time.
+    coords_deg = coords.transform_to(ICRS)
+    ra = np.radians(coords_deg.ra)
+    dec = np.radians(coords_deg.dec)
+    return np.asarray(ra.value), np.asarray(dec.value)
+
+
+def altaz_to_icrs(obstimes, az, el, location, tolerance=None,
+                  min_grid_points=16):
+    """Transform horizontal coordinates to ICRS, optionally interpolating.
+
+    If ``tolerance`` is specified, the exact transform is only calculated on
+    a sparse grid of times. The transformed pointing is interpolated with a
+    cubic spline between the grid points, and the grid is refined until both
+    the interpolated input pointing (checked at every sample) and the
+    interpolated output (checked against the exact transform at the middle
+    of each grid interval) are within the tolerance. If the pointing is not
+    smooth, the grid gets refined down to every sample, giving the exact
+    transform.
+
+    Parameters
+    ----------
+    obstimes : :class:`astropy.time.Time`
+        Observing times, monotonically increasing
+    az : array-like
+        Azimuth in radians, shape ``(N,)`` or ``(N, nfeeds)``, where ``N`` is
+        the length of ``obstimes``. All columns (e.g. all the feeds of a
+        multifeed receiver) are transformed together, sharing the time grid
+        and the time-dependent part of the transform
+    el : array-like
+        Elevation in radians, same shape as ``az``
+    location : :class:`astropy.coordinates.EarthLocation`
+        Location of the telescope
+
+    Other parameters
+    ----------------
+    tolerance : float or Quantity
+        Maximum interpolation error. Floats are interpreted as arcseconds.
+        If None, the exact transform is calculated for all samples
+    min_grid_points : int
+        Number of exact transforms on the initial grid
+
+    Returns
+    -------
+    ra : array
+        Right ascension in radians, same shape as ``az``
+    dec : array
+        Declination in radians, same shape as ``az``
+    max_deviation : Quantity
+        Estimated maximum deviation from the exact transform (over all
+        columns), in arcsec. It is 0 if the exact transform was calculated
+
+    Examples
+    --------
+    >>> obstimes = Time(57000 + np.arange(100) / 86400, format='mjd')
+    >>> az = np.radians(np.linspace(30, 31, 100))
+    >>> el = np.radians(np.linspace(40, 41, 100))
+    >>> loc = locations['srt']
+    >>> ra0, dec0, _ = altaz_to_icrs(obstimes, az, el, loc)
+    >>> ra, dec, maxdev = altaz_to_icrs(obstimes, az, el, loc, tolerance=0.1)
+    >>> maxdev < 0.1 * u.arcsec
+    True
+    >>> np.all(np.abs(dec - dec0) < np.radians(0.1 / 3600))
+    True
+    """
+    az = np.asarray(az, dtype=float)
+    el = np.asarray(el, dtype=float)
+    nsamples = az.shape[0]
+    zero = 0 * u.arcsec
+
+    if tolerance is None or nsamples <= min_grid_points:
+        ra, dec = _exact_altaz_to_icrs(obstimes, az, el, location)
+        return ra, dec, zero
+
+    if not hasattr(tolerance, 'unit'):
+        tolerance = tolerance * u.arcsec
+    tolerance = tolerance.to(u.rad).value
+
+    times = (obstimes.mjd - obstimes.mjd[0]) * 86400
+    if np.any(np.diff(times) <= 0):
+        warnings.warn('Times are not strictly increasing. Using the exact '
+                      'coordinate transform')
+        ra, dec = _exact_altaz_to_icrs(obstimes, az, el, location)
+        return ra, dec, zero
+
+    from scipy.interpolate import CubicSpline
+
+    vec_in = _unit_vectors(az, el)
+    vec_out = np.zeros_like(vec_in)
+    ra = np.zeros_like(az)
+    dec = np.zeros_like(el)
+    computed = np.zeros(nsamples, dtype=bool)
+
+    grid = np.unique(np.rint(
+        np.linspace(0, nsamples - 1, min_grid_points)).astype(int))
+
+    while True:
+        mids = (grid[:-1] + grid[1:]) // 2
+        # Intervals with no samples inside are exact
+        open_intervals = grid[1:] - grid[:-1] > 1
+        mids = mids[open_intervals]
+
+        to_compute = np.union1d(grid, mids)
+        to_compute = to_compute[~computed[to_compute]]
+        if to_compute.size > 0:
+            ra[to_compute], dec[to_compute] = \
+                _exact_altaz_to_icrs(obstimes[to_compute], az[to_compute],
+                                     el[to_compute], location)
+            vec_out[to_compute] = \
+                _unit_vectors(ra[to_compute], dec[to_compute])
+            computed[to_compute] = True
+
+        if mids.size == 0:
+            break
+
+        # Check the interpolation of the output at the middle of intervals
+        interp_out = CubicSpline(times[grid], vec_out[grid], axis=0)
+        dev_out = _angular_distance(interp_out(times[mids]), vec_out[mids])
+
+        # Check the interpolation of the input at all samples
+        interp_in = CubicSpline(times[grid], vec_in[grid], axis=0)
+        dev_in = _angular_distance(interp_in(times), vec_in)
+        if dev_in.ndim > 1:
+            dev_in = dev_in.reshape(nsamples, -1).max(axis=1)
+            dev_out = dev_out.reshape(mids.size, -1).max(axis=1)
+        dev_in_intervals = \
+            np.maximum.reduceat(dev_in, grid[:-1])[open_intervals]
+
+        bad = (dev_out > tolerance) | (dev_in_intervals > tolerance)
+        if not np.any(bad):
+            break
+        grid = np.union1d(grid, mids[bad])
+
+    not_computed = ~computed
+    if mids.size == 0 or not np.any(not_computed):
+        return ra, dec, zero
+
+    interp_vec = interp_out(times[not_computed])
+    interp_vec /= np.linalg.norm(interp_vec, axis=-1)[..., np.newaxis]
+    ra[not_computed] = np.arctan2(interp_vec[..., 1],
+                                  interp_vec[..., 0]) % (2 * np.pi)
+    dec[not_computed] = np.arcsin(interp_vec[..., 2])
+
+    # The transform is nearly a rotation, so errors in the interpolated
+    # input pointing propagate to the output
+    max_deviation = max(np.max(dev_out), np.max(dev_in[not_computed]))
+
+    return ra, dec, (max_deviation * u.rad).to(u.arcsec)
+
+
 def get_coords_from_altaz_offset(obstimes, el, az, xoffs, yoffs, location,
-                                 inplace=False):
-    """"""
+                                 inplace=False, tolerance=None,
+                                 return_deviation=False):
+    """Get the ICRS coordinates of a feed from its horizontal offsets.
+
+    All feeds can be converted with a single call, passing one column per
+    feed.
+
+    Parameters
+    ----------
+    obstimes : :class:`astropy.time.Time`
+        Observing times, shape ``(N,)``
+    el, az : array-like
+        Elevation and azimuth of the boresight, in radians, shape ``(N,)`` or
+        ``(N, nfeeds)``
+    xoffs, yoffs : Quantity
+        Offsets of the feeds, in cross-elevation and elevation. They must be
+        broadcastable to the shape of ``el``
+    location : :class:`astropy.coordinates.EarthLocation`
+        Location of the telescope
+
+    Other parameters
+    ----------------
+    inplace : bool
+        Add the offsets to ``el`` and ``az`` in place
+    tolerance : float or Quantity
+        If not None, use the interpolated transform with this tolerance. See
+        :func:`altaz_to_icrs`
+    return_deviation : bool
+        Also return the estimated maximum deviation from the exact transform
+
+    Returns
+    -------
+    ra, dec : arrays
+        Right ascension and declination, in radians
+    max_deviation : Quantity
+        Only returned if ``return_deviation`` is True
+    """
     # Calculate observing angle
     if not inplace:
         el = copy.deepcopy(el)
@@ -281,48 +560,152 @@ def get_coords_from_altaz_offset(obstimes, el, az, xoffs, yoffs, location,
     el += yoffs.to(u.rad).value
     az += xoffs.to(u.rad).value / np.cos(el)
 
-    coords = AltAz(az=Angle(az), alt=Angle(el), location=location,
-                   obstime=obstimes)
-
-    # According to line_profiler, coords.icrs is *by far* the longest
-    # operation in this function, taking between 80 and 90% of the
-    # execution time. Need to study a way to avoid this.
-    coords_deg = coords.transform_to(ICRS)
-    ra = np.radians(coords_deg.ra)
-    dec = np.radians(coords_deg.dec)
+    ra, dec, max_deviation = \
+        altaz_to_icrs(obstimes, az, el, location, tolerance=tolerance)
+    if return_deviation:
+        return ra, dec, max_deviation
     return ra, dec
 
 
-def update_table_with_offsets(new_table, xoffsets, yoffsets, inplace=False):
+def update_table_with_offsets(new_table, xoffsets, yoffsets, inplace=False,
+                              feeds=None, tolerance=None):
+    """Correct the pointing of each feed for its offset from the boresight.
+
+    Parameters
+    ----------
+    new_table : :class:`astropy.table.Table`
+        Table containing ``time``, ``derot_angle``, ``ra``, ``dec``, ``el``,
+        ``az`` columns (one column per feed for the coordinates)
+    xoffsets, yoffsets : list of Quantity
+        The offsets of the feeds
+
+    Other parameters
+    ----------------
+    inplace : bool
+        Modify the input table in place
+    feeds : list of int
+        Only correct the coordinates of these feeds. The other feeds are left
+        with the boresight pointing
+    tolerance : float or Quantity
+        If not None, interpolate the coordinate transform within this
+        tolerance (see :func:`altaz_to_icrs`). The maximum deviation from the
+        exact transform is saved in ``meta['coordinate_max_deviation']``
+    """
     rest_angles = get_rest_angle(xoffsets, yoffsets)
+    xoffsets = u.Quantity(xoffsets)
+    yoffsets = u.Quantity(yoffsets)
 
     if not inplace:
         new_table = copy.deepcopy(new_table)
 
-    for i in range(0, new_table['el'].shape[1]):
-        obs_angle = observing_angle(rest_angles[i], new_table['derot_angle'])
-
-        # offsets < 0.001 arcseconds: don't correct (usually feed 0)
-        if np.abs(xoffsets[i]) < np.radians(0.001 / 60.) * u.rad and \
-                np.abs(yoffsets[i]) < np.radians(0.001 / 60.) * u.rad:
-            continue
-        xoffs, yoffs = correct_offsets(obs_angle, xoffsets[i], yoffsets[i])
-        obstimes = Time(new_table['time'] * u.day, format='mjd', scale='utc')
-
-        location = locations[new_table.meta['site']]
-        ra, dec = \
-            get_coords_from_altaz_offset(obstimes,
-                                         new_table['el'][:, i],
-                                         new_table['az'][:, i],
-                                         xoffs, yoffs,
-                                         location=location,
-                                         inplace=inplace)
-        new_table['ra'][:, i] = ra
-        new_table['dec'][:, i] = dec
+    # offsets < 0.001 arcseconds: don't correct (usually feed 0)
+    min_offset = np.radians(0.001 / 60.) * u.rad
+    feeds_to_update = \
+        [i for i in range(0, new_table['el'].shape[1])
+         if (feeds is None or i in feeds) and
+         not (np.abs(xoffsets[i]) < min_offset and
+              np.abs(yoffsets[i]) < min_offset)]
+
+    if len(feeds_to_update) == 0:
+        return new_table
+
+    materialize_feed_coordinates(new_table)
+
+    # All feeds are converted at once, with one column per feed
+    feed_idx = np.array(feeds_to_update)
+    derot_angle = \
+        np.asarray(new_table['derot_angle'])[:, np.newaxis] * u.rad
+    obs_angle = observing_angle(rest_angles[feed_idx][np.newaxis, :],
+                                derot_angle)
+    xoffs, yoffs = correct_offsets(obs_angle,
+                                   xoffsets[feed_idx][np.newaxis, :],
+                                   yoffsets[feed_idx][np.newaxis, :])
+    obstimes = Time(new_table['time'] * u.day, format='mjd', scale='utc')
+
+    location = locations[new_table.meta['site']]
+    el = np.array(new_table['el'][:, feed_idx])
+    az = np.array(new_table['az'][:, feed_idx])
+    ra, dec, max_deviation = \
+        get_coords_from_altaz_offset(obstimes, el, az,
+                                     xoffs, yoffs,
+                                     location=location,
+                                     inplace=True,
+                                     tolerance=tolerance,
+                                     return_deviation=True)
+    new_table['ra'][:, feed_idx] = ra
+    new_table['dec'][:, feed_idx] = dec
+    if inplace:
+        # Offsets are also applied to the horizontal coordinates
+        new_table['el'][:, feed_idx] = el
+        new_table['az'][:, feed_idx] = az
+
+    if tolerance is not None:
+        logging.debug('Maximum deviation of interpolated coordinates: '
+                      '{}'.format(max_deviation))
+        new_table.meta['coordinate_max_deviation'] = max_deviation
 
     return new_table
 
 
+def broadcast_feed_coordinate(values, nfeeds, name=None, unit=None):
+    """Create a per-feed coordinate column from the boresight coordinate.
+
+    The column has shape ``(len(values), nfeeds)``, but all feeds share the
+    same memory (it is a read-only broadcast view of ``values``). Use
+    :func:`materialize_feed_coordinates` before modifying it.
+
+    Examples
+    --------
+    >>> col = broadcast_feed_coordinate(np.arange(3.), 4, name='ra')
+    >>> col.shape
+    (3, 4)
+    >>> np.all(col[:, 3] == np.arange(3.))
+    True
+    >>> col.strides[1]
+    0
+    """
+    values = np.asarray(values)
+    data = np.broadcast_to(values[:, np.newaxis], (values.size, nfeeds))
+    return Column(data, name=name, unit=unit, copy=False)
+
+
+def _is_broadcast(array):
+    """Check if some of the array dimensions are broadcast (zero-stride).
+
+    Examples
+    --------
+    >>> _is_broadcast(np.zeros((3, 2)))
+    False
+    >>> _is_broadcast(np.broadcast_to(np.zeros(3)[:, np.newaxis], (3, 2)))
+    True
+    """
+    return np.any(np.array(array.strides) == 0) and array.size > 1
+
+
+def materialize_feed_coordinates(table):
+    """Make the per-feed coordinate columns writeable, copying them if needed.
+
+    Only columns created by :func:`broadcast_feed_coordinate` (or other
+    zero-stride views) are copied.
+
+    Examples
+    --------
+    >>> table = Table()
+    >>> table.add_column(
+    ...     broadcast_feed_coordinate(np.arange(3.), 2, name='ra'), copy=False)
+    >>> materialize_feed_coordinates(table)
+    >>> table['ra'][:, 1] = 0
+    >>> np.all(table['ra'][:, 0] == np.arange(3.))
+    True
+    """
+    for col in ['ra', 'dec', 'el', 'az']:
+        if col not in table.colnames:
+            continue
+        if not _is_broadcast(table[col]) and table[col].flags.writeable:
+            continue
+        table.replace_column(col, table[col].copy())
+
+
 def print_obs_info_fitszilla(fname):
     """Placeholder for function that prints out oberving information."""
     with fits.open(fname, memmap=False) as lchdulist:
@@ -343,6 +726,71 @@ def print_obs_info_fitszilla(fname):
               get_value_with_units(rf_input_data, 'bandWidth'))
 
 
+def _get_section_data(data_table, section, is_old_spectrum=False):
+    """Get the data of a given section from the data table of a fitszilla.
+
+    Old spectral files have a single ``spectrum`` column.
+    """
+    if is_old_spectrum:
+        return data_table['spectrum']
+    return data_table['ch{}'.format(section)]
+
+
+def counts_dtype(precision=None):
+    """Data type of counts and spectra, given the ``precision`` config option.
+
+    Times and coordinates are always in double precision.
+
+    Examples
+    --------
+    >>> counts_dtype('float32') == np.float32
+    True
+    >>> counts_dtype() == np.float64
+    True
+    """
+    if precision is None:
+        return np.dtype(np.float64)
+    return np.dtype(precision)
+
+
+def _scale_channel_data(data, relpower, dtype=None, views=False):
+    """Multiply the channel data by the relative power of the feed.
+
+    The data are copied only if the scaling changes them, if it changes
+    their data type or, unless ``views`` is True, if they are not in the
+    native byte order (as the data in FITS files): otherwise, the input
+    array is returned.
+
+    Examples
+    --------
+    >>> data = np.arange(3.)
+    >>> _scale_channel_data(data, 1.) is data
+    True
+    >>> np.all(_scale_channel_data(data, 2.) == [0, 2, 4])
+    True
+    >>> _scale_channel_data(np.arange(3), 1.).dtype.kind
+    'f'
+    >>> _scale_channel_data(data, 2., dtype='float32').dtype == np.float32
+    True
+    >>> data = np.arange(3, dtype='>f4')
+    >>> _scale_channel_data(data, 1., dtype='float32', views=True) is data
+    True
+    >>> _scale_channel_data(data, 1., dtype='float32').dtype.isnative
+    True
+    """
+    if dtype is None:
+        dtype = np.result_type(data, relpower)
+    dtype = np.dtype(dtype)
+    if dtype.kind == data.dtype.kind and \
+            dtype.itemsize == data.dtype.itemsize:
+        if relpower == 1 and (views or data.dtype.isnative):
+            return data
+        dtype = data.dtype.newbyteorder('=')
+    if relpower == 1:
+        return data.astype(dtype.newbyteorder('='))
+    return np.multiply(data, relpower, dtype=dtype.newbyteorder('='))
+
+
 def _chan_name(f, p, c=None):
     if c is not None:
         return 'Feed{}_{}_{}'.format(f, p, c)
@@ -350,12 +798,141 @@ def _chan_name(f, p, c=None):
         return 'Feed{}_{}'.format(f, p)
 
 
-def read_data_fitszilla(fname):
-    with fits.open(fname, memmap=False) as lchdulist:
-        retval = _read_data_fitszilla(lchdulist)
+def read_data_fitszilla(fname, feeds=None, ifs=None, chans=None,
+                        meta_only=False, coordinate_tolerance=None,
+                        memmap=None, dtype=None):
+    """Read a fitszilla file, optionally only a subset of its channels.
+
+    Parameters
+    ----------
+    fname : str
+        The fitszilla file
+
+    Other parameters
+    ----------------
+    feeds : list of int
+        Only read these feeds
+    ifs : list of int
+        Only read these IF chains
+    chans : list of str
+        Only read the channels with these names (e.g. ``Feed0_LCP``)
+    meta_only : bool
+        Do not read the channel data and do not convert the coordinates of
+        the feeds: only return the metadata (observation and per-channel
+        information, in ``meta['channel_meta']``) and the boresight pointing
+        and time columns
+    coordinate_tolerance : float or Quantity
+        Tolerance (in arcsec, if a float) for the interpolated conversion of
+        the feed coordinates (see :func:`altaz_to_icrs`). If None, the exact
+        conversion is used
+    memmap : bool
+        Map the file in memory instead of reading it. If True, the channels
+        that do not need to be rescaled by the relative power of their feed
+        are views of the data on disk (in the big-endian byte order of FITS
+        files), and the others are copied only once. If None, the file is
+        mapped only when part of it is requested, and all data are returned
+        in the native byte order
+    dtype : str or `numpy.dtype`
+        Data type of the channel data, e.g. ``'float32'`` (see the
+        ``precision`` config option). Times and coordinates are always in
+        double precision. If None, the data type of the file is kept, unless
+        the relative power of the feed requires a conversion
+
+    See Also
+    --------
+    srttools.io.read_data
+    """
+    # Only keep the views of the file if explicitly requested: otherwise,
+    # return data in the native byte order, as required e.g. by Numba
+    views = memmap is True
+    if memmap is None:
+        # If only part of the data is requested, map the file, so that only
+        # the requested columns are read from disk
+        memmap = meta_only or \
+            np.any([sel is not None for sel in [feeds, ifs, chans]])
+    with fits.open(fname, memmap=memmap) as lchdulist:
+        retval = _read_data_fitszilla(
+            lchdulist, feeds=feeds, ifs=ifs, chans=chans,
+            meta_only=meta_only, coordinate_tolerance=coordinate_tolerance,
+            dtype=dtype, views=views)
     return retval
 
 
+def read_data_fitszilla_chunks(fname, chunk_size=4096,
+                               convert_coordinates=True, **kwargs):
+    """Read a fitszilla file in chunks of consecutive samples.
+
+    The file is mapped in memory, and only one chunk at a time is read, so
+    that the memory needed by the channel data does not depend on the
+    length of the scan. All chunks have the same metadata.
+
+    Parameters
+    ----------
+    fname : str
+        The fitszilla file
+
+    Other parameters
+    ----------------
+    chunk_size : int
+        Number of samples in each chunk
+    convert_coordinates : bool
+        If False, the coordinates of all feeds are the boresight pointing,
+        as with ``meta_only`` in :func:`read_data_fitszilla`. Useful when
+        only the channel data are needed
+    kwargs : dict
+        Additional keyword arguments (e.g. channel selection), see
+        :func:`read_data_fitszilla`
+
+    Yields
+    ------
+    table : :class:`astropy.table.Table`
+        The data in the chunk, in the same format as
+        :func:`read_data_fitszilla`
+    """
+    with fits.open(fname, memmap=True) as lchdulist:
+        # The headers are parsed, and the coordinates of the whole scan
+        # converted, only once. They are much smaller than the spectra
+        header = _read_fitszilla_header(lchdulist)
+        coordinates = _read_data_fitszilla(
+            lchdulist, header=header, meta_only=not convert_coordinates,
+            coordinates_only=convert_coordinates, **kwargs)
+        for start in range(0, len(coordinates), chunk_size):
+            rows = slice(start, start + chunk_size)
+            yield _read_data_fitszilla(lchdulist, rows=rows, header=header,
+                                       coordinates=coordinates[rows],
+                                       **kwargs)
+
+
+def _is_selected(feed, ifchain, chan_name, feeds=None, ifs=None, chans=None):
+    """Check if a channel satisfies all the given selection criteria.
+
+    Criteria that are None are always satisfied; ``ifchain=None`` skips the
+    IF check.
+
+    Examples
+    --------
+    >>> _is_selected(0, 1, 'Feed0_LCP')
+    True
+    >>> _is_selected(0, 1, 'Feed0_LCP', feeds=[1, 2])
+    False
+    >>> _is_selected(0, 1, 'Feed0_LCP', feeds=[0], ifs=[1])
+    True
+    >>> _is_selected(0, 1, 'Feed0_LCP', ifs=[0])
+    False
+    >>> _is_selected(0, None, 'Feed0_Q', ifs=[0], chans=['Feed0_Q'])
+    True
+    >>> _is_selected(0, 1, 'Feed0_LCP', chans=['Feed0_RCP'])
+    False
+    """
+    if feeds is not None and feed not in feeds:
+        return False
+    if ifs is not None and ifchain is not None and ifchain not in ifs:
+        return False
+    if chans is not None and chan_name not in chans:
+        return False
+    return True
+
+
 def get_value_with_units(fitsext, keyword, default=""):
     if isinstance(fitsext, fits.BinTableHDU):
         fitsext = fitsext.data
@@ -376,9 +953,19 @@ def get_value_with_units(fitsext, keyword, default=""):
         return value * unit
 
 
-def _read_data_fitszilla(lchdulist):
-    """Open a fitszilla FITS file and read all relevant information."""
+def _read_fitszilla_header(lchdulist):
+    """Read the information on the observation and the channels.
 
+    This includes the checks that need the whole data table (e.g. whether
+    the scan is a skydip). The result is passed to
+    :func:`_read_data_fitszilla`, so that the headers are parsed only once
+    when a file is read in many chunks.
+
+    Returns
+    -------
+    header : dict
+        The information, by name
+    """
     is_new_fitszilla = np.any(['coord' in i.name.lower() for i in lchdulist])
 
     # ----------- Extract generic observation information ------------------
@@ -463,17 +1050,89 @@ def _read_data_fitszilla(lchdulist):
 
     relpowers = get_value_with_units(feed_input_data, 'relativePower')
 
+    datahdu = lchdulist['DATA TABLE']
+    is_old_spectrum = 'SPECTRUM' in list(datahdu.header.values())
+    derotator_ok = _check_derotator(datahdu.data['derot_angle'])
+    is_skydip = infer_skydip_from_elevation(datahdu.data['el'],
+                                            datahdu.data['az'])
+
+    return {'is_new_fitszilla': is_new_fitszilla, 'headerdict': headerdict,
+            'source': source, 'site': site, 'receiver': receiver,
+            'ra': ra, 'dec': dec, 'ra_offset': ra_offset,
+            'dec_offset': dec_offset, 'az_offset': az_offset,
+            'el_offset': el_offset, 'chan_ids': chan_ids,
+            'nbin_per_chan': nbin_per_chan, 'sample_rate': sample_rate,
+            'integration_time': integration_time,
+            'is_polarized': is_polarized, 'backend': backend,
+            'feeds': feeds, 'IFs': IFs, 'polarizations': polarizations,
+            'frequencies': frequencies, 'bandwidths': bandwidths,
+            'local_oscillator': local_oscillator, 'sections': sections,
+            'combinations': combinations, 'chan_names': chan_names,
+            'xoffsets': xoffsets, 'yoffsets': yoffsets,
+            'relpowers': relpowers, 'is_old_spectrum': is_old_spectrum,
+            'derotator_ok': derotator_ok, 'is_skydip': is_skydip}
+
+
+def _read_data_fitszilla(lchdulist, feeds=None, ifs=None, chans=None,
+                         meta_only=False, coordinate_tolerance=None,
+                         rows=None, dtype=None, views=False, header=None,
+                         coordinates=None, coordinates_only=False):
+    """Open a fitszilla FITS file and read all relevant information.
+
+    See :func:`read_data_fitszilla` for the parameters. If ``rows`` (a
+    slice) is specified, only these rows of the data tables are read. The
+    metadata are calculated on the whole observation anyway, so that they
+    are the same for all chunks of the same file. If ``views`` is True, the
+    channel data are returned as views of the FITS data when possible,
+    without converting them to the native byte order.
+
+    When a file is read in many chunks, its headers can be parsed once
+    with :func:`_read_fitszilla_header` and passed as ``header``, and the
+    coordinates of the feeds can be converted once, reading the whole file
+    with ``coordinates_only=True`` (that skips the channel data like
+    ``meta_only``), and passed as ``coordinates``, a table with the
+    ``ra``, ``dec``, ``el`` and ``az`` columns of the requested rows.
+    """
+    select_feeds, select_ifs, select_chans = feeds, ifs, chans
+    skip_data = meta_only or coordinates_only
+
+    if header is None:
+        header = _read_fitszilla_header(lchdulist)
+    is_new_fitszilla = header['is_new_fitszilla']
+    headerdict = header['headerdict']
+    source, site = header['source'], header['site']
+    receiver, backend = header['receiver'], header['backend']
+    ra, dec = header['ra'], header['dec']
+    ra_offset, dec_offset = header['ra_offset'], header['dec_offset']
+    az_offset, el_offset = header['az_offset'], header['el_offset']
+    chan_ids = header['chan_ids']
+    nbin_per_chan = header['nbin_per_chan']
+    sample_rate = header['sample_rate']
+    integration_time = header['integration_time']
+    is_polarized = header['is_polarized']
+    feeds, IFs = header['feeds'], header['IFs']
+    polarizations = header['polarizations']
+    local_oscillator = header['local_oscillator']
+    sections = header['sections']
+    combinations = header['combinations']
+    xoffsets, yoffsets = header['xoffsets'], header['yoffsets']
+    relpowers = header['relpowers']
+    is_old_spectrum = header['is_old_spectrum']
+    # These are modified below
+    frequencies = header['frequencies'].copy()
+    bandwidths = header['bandwidths'].copy()
+    chan_names = list(header['chan_names'])
+
     # -------------- Read data!-----------------------------------------
     datahdu = lchdulist['DATA TABLE']
-    data_table_data = Table(datahdu.data)
-    for col in data_table_data.colnames:
-        if col == col.lower():
-            continue
-        data_table_data.rename_column(col, col.lower())
+    # Columns are accessed directly in the FITS record array (field access is
+    # case-insensitive), so that only the needed columns are read
+    data_table = datahdu.data
+    n_rows = len(data_table)
+    if rows is not None:
+        data_table = data_table[rows]
 
-    is_old_spectrum = 'SPECTRUM' in list(datahdu.header.values())
     if is_old_spectrum:
-        data_table_data.rename_column('spectrum', 'ch0')
         sections = np.array([0, 0])
 
     is_spectrum = nbin_per_chan > 1
@@ -483,7 +1142,7 @@ def _read_data_fitszilla(lchdulist):
     if is_spectrum:
         nchan = len(chan_ids)
 
-        _, nbins = data_table_data['ch0'].shape
+        _, nbins = _get_section_data(data_table, 0, is_old_spectrum).shape
 
         # Development version of SARDARA -- will it remain the same?
         if nbin_per_chan == nbins:
@@ -503,15 +1162,42 @@ def _read_data_fitszilla(lchdulist):
                              '{} total bins'.format(nbin_per_chan, nchan,
                                                     nbins))
 
-        for f, ic, p, s in zip(feeds, IFs, polarizations, sections):
+    # ----------- Select the channels to be read ------------------
+    rf_chan_names = []
+    for f, p, s in zip(feeds, polarizations, sections):
+        c = s
+        if is_single_channel:
+            c = None
+        rf_chan_names.append(_chan_name(f, p, c))
+
+    selected = np.array([_is_selected(f, ic, ch, select_feeds, select_ifs,
+                                      select_chans)
+                         for f, ic, ch in zip(feeds, IFs, rf_chan_names)],
+                        dtype=bool)
+
+    stokes_selected = {}
+    if is_polarized:
+        for s in list(set(sections)):
+            f = feeds[sections == s][0]
             c = s
             if is_single_channel:
                 c = None
-            section_name = 'ch{}'.format(s)
-            ch = _chan_name(f, p, c)
+            for stokes_par in 'QU':
+                ch = _chan_name(f, stokes_par, c)
+                stokes_selected[ch] = \
+                    _is_selected(f, None, ch, select_feeds, None,
+                                 select_chans)
+
+    data_table_data = {}
+    if is_spectrum:
+        for i, (f, ic, p, s) in enumerate(zip(feeds, IFs, polarizations,
+                                              sections)):
+            if not selected[i] or skip_data:
+                continue
+            ch = rf_chan_names[i]
             start, end = ic * nbin_per_chan, (ic + 1) * nbin_per_chan
             data_table_data[ch] = \
-                data_table_data[section_name][:, start:end]
+                _get_section_data(data_table, s, is_old_spectrum)[:, start:end]
 
         if is_polarized:
             # for f, ic, p, s in zip(feeds, IFs, polarizations, sections):
@@ -521,36 +1207,50 @@ def _read_data_fitszilla(lchdulist):
                 if is_single_channel:
                     c = None
 
-                section_name = 'ch{}'.format(s)
                 qname, uname = _chan_name(f, 'Q', c), _chan_name(f, 'U', c)
                 qstart, qend = 2 * nbin_per_chan, 3 * nbin_per_chan
                 ustart, uend = 3 * nbin_per_chan, 4 * nbin_per_chan
-                data_table_data[qname] = \
-                    data_table_data[section_name][:, qstart:qend]
-                data_table_data[uname] = \
-                    data_table_data[section_name][:, ustart:uend]
+                section_data = \
+                    _get_section_data(data_table, s, is_old_spectrum)
+                if stokes_selected[qname] and not skip_data:
+                    data_table_data[qname] = section_data[:, qstart:qend]
+                if stokes_selected[uname] and not skip_data:
+                    data_table_data[uname] = section_data[:, ustart:uend]
                 chan_names += [qname, uname]
-    else:
+    elif not skip_data:
         for ic, ch in enumerate(chan_names):
+            if not selected[ic]:
+                continue
             data_table_data[ch] = \
-                data_table_data['ch{}'.format(chan_ids[ic])]
+                _get_section_data(data_table, chan_ids[ic])
 
-    # ----------- Read temperature data, if possible ----------------
-    tempdata = lchdulist['ANTENNA TEMP TABLE'].data
-    try:
-        for ic, ch in enumerate(chan_names):
-            td = tempdata['ch{}'.format(chan_ids[ic])]
-            data_table_data[ch + '-Temp'] = td
-    except Exception as e:
-        logging.warning("Could not read temperature information from file."
-                        "Exception: {}".format(str(e)))
-        for ic, ch in enumerate(chan_names):
-            data_table_data[ch + '-Temp'] = \
-                np.zeros_like(data_table_data['time'])
+    chan_names_selected = \
+        [selected[ic] if ic < len(selected) else stokes_selected[ch]
+         for ic, ch in enumerate(chan_names)]
 
-    info_to_retrieve = \
-        ['time', 'derot_angle', 'weather'] + [ch + '-Temp'
-                                              for ch in chan_names]
+    # ----------- Read temperature data, if possible ----------------
+    temp_names = [ch + '-Temp'
+                  for ch, sel in zip(chan_names, chan_names_selected) if sel]
+    if skip_data:
+        temp_names = []
+    else:
+        tempdata = lchdulist['ANTENNA TEMP TABLE'].data
+        try:
+            for ic, ch in enumerate(chan_names):
+                td = tempdata['ch{}'.format(chan_ids[ic])]
+                if len(td) != n_rows:
+                    raise ValueError('Inconsistent data column lengths')
+                if rows is not None:
+                    td = td[rows]
+                if not views:
+                    td = td.astype(td.dtype.newbyteorder('='), copy=False)
+                if chan_names_selected[ic]:
+                    data_table_data[ch + '-Temp'] = td
+        except Exception as e:
+            logging.warning("Could not read temperature information from "
+                            "file. Exception: {}".format(str(e)))
+            for ch in temp_names:
+                data_table_data[ch] = np.zeros(len(data_table), dtype=float)
 
     new_table = Table()
 
@@ -568,52 +1268,74 @@ def _read_data_fitszilla(lchdulist):
                       [ra_offset, dec_offset, el_offset, az_offset]):
         new_table.meta[i + "_offset"] = off
 
-    for info in info_to_retrieve:
+    for info in ['time', 'derot_angle', 'weather']:
+        new_table[info] = data_table[info]
+    for info in temp_names:
         new_table[info] = data_table_data[info]
 
-    if not _check_derotator(new_table['derot_angle']):
+    if not header['derotator_ok']:
         logging.warning('Derotator angle looks weird. Setting to 0')
         new_table['derot_angle'][:] = 0
 
-    # Duplicate raj and decj columns (in order to be corrected later)
-    new_table['ra'] = \
-        np.tile(data_table_data['raj2000'],
-                (np.max(feeds) + 1, 1)).transpose()
-    new_table['dec'] = \
-        np.tile(data_table_data['decj2000'],
-                (np.max(feeds) + 1, 1)).transpose()
-    new_table['el'] = \
-        np.tile(data_table_data['el'],
-                (np.max(feeds) + 1, 1)).transpose()
-    new_table['az'] = \
-        np.tile(data_table_data['az'],
-                (np.max(feeds) + 1, 1)).transpose()
-
-    new_table.meta['is_skydip'] = \
-        infer_skydip_from_elevation(data_table_data['el'],
-                                    data_table_data['az'])
+    if coordinates is not None:
+        # Already converted
+        for info in ['ra', 'dec', 'el', 'az']:
+            new_table.add_column(coordinates[info], copy=False)
+        if 'coordinate_max_deviation' in coordinates.meta:
+            new_table.meta['coordinate_max_deviation'] = \
+                coordinates.meta['coordinate_max_deviation']
+    else:
+        # Per-feed raj and decj columns. They are views of the boresight
+        # pointing, and they are only copied when the offsets of the feeds
+        # are applied
+        for info, fitsname in zip(['ra', 'dec', 'el', 'az'],
+                                  ['raj2000', 'decj2000', 'el', 'az']):
+            new_table.add_column(
+                broadcast_feed_coordinate(np.array(data_table[fitsname]),
+                                          np.max(feeds) + 1, name=info),
+                copy=False)
+
+    new_table.meta['is_skydip'] = header['is_skydip']
 
     for info in ['ra', 'dec', 'az', 'el', 'derot_angle']:
         new_table[info].unit = u.radian
 
-    if not is_new_fitszilla:
-        update_table_with_offsets(new_table, xoffsets, yoffsets, inplace=True)
+    # Coordinates of feeds that are not selected are not converted
+    feeds_to_convert = None
+    if not np.all(selected) or not np.all(list(stokes_selected.values())):
+        feeds_to_convert = \
+            list(set(feeds[selected]) |
+                 set([get_channel_feed(ch)
+                      for ch, sel in stokes_selected.items() if sel]))
+
+    if meta_only or coordinates is not None:
+        pass
+    elif not is_new_fitszilla:
+        update_table_with_offsets(new_table, xoffsets, yoffsets, inplace=True,
+                                  feeds=feeds_to_convert,
+                                  tolerance=coordinate_tolerance)
     else:
         for i in range(len(xoffsets)):
+            if feeds_to_convert is not None and i not in feeds_to_convert:
+                continue
             try:
                 ext = lchdulist['Coord{}'.format(i)]
                 extdata = ext.data
+                if rows is not None:
+                    extdata = extdata[rows]
                 ra, dec = extdata['raj2000'], extdata['decj2000']
                 el, az = extdata['el'], extdata['az']
             except KeyError:
-                ra, dec = new_table['ra'][:, 0], new_table['dec'][:, 0]
-                el, az = new_table['el'][:, 0], new_table['az'][:, 0]
+                # Keep the boresight coordinates
+                continue
 
+            materialize_feed_coordinates(new_table)
             new_table['ra'][:, i] = ra
             new_table['dec'][:, i] = dec
             new_table['el'][:, i] = el
             new_table['az'][:, i] = az
 
+    channel_meta = collections.OrderedDict()
     # for f, ic, p, s, fr, b in zip(feeds, IFs, polarizations, sections,
     #                               frequencies, bandwidths):
     for i, fr in enumerate(frequencies):
@@ -624,20 +1346,19 @@ def _read_data_fitszilla(lchdulist):
         b = bandwidths[i]
         lo = local_oscillator[i]
 
-        c = s
-        if is_single_channel:
-            c = None
-        chan_name = _chan_name(f, p, c)
+        chan_name = rf_chan_names[i]
+        is_selected = selected[i] and not skip_data
         if bandwidths[ic] < 0:
             frequencies[ic] -= bandwidths[ic]
             bandwidths[ic] *= -1
-            for i in range(
-                    data_table_data[chan_name].shape[0]):
-                data_table_data[chan_name][i, :] = \
-                    data_table_data[chan_name][i, ::-1]
+            if is_selected:
+                # Reverse the spectral axis. This is a view: the data are
+                # only copied once, when the relative power is applied below
+                data_table_data[chan_name] = \
+                    data_table_data[chan_name][:, ::-1]
 
-        new_table[chan_name] = \
-            data_table_data[chan_name] * relpowers[feeds[ic]]
+        if not selected[i]:
+            continue
 
         newmeta = \
             {'polarization': polarizations[ic],
@@ -653,8 +1374,20 @@ def _read_data_fitszilla(lchdulist):
              'yoffset': yoffsets[f].to(u.rad),
              'relpower': float(relpowers[f])
              }
-        new_table[chan_name].meta.update(headerdict)
-        new_table[chan_name].meta.update(new_table.meta)
+        if skip_data:
+            channel_meta[chan_name] = newmeta
+            continue
+
+        # The data are scaled in a single pass, if at all, and are never
+        # copied again when added to the table
+        chan_data = _scale_channel_data(data_table_data[chan_name],
+                                        relpowers[feeds[ic]], dtype=dtype,
+                                        views=views)
+        new_table.add_column(Column(chan_data, name=chan_name, copy=False),
+                             copy=False)
+
+        # The observation header lives in new_table.meta, shared by all
+        # channels: only the channel-specific keywords are stored here
         new_table[chan_name].meta.update(newmeta)
 
         new_table[chan_name + '-filt'] = \
@@ -668,8 +1401,8 @@ def _read_data_fitszilla(lchdulist):
                 c = None
             for stokes_par in 'QU':
                 chan_name = _chan_name(feed, stokes_par, c)
-                new_table[chan_name] = \
-                    data_table_data[chan_name]
+                if not stokes_selected[chan_name]:
+                    continue
                 sample_time = (1 / (sample_rate[s].to(u.Hz)))
 
                 newmeta = \
@@ -687,23 +1420,683 @@ def _read_data_fitszilla(lchdulist):
                      'yoffset': yoffsets[feed].to(u.rad),
                      'relpower': 1.
                      }
-                new_table[chan_name].meta.update(headerdict)
-                new_table[chan_name].meta.update(new_table.meta)
+                if skip_data:
+                    channel_meta[chan_name] = newmeta
+                    continue
+
+                chan_data = _scale_channel_data(data_table_data[chan_name],
+                                                1, dtype=dtype, views=views)
+                new_table.add_column(
+                    Column(chan_data, name=chan_name, copy=False),
+                    copy=False)
                 new_table[chan_name].meta.update(newmeta)
 
                 new_table[chan_name + '-filt'] = \
                     np.ones(len(data_table_data[chan_name]), dtype=bool)
 
+    if skip_data:
+        new_table.meta['channel_meta'] = channel_meta
+
     return new_table
 
 
-def read_data(fname):
-    """Read the data, whatever the format, and return them."""
+def hdf5_write_options(meta):
+    """Keyword arguments for `Table.write`, from the HDF5 config options.
+
+    Parameters
+    ----------
+    meta : dict
+        Dictionary containing the ``hdf5_compression``, ``hdf5_shuffle`` and
+        ``hdf5_chunk_rows`` config options, e.g. the meta of a scan
+
+    Returns
+    -------
+    options : dict
+        The compression and chunking options, passed to
+        `h5py.Group.create_dataset` through `Table.write`
+
+    Examples
+    --------
+    >>> hdf5_write_options({})
+    {}
+    >>> options = hdf5_write_options({'hdf5_compression': 'gzip',
+    ...                               'hdf5_shuffle': True,
+    ...                               'hdf5_chunk_rows': 1000})
+    >>> options['compression'], options['shuffle'], options['chunks']
+    ('gzip', True, (1000,))
+    """
+    options = {}
+    if meta.get('hdf5_compression', None) is not None:
+        options['compression'] = meta['hdf5_compression']
+    if meta.get('hdf5_shuffle', False):
+        options['shuffle'] = True
+    if meta.get('hdf5_chunk_rows', None) is not None:
+        options['chunks'] = (meta['hdf5_chunk_rows'],)
+    return options
+
+
+def cast_columns(table, dtypes=None):
+    """Change the data type of the columns matching some patterns.
+
+    Parameters
+    ----------
+    table : `astropy.table.Table`
+        The input table
+    dtypes : list of ``[pattern, dtype]`` pairs
+        Columns whose name matches the shell-style ``pattern`` (see
+        `fnmatch`) are converted to ``dtype``. The first matching pattern
+        wins
+
+    Returns
+    -------
+    table : `astropy.table.Table`
+        A new table, sharing the data of the columns that are not converted.
+        If no column is converted, the input table is returned
+
+    Examples
+    --------
+    >>> table = Table({'Feed0_LCP': [1., 2.], 'time': [0., 1.]})
+    >>> new = cast_columns(table, [['Feed*', 'float32']])
+    >>> new['Feed0_LCP'].dtype == np.float32
+    True
+    >>> new['time'].dtype == np.float64
+    True
+    >>> cast_columns(table) is table
+    True
+    """
+    import fnmatch
+    if not dtypes:
+        return table
+
+    new_table = None
+    for col in table.colnames:
+        for pattern, dtype in dtypes:
+            if not fnmatch.fnmatchcase(col, pattern):
+                continue
+            if table[col].dtype != np.dtype(dtype):
+                if new_table is None:
+                    new_table = Table(table, copy=False)
+                new_table[col] = table[col].astype(dtype)
+            break
+
+    return table if new_table is None else new_table
+
+
+def write_hdf5_table(table, fname, path, *args, **kwargs):
+    """Write a table to HDF5, with its metadata.
+
+    Contrary to `Table.write`, additional keyword arguments such as
+    ``chunks`` and ``shuffle`` reach `h5py.Group.create_dataset` also when
+    the output is a file name.
+
+    Parameters
+    ----------
+    table : `astropy.table.Table`
+        The table to save
+    fname : str
+        The output file
+    path : str
+        The path of the table inside the file (e.g. ``'scan'``)
+
+    Other Parameters
+    ----------------
+    overwrite : bool, default False
+        Overwrite the output file if it exists
+    kwargs : dict
+        Additional keyword arguments (e.g. ``compression``), passed to
+        `Table.write`
+    """
+    import h5py
+    overwrite = kwargs.pop('overwrite', False)
+    if os.path.exists(fname) and not overwrite:
+        raise IOError('{} exists. Use overwrite=True'.format(fname))
+    with h5py.File(fname, 'w') as fobj:
+        Table.write(table, fobj, *args, path=path, format='hdf5',
+                    serialize_meta=True, **kwargs)
+
+
+def read_hdf5_table(fname, path, columns=None, rows=None):
+    """Read some columns and rows of a table saved to HDF5 by Astropy.
+
+    Only the requested data are read from disk. Tables containing mixin
+    columns (e.g. `astropy.time.Time`) are read in full by `Table.read`,
+    and sliced afterwards.
+
+    Parameters
+    ----------
+    fname : str
+        The HDF5 file
+    path : str
+        The path of the table inside the file (e.g. ``'scan'``)
+
+    Other Parameters
+    ----------------
+    columns : list of str
+        The columns to read. Default all
+    rows : slice
+        The rows to read. Default all
+
+    Returns
+    -------
+    table : `astropy.table.Table`
+        The table
+    """
+    import h5py
+    from astropy.table.meta import get_header_from_yaml
+
+    if rows is None:
+        rows = slice(None)
+
+    with h5py.File(fname, 'r') as fobj:
+        dset = fobj[path]
+        meta_path = path + '.__table_column_meta__'
+        header = {'meta': collections.OrderedDict(), 'datatype': []}
+        if meta_path in fobj:
+            header = get_header_from_yaml(
+                h.decode('utf-8') for h in fobj[meta_path])
+
+        if '__serialized_columns__' in header.get('meta', {}):
+            table = Table.read(fname, path=path)
+            if columns is not None:
+                table = table[columns]
+            return table[rows]
+
+        if columns is None:
+            columns = list(dset.dtype.names)
+        data = dset[tuple(columns) + (rows,)]
+
+    attrs = dict((c['name'], c) for c in header['datatype'])
+    table = Table(meta=header.get('meta', None))
+    for name in columns:
+        coldata = data if len(columns) == 1 else data[name]
+        colinfo = attrs.get(name, {})
+        table.add_column(
+            Column(coldata, name=name, unit=colinfo.get('unit', None),
+                   description=colinfo.get('description', None),
+                   format=colinfo.get('format', None),
+                   meta=colinfo.get('meta', None), copy=False),
+            copy=False)
+    return table
+
+
+def read_data(fname, **kwargs):
+    """Read the data, whatever the format, and return them.
+
+    Parameters
+    ----------
+    fname : str
+        The input file
+
+    Other parameters
+    ----------------
+    kwargs : dict
+        Additional keyword arguments (e.g. channel selection) passed to
+        :func:`read_data_fitszilla`. For HDF5 files, only ``columns`` and
+        ``rows`` are used (see :func:`read_hdf5_table`). Ignored for other
+        formats
+    """
+    kind = detect_data_kind(fname)
+    if kind == 'fitszilla':
+        return read_data_fitszilla(fname, **kwargs)
+    elif kind == 'hdf5':
+        if kwargs.get('columns') is None and kwargs.get('rows') is None:
+            return Table.read(fname, path='scan')
+        return read_hdf5_table(fname, 'scan', columns=kwargs.get('columns'),
+                               rows=kwargs.get('rows'))
+    elif kind == 'npyscan':
+        # Copy-on-write, so that processing steps can still modify the
+        # columns in place without touching the files
+        mmap_mode = None if kwargs.get('memmap') is False else 'c'
+        return read_data_npyscan(fname, mmap_mode=mmap_mode)
+
+
+def read_data_meta(fname):
+    """Read only the metadata of the data, whatever the format.
+
+    For HDF5 files and ``.npyscan`` directories, no data are read from
+    disk. For FITS files, see ``meta_only`` in :func:`read_data_fitszilla`.
+
+    Parameters
+    ----------
+    fname : str
+        The input file
+
+    Returns
+    -------
+    meta : dict
+        The metadata of the table
+    """
     kind = detect_data_kind(fname)
     if kind == 'fitszilla':
-        return read_data_fitszilla(fname)
+        return read_data_fitszilla(fname, meta_only=True).meta
     elif kind == 'hdf5':
-        return Table.read(fname, path='scan')
+        import h5py
+        from astropy.table.meta import get_header_from_yaml
+
+        with h5py.File(fname, 'r') as fobj:
+            meta_path = 'scan.__table_column_meta__'
+            if meta_path not in fobj:
+                return collections.OrderedDict(fobj['scan'].attrs.items())
+            header = get_header_from_yaml(
+                h.decode('utf-8') for h in fobj[meta_path])
+        meta = header.get('meta', collections.OrderedDict())
+        meta.pop('__serialized_columns__', None)
+        return meta
+    elif kind == 'npyscan':
+        with open(os.path.join(fname, NPYSCAN_META_FILE)) as fobj:
+            info = json.load(fobj, object_pairs_hook=_json_object_pairs)
+        return info['meta']
+
+
+NPYSCAN_META_FILE = 'meta.json'
+# Access modes of `mmap.mmap` corresponding to the ``mmap_mode`` values of
+# `numpy.load`
+_NPYSCAN_MMAP_ACCESS = {'r': mmap.ACCESS_READ, 'c': mmap.ACCESS_COPY,
+                        'r+': mmap.ACCESS_WRITE}
+_UNITS = {}
+
+
+def _unit(string):
+    """Parse a unit string, caching the result."""
+    unit = _UNITS.get(string)
+    if unit is None:
+        unit = _UNITS[string] = u.Unit(string)
+    return unit
+
+
+def _json_default(obj):
+    """Represent quantities, numpy objects and other oddities in JSON."""
+    if type(obj) is u.Quantity:
+        return {'__quantity__': [np.asarray(obj.value).tolist(),
+                                 obj.unit.to_string()]}
+    if type(obj) is np.ndarray:
+        return {'__ndarray__': [obj.tolist(), obj.dtype.str]}
+    if isinstance(obj, np.generic):
+        return obj.item()
+    # Fall back to Astropy's YAML for everything else, including subclasses
+    # of Quantity (e.g. Angle)
+    from astropy.io.misc import yaml
+    return {'__yaml__': yaml.dump(obj)}
+
+
+def _json_object_pairs(pairs):
+    """Read back the values saved by :func:`_json_default`.
+
+    Examples
+    --------
+    >>> meta = {'a': 2 * u.m, 'b': np.arange(2), 'c': np.int64(1),
+    ...         'd': Angle(1, 'deg'), 'e': [1, 'a']}
+    >>> string = json.dumps(meta, default=_json_default)
+    >>> newmeta = json.loads(string, object_pairs_hook=_json_object_pairs)
+    >>> newmeta['a'] == 2 * u.m
+    True
+    >>> newmeta['b'].dtype == meta['b'].dtype
+    True
+    >>> newmeta['c'] == meta['c']
+    True
+    >>> isinstance(newmeta['d'], Angle)
+    True
+    >>> newmeta['e'] == meta['e']
+    True
+    """
+    if len(pairs) == 1:
+        key, value = pairs[0]
+        if key == '__quantity__':
+            return u.Quantity(value[0], _unit(value[1]))
+        if key == '__ndarray__':
+            return np.array(value[0], dtype=value[1])
+        if key == '__yaml__':
+            from astropy.io.misc import yaml
+            return yaml.load(value)
+    return collections.OrderedDict(pairs)
+
+
+def write_data_npyscan(table, dirname, overwrite=False):
+    """Save a table as a directory of ``.npy`` columns.
+
+    Each column is saved with `numpy.save` into its own file, and the meta
+    data of the table and of the columns go to a JSON file in the same
+    directory. Tables saved this way can be loaded by
+    :func:`read_data_npyscan` with no need to copy the data in memory.
+
+    Parameters
+    ----------
+    table : `astropy.table.Table`
+        The table to save
+    dirname : str
+        The output directory. By convention, its name ends with ``.npyscan``
+
+    Other Parameters
+    ----------------
+    overwrite : bool, default False
+        Overwrite the output directory if it exists
+    """
+    import shutil
+
+    dirname = dirname.rstrip(os.sep)
+    if os.path.exists(dirname) and not overwrite:
+        raise IOError('{} exists. Use overwrite=True'.format(dirname))
+
+    # Write to a temporary directory first: the columns being saved might
+    # be memory-mapped from the old version
+    tmpdir = dirname + '.tmp'
+    if os.path.exists(tmpdir):
+        shutil.rmtree(tmpdir)
+    mkdir_p(tmpdir)
+
+    columns = []
+    for i, col in enumerate(table.columns.values()):
+        colinfo = collections.OrderedDict(
+            [('name', col.name), ('file', 'col{}.npy'.format(i))])
+        # Only the attributes that are set, to keep the JSON file small
+        if col.unit is not None:
+            colinfo['unit'] = col.unit.to_string()
+        for attr in ['description', 'format', 'meta']:
+            if getattr(col, attr):
+                colinfo[attr] = getattr(col, attr)
+        colfile = os.path.join(tmpdir, colinfo['file'])
+        np.save(colfile, np.asarray(col), allow_pickle=False)
+        colinfo.update(_npy_layout(colfile))
+        mask = getattr(col, 'mask', None)
+        if mask is not None and np.any(mask):
+            colinfo['mask'] = 'mask{}.npy'.format(i)
+            np.save(os.path.join(tmpdir, colinfo['mask']), np.asarray(mask),
+                    allow_pickle=False)
+        columns.append(colinfo)
+
+    with open(os.path.join(tmpdir, NPYSCAN_META_FILE), 'w') as fobj:
+        json.dump({'meta': table.meta, 'columns': columns}, fobj,
+                  default=_json_default)
+
+    if os.path.exists(dirname):
+        shutil.rmtree(dirname)
+    os.rename(tmpdir, dirname)
+
+
+def _npy_layout(fname):
+    """Position and layout of the data in a ``.npy`` file.
+
+    The result is stored with the columns of ``.npyscan`` directories, so
+    that :func:`_load_npy` can map the data with no need to parse the
+    header of the file. It is empty if the dtype cannot be represented
+    by a simple string.
+    """
+    with open(fname, 'rb') as fobj:
+        version = np.lib.format.read_magic(fobj)
+        if version == (1, 0):
+            header = np.lib.format.read_array_header_1_0(fobj)
+        else:
+            header = np.lib.format.read_array_header_2_0(fobj)
+        offset = fobj.tell()
+    shape, fortran_order, dtype = header
+    if np.dtype(dtype.str) != dtype:
+        return {}
+    return collections.OrderedDict(
+        [('dtype', dtype.str), ('shape', list(shape)),
+         ('fortran_order', fortran_order), ('offset', offset)])
+
+
+def _load_npy(fname, colinfo, mmap_mode=None):
+    """Load a ``.npy`` file, with the layout stored by :func:`_npy_layout`.
+
+    This is equivalent to `numpy.load`, but faster when many small files
+    are loaded, as it skips the parsing of the header and the creation of
+    `numpy.memmap` objects: memory-mapped data are plain arrays, viewing
+    a `mmap.mmap` object.
+    """
+    if 'offset' not in colinfo or \
+            (mmap_mode is not None and mmap_mode not in _NPYSCAN_MMAP_ACCESS):
+        return np.load(fname, mmap_mode=mmap_mode, allow_pickle=False)
+
+    dtype = np.dtype(colinfo['dtype'])
+    shape = tuple(colinfo['shape'])
+    order = 'F' if colinfo['fortran_order'] else 'C'
+    if 0 in shape:
+        return np.zeros(shape, dtype=dtype, order=order)
+    with open(fname, 'rb' if mmap_mode in [None, 'r', 'c'] else 'r+b') as fobj:
+        if mmap_mode is None:
+            fobj.seek(colinfo['offset'])
+            data = np.fromfile(fobj, dtype=dtype)
+        else:
+            buffer = mmap.mmap(fobj.fileno(), 0,
+                               access=_NPYSCAN_MMAP_ACCESS[mmap_mode])
+            data = np.frombuffer(buffer, dtype=dtype,
+                                 offset=colinfo['offset'])
+    return data.reshape(shape, order=order)
+
+
+def read_data_npyscan(dirname, mmap_mode='r'):
+    """Load a table saved by :func:`write_data_npyscan`.
+
+    Parameters
+    ----------
+    dirname : str
+        The directory containing the table
+
+    Other Parameters
+    ----------------
+    mmap_mode : str or None, default 'r'
+        Passed to `numpy.load`. With the default, columns are read-only
+        memory maps of the files. If None, the data are loaded in memory
+
+    Returns
+    -------
+    table : `astropy.table.Table`
+        The table
+    """
+    with open(os.path.join(dirname, NPYSCAN_META_FILE)) as fobj:
+        info = json.load(fobj, object_pairs_hook=_json_object_pairs)
+
+    columns = []
+    for colinfo in info['columns']:
+        data = _load_npy(os.path.join(dirname, colinfo['file']), colinfo,
+                         mmap_mode=mmap_mode)
+        if 'mask' in colinfo:
+            mask = np.load(os.path.join(dirname, colinfo['mask']))
+            data = MaskedColumn(data, mask=mask, copy=False)
+        columns.append(data)
+
+    # The columns are created only once, by the table, and only the
+    # attributes that were saved are set: most of the time spent loading
+    # small scans goes into the creation of astropy columns. The meta was
+    # just decoded, so there is no need for Table to deep-copy it.
+    table = Table(columns, names=[c['name'] for c in info['columns']],
+                  copy=False)
+    table.meta.update(info['meta'])
+    for colinfo in info['columns']:
+        col = table.columns[colinfo['name']]
+        if colinfo.get('unit') is not None:
+            col.unit = _unit(colinfo['unit'])
+        for attr in ['description', 'format', 'meta']:
+            if colinfo.get(attr):
+                setattr(col, attr, colinfo[attr])
+
+    return table
+
+
+class _FileReader(object):
+    """Apply a reader to a file, catching (and returning) the errors.
+
+    This is a class and not a closure so that it can be sent to the worker
+    processes of :func:`read_many`. Only the errors of the types in
+    ``catch`` are caught.
+    """
+    def __init__(self, reader, kwargs, catch=Exception):
+        self.reader = reader
+        self.kwargs = kwargs
+        self.catch = catch
+
+    def __call__(self, fname):
+        try:
+            return self.reader(fname, **self.kwargs), None
+        except self.catch as e:
+            return None, (isinstance(e, KeyError), str(e),
+                          traceback.format_exc())
+
+
+def _log_read_failure(fname, error):
+    is_key_error, message, tb = error
+    if is_key_error:
+        logging.warning(
+            "Error while processing {}: Missing key: {}".format(fname,
+                                                                message))
+        return
+    logging.warning(tb)
+    logging.warning("Error while processing {}: {}".format(fname, message))
+
+
+def _read_ahead(func, items, depth=1):
+    """Apply a function to items, ``depth`` items ahead of the consumer.
+
+    The function is called in a pool of ``depth`` threads, while the caller
+    works on the previous results. Results are yielded in order, and at most
+    ``depth`` of them are kept waiting.
+
+    Examples
+    --------
+    >>> list(_read_ahead(len, ['a', 'bb', 'ccc'], depth=2))
+    [1, 2, 3]
+    >>> list(_read_ahead(len, ['a', 'bb'], depth=0))
+    [1, 2]
+    """
+    items = iter(items)
+    if depth is None or depth < 1:
+        for item in items:
+            yield func(item)
+        return
+
+    pool = ThreadPool(depth)
+    pending = collections.deque()
+    try:
+        for item in six.moves.range(depth):
+            try:
+                pending.append(pool.apply_async(func, (next(items),)))
+            except StopIteration:
+                break
+        while pending:
+            result = pending.popleft().get()
+            # Start on the next item before handing this one over
+            try:
+                pending.append(pool.apply_async(func, (next(items),)))
+            except StopIteration:
+                pass
+            yield result
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+def _read_prefetched(fnames, reader, prefetcher, kwargs, depth,
+                     catch=Exception):
+    """Read files with ``prefetcher`` in threads, then with ``reader``.
+
+    ``reader`` is called in the current thread, receiving the output of
+    ``prefetcher`` as its ``prefetched`` argument.
+    """
+    fetched = _read_ahead(_FileReader(prefetcher, kwargs, catch), fnames,
+                          depth)
+    try:
+        for fname, (value, error) in six.moves.zip(fnames, fetched):
+            if error is not None:
+                yield None, error
+                continue
+            yield _FileReader(reader, dict(kwargs, prefetched=value),
+                              catch)(fname)
+    finally:
+        fetched.close()
+
+
+def read_many(fnames, jobs=None, reader=None, prefetch=None, prefetcher=None,
+              catch=Exception, **kwargs):
+    """Read many files, possibly in parallel.
+
+    Files are read in a pool of ``jobs`` processes, and the results are
+    yielded in the same order as the input file names. Errors are logged and
+    do not stop the reading of the other files, unless they are not of the
+    types in ``catch``.
+
+    Parameters
+    ----------
+    fnames : list of str
+        The input files
+
+    Other parameters
+    ----------------
+    jobs : int
+        Number of worker processes. If None or 1, files are read one by one
+        in the current process
+    reader : function
+        Function (or class) to call on each file, as ``reader(fname,
+        **kwargs)``. It must be importable at module level, to be sent to the
+        worker processes. Default :func:`read_data`
+    prefetch : int
+        When files are read in the current process, read this number of
+        files ahead, in background threads, while the previous ones are
+        being used. Ignored when ``jobs`` > 1, as the worker processes
+        already read ahead
+    prefetcher : function
+        Only used with ``prefetch``. Function doing the input part of
+        ``reader``, called in the background threads as ``prefetcher(fname,
+        **kwargs)``. Its output is passed to ``reader`` (called in the
+        current thread) as the ``prefetched`` keyword argument. By default,
+        all of ``reader`` runs in the background threads
+    catch : exception type or tuple of exception types
+        Only errors of these types are logged, and the file skipped. Other
+        errors are raised. Default: all errors
+    kwargs : dict
+        Additional keyword arguments passed to ``reader``
+
+    Yields
+    ------
+    result : object
+        The output of ``reader`` for each file, or None if the file could not
+        be read
+
+    Examples
+    --------
+    >>> results = list(read_many(['nonexistent.fits', 'nonexistent.hdf5'],
+    ...                          reader=root_name))
+    >>> results
+    ['nonexistent', 'nonexistent']
+    >>> results = list(read_many(['nonexistent.fits', 'nonexistent.hdf5'],
+    ...                          reader=root_name, prefetch=2))
+    >>> results
+    ['nonexistent', 'nonexistent']
+    >>> list(read_many(['nonexistent.fits'], reader=int))
+    [None]
+    >>> list(read_many(['nonexistent.fits'], reader=int, catch=IOError))
+    Traceback (most recent call last):
+        ...
+    ValueError: invalid literal for int() with base 10: 'nonexistent.fits'
+    """
+    fnames = list(fnames)
+    if reader is None:
+        reader = read_data
+    read_one = _FileReader(reader, kwargs, catch)
+    pool = None
+    if jobs is not None and jobs > 1 and len(fnames) > 1:
+        pool = multiprocessing.Pool(jobs)
+        results = pool.imap(read_one, fnames)
+    elif prefetch and prefetcher is not None:
+        results = _read_prefetched(fnames, reader, prefetcher, kwargs,
+                                   prefetch, catch)
+    elif prefetch:
+        results = _read_ahead(read_one, fnames, prefetch)
+    else:
+        results = six.moves.map(read_one, fnames)
+
+    try:
+        for fname, (result, error) in six.moves.zip(fnames, results):
+            if error is not None:
+                _log_read_failure(fname, error)
+            yield result
+    finally:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+        elif hasattr(results, 'close'):
+            # Stop the background threads, if any
+            results.close()
 
 
 def root_name(fname):
@@ -0,0 +1,235 @@
+"""Render diagnostic plots, possibly in background processes.
+
+The processing functions do not draw their diagnostic plots directly:
+they pass a plotting function and the (small) arrays to be drawn to a
+:class:`DiagnosticPlotter`, that renders them in a pool of worker processes
+and skips them if they are requested too often.
+"""
+from __future__ import (absolute_import, division,
+                        print_function)
+
+import atexit
+import logging
+import multiprocessing
+# Registers the exit handlers of multiprocessing, that stop the pools.
+# Importing it here makes sure that they run after those of the plotters
+import multiprocessing.util
+import time
+import traceback
+
+
+__all__ = ["DiagnosticPlotter", "get_plotter", "submit_plot",
+           "wait_for_plots"]
+
+
+def _render(func, args, kwargs):
+    """Call a plotting function, returning the traceback of any error."""
+    try:
+        func(*args, **kwargs)
+    except Exception:
+        return traceback.format_exc()
+    return None
+
+
+def _new_pool(processes):
+    """Start a pool of fresh worker processes.
+
+    The workers are not forked, as forking a process with running threads
+    (e.g. those reading the data in the background) is unsafe. Python 2
+    only has fork.
+    """
+    if hasattr(multiprocessing, 'get_context'):
+        return multiprocessing.get_context('spawn').Pool(processes)
+    return multiprocessing.Pool(processes)
+
+
+def _log_plot_failure(error):
+    logging.warning("Error while plotting diagnostics: {}".format(error))
+
+
+class DiagnosticPlotter(object):
+    """Render diagnostic plots, possibly in a pool of background processes.
+
+    The worker processes are stopped by :meth:`close`. Only the shared
+    plotter of :func:`get_plotter` is closed automatically at exit.
+
+    Parameters
+    ----------
+    jobs : int
+        Number of worker processes. If None or 0, plots are rendered
+        immediately in the current process
+    max_rate : float
+        Maximum number of plots per second, on average. Plots requested
+        more often are skipped. If None, all plots are rendered
+    max_pending : int
+        Maximum number of plots waiting to be rendered by the workers.
+        Further plots are skipped until the workers catch up
+
+    Attributes
+    ----------
+    skipped : int
+        The number of plots that were skipped
+
+    Examples
+    --------
+    >>> rendered = []
+    >>> plotter = DiagnosticPlotter(max_rate=1)
+    >>> plotter.submit(rendered.append, 1)
+    True
+    >>> plotter.submit(rendered.append, 2)
+    False
+    >>> rendered, plotter.skipped
+    ([1], 1)
+    """
+    def __init__(self, jobs=None, max_rate=None, max_pending=100):
+        self.jobs = jobs
+        self.max_rate = max_rate
+        self.max_pending = max_pending
+        self.skipped = 0
+        self._pool = None
+        self._pending = []
+        # Token bucket for the rate limit, allowing bursts of max_rate plots
+        self._capacity = None if max_rate is None else max(1, max_rate)
+        self._tokens = self._capacity
+        self._last_time = time.time()
+
+    def _use_pool(self):
+        # Daemonic processes (e.g. the workers of read_many) cannot start
+        # a pool of their own
+        return self.jobs is not None and self.jobs >= 1 and \
+            not multiprocessing.current_process().daemon
+
+    def _rate_exceeded(self):
+        if self.max_rate is None:
+            return False
+        now = time.time()
+        self._tokens = min(self._capacity,
+                           self._tokens +
+                           (now - self._last_time) * self.max_rate)
+        self._last_time = now
+        if self._tokens < 1:
+            return True
+        self._tokens -= 1
+        return False
+
+    def _collect(self, block=False):
+        """Log the errors of the finished plots and forget about them."""
+        still_pending = []
+        for result in self._pending:
+            if not block and not result.ready():
+                still_pending.append(result)
+                continue
+            error = result.get()
+            if error is not None:
+                _log_plot_failure(error)
+        self._pending = still_pending
+
+    def _skip(self, reason):
+        self.skipped += 1
+        logging.debug("Skipping diagnostic plot: {}".format(reason))
+        return False
+
+    def submit(self, func, *args, **kwargs):
+        """Render a plot, calling ``func(*args, **kwargs)``.
+
+        ``func`` must be importable at module level and its arguments must
+        be picklable, to be sent to the worker processes.
+
+        Returns
+        -------
+        accepted : bool
+            False if the plot was skipped because of the rate limit
+        """
+        if self._rate_exceeded():
+            return self._skip("more than {} plots per "
+                              "second".format(self.max_rate))
+
+        if not self._use_pool():
+            error = _render(func, args, kwargs)
+            if error is not None:
+                _log_plot_failure(error)
+            return True
+
+        self._collect()
+        if len(self._pending) >= self.max_pending:
+            return self._skip("{} plots are already "
+                              "waiting".format(len(self._pending)))
+
+        if self._pool is None:
+            self._pool = _new_pool(self.jobs)
+        self._pending.append(
+            self._pool.apply_async(_render, (func, args, kwargs)))
+        return True
+
+    def wait(self):
+        """Wait until all submitted plots are rendered."""
+        self._collect(block=True)
+
+    def close(self):
+        """Wait for the submitted plots and stop the worker processes."""
+        self.wait()
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+
+
+_PLOTTER = None
+# Plots are rendered in the background by default, so that the processing
+# does not wait for them
+DEFAULT_PLOT_JOBS = 1
+
+
+def _close_plotter():
+    """Render the pending plots of the shared plotter, at exit."""
+    if _PLOTTER is not None:
+        _PLOTTER.close()
+
+
+atexit.register(_close_plotter)
+
+
+def get_plotter(jobs=DEFAULT_PLOT_JOBS, max_rate=None):
+    """Get the diagnostic plotter with the given settings.
+
+    The same plotter is shared by all processing functions. If its settings
+    change, the previous plotter is closed after rendering its plots.
+
+    Parameters
+    ----------
+    jobs : int
+        Number of worker processes (see :class:`DiagnosticPlotter`). By
+        default, plots are rendered by one background process. If None or
+        0, they are rendered immediately
+    max_rate : float
+        Maximum number of plots per second (see :class:`DiagnosticPlotter`)
+
+    Returns
+    -------
+    plotter : :class:`DiagnosticPlotter`
+    """
+    global _PLOTTER
+    if _PLOTTER is not None:
+        if _PLOTTER.jobs == jobs and _PLOTTER.max_rate == max_rate:
+            return _PLOTTER
+        _PLOTTER.close()
+    _PLOTTER = DiagnosticPlotter(jobs=jobs, max_rate=max_rate)
+    return _PLOTTER
+
+
+def submit_plot(func, *args, **kwargs):
+    """Render a plot with the current diagnostic plotter.
+
+    If no plotter was configured with :func:`get_plotter`, the default
+    one is used.
+    """
+    plotter = _PLOTTER
+    if plotter is None:
+        plotter = get_plotter()
+    return plotter.submit(func, *args, **kwargs)
+
+
+def wait_for_plots():
+    """Wait until all submitted diagnostic plots are rendered."""
+    if _PLOTTER is not None:
+        _PLOTTER.wait()
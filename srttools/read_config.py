@@ -7,6 +7,9 @@ import glob
 import warnings
 import numpy as np
 import astropy.units as u
+
+from .plotter import DEFAULT_PLOT_JOBS
+
 # For Python 2 and 3 compatibility
 try:
     import configparser
@@ -66,16 +69,108 @@ pixel_size : 1
 ;; lines
 goodchans :
 
+;; Only read some of the feeds, IF chains or channels from the data files.
+;; If left empty, all are read
+;    select_feeds : 0 1
+;    select_ifs : 0
+;    select_chans : Feed0_LCP Feed1_LCP
+
+;; Interpolate the conversion of the feed coordinates from horizontal to
+;; equatorial, within this tolerance (in arcsec). If left empty, the exact
+;; conversion is calculated for every sample
+;    coordinate_tolerance : 0.1
+
+;; Map the data files in memory instead of reading them at once. Channels
+;; that need no rescaling are not copied in memory
+;    memmap : True
+
+;; Precision of counts and spectra: float32 (single) halves the memory
+;; needed by spectral data. Times and coordinates are always in float64
+;    precision : float32
+
+;; Format of the processed scans saved next to the data files: hdf5 (default)
+;; or npyscan, a directory of memory-mappable .npy files that loads faster
+;    scan_format : npyscan
+
+;; Options for the HDF5 files written by Scan.write and ScanSet.write.
+;; Compression can be gzip or lzf, optionally with the shuffle filter, and
+;; the data are stored in chunks of hdf5_chunk_rows rows. Columns can be
+;; converted to a different data type, using shell-style patterns
+;    hdf5_compression : gzip
+;    hdf5_shuffle : True
+;    hdf5_chunk_rows : 4096
+;    hdf5_dtypes :
+;        Feed*_?CP float32
+;        *-Temp float32
+
 [debugging]
 
 debug_file_format : pdf
 
+;; Render the diagnostic plots in the background, in this number of
+;; processes (default 1; with 0, plots are rendered as soon as they are
+;; produced), and at most this number of plots per second (the others are
+;; skipped). Scripts using srttools with background plots must protect their
+;; main code with ``if __name__ == '__main__':``, as the plotting processes
+;; import the main module
+;    debug_plot_jobs : 2
+;    debug_plot_rate : 5
+
     """
     with open(fname, 'w') as fobj:
         print(string, file=fobj)
     return fname
 
 
+def _read_selection(value, dtype=str):
+    """Read a list of feeds, IFs or channels from the config file.
+
+    Examples
+    --------
+    >>> _read_selection("0, 1  3", int)
+    [0, 1, 3]
+    >>> _read_selection("Feed0_LCP Feed0_RCP")
+    ['Feed0_LCP', 'Feed0_RCP']
+    >>> _read_selection("") is None
+    True
+    >>> _read_selection(None) is None
+    True
+    """
+    if value is None:
+        return None
+    values = value.replace(',', ' ').split()
+    if len(values) == 0:
+        return None
+    return [dtype(v) for v in values]
+
+
+def _read_column_dtypes(value):
+    """Read a list of column name patterns and data types.
+
+    Examples
+    --------
+    >>> _read_column_dtypes("\\nFeed* float32\\n*-Temp   f4")
+    [['Feed*', 'float32'], ['*-Temp', 'f4']]
+    >>> _read_column_dtypes("") is None
+    True
+    >>> _read_column_dtypes(None) is None
+    True
+    """
+    if value is None:
+        return None
+    dtypes = []
+    for line in value.splitlines():
+        if not line.strip():
+            continue
+        pattern, dtype = line.split()
+        # Fail early on unknown data types
+        np.dtype(dtype)
+        dtypes.append([pattern, dtype])
+    if len(dtypes) == 0:
+        return None
+    return dtypes
+
+
 def get_config_file():
     """Get the current config file."""
     return SRT_tools_config_file
@@ -123,6 +218,19 @@ def read_config(fname=None):
     config_output['noise_threshold'] = '5'
     config_output['smooth_window'] = '0.05'
     config_output['debug_file_format'] = 'pdf'
+    config_output['debug_plot_jobs'] = DEFAULT_PLOT_JOBS
+    config_output['debug_plot_rate'] = None
+    config_output['select_feeds'] = None
+    config_output['select_ifs'] = None
+    config_output['select_chans'] = None
+    config_output['coordinate_tolerance'] = None
+    config_output['memmap'] = None
+    config_output['precision'] = None
+    config_output['scan_format'] = 'hdf5'
+    config_output['hdf5_compression'] = None
+    config_output['hdf5_shuffle'] = None
+    config_output['hdf5_chunk_rows'] = None
+    config_output['hdf5_dtypes'] = None
 
     # --------------------------------------------------------------------
 
@@ -196,5 +304,66 @@ def read_config(fname=None):
     config_output['filtering_factor'] = \
         float(config_output['filtering_factor'])
 
+    if config_output['coordinate_tolerance'] in [None, '']:
+        config_output['coordinate_tolerance'] = None
+    else:
+        config_output['coordinate_tolerance'] = \
+            float(config_output['coordinate_tolerance'])
+
+    if config_output['memmap'] in [None, '']:
+        config_output['memmap'] = None
+    else:
+        config_output['memmap'] = \
+            config_output['memmap'].lower() in ['true', 'yes', 'on', '1']
+
+    precisions = {'single': 'float32', 'float32': 'float32',
+                  'double': 'float64', 'float64': 'float64'}
+    if config_output['precision'] in [None, '']:
+        config_output['precision'] = None
+    elif config_output['precision'].lower() in precisions:
+        config_output['precision'] = \
+            precisions[config_output['precision'].lower()]
+    else:
+        raise ValueError('Unknown precision: '
+                         '{}'.format(config_output['precision']))
+
+    if config_output['scan_format'] in [None, '']:
+        config_output['scan_format'] = 'hdf5'
+    if config_output['scan_format'] not in ['hdf5', 'npyscan']:
+        raise ValueError('Unknown scan format: '
+                         '{}'.format(config_output['scan_format']))
+
+    if config_output['hdf5_compression'] in [None, '']:
+        config_output['hdf5_compression'] = None
+    elif config_output['hdf5_compression'] not in ['gzip', 'lzf']:
+        raise ValueError('Unknown HDF5 compression: '
+                         '{}'.format(config_output['hdf5_compression']))
+
+    if config_output['hdf5_shuffle'] in [None, '']:
+        config_output['hdf5_shuffle'] = False
+    else:
+        config_output['hdf5_shuffle'] = \
+            config_output['hdf5_shuffle'].lower() in ['true', 'yes', 'on', '1']
+
+    if config_output['hdf5_chunk_rows'] in [None, '']:
+        config_output['hdf5_chunk_rows'] = None
+    else:
+        config_output['hdf5_chunk_rows'] = \
+            int(config_output['hdf5_chunk_rows'])
+
+    config_output['hdf5_dtypes'] = \
+        _read_column_dtypes(config_output['hdf5_dtypes'])
+
+    for key, dtype in zip(['debug_plot_jobs', 'debug_plot_rate'],
+                          [int, float]):
+        if config_output[key] in [None, '']:
+            config_output[key] = None
+        else:
+            config_output[key] = dtype(config_output[key])
+
+    for key, dtype in zip(['select_feeds', 'select_ifs', 'select_chans'],
+                          [int, int, str]):
+        config_output[key] = _read_selection(config_output[key], dtype)
+
     SRT_tools_config = config_output
     return config_output
@@ -3,12 +3,15 @@ from __future__ import (absolute_import, division,
                         print_function)
 
 from .io import read_data, root_name, get_chan_columns, get_channel_feed
+from .io import detect_data_kind, write_data_npyscan
+from .io import read_data_fitszilla_chunks, read_data_meta
+from .io import hdf5_write_options, cast_columns, write_hdf5_table
+from .io import counts_dtype, _json_default
 import glob
 from .read_config import read_config, get_config_file
 from .fit import ref_mad, contiguous_regions
 import os
 import numpy as np
-from scipy.signal import medfilt
 from astropy.table import Table, Column
 try:
     import matplotlib.pyplot as plt
@@ -19,15 +22,25 @@ except ImportError:
 
 from .fit import baseline_rough, baseline_als, linear_fun
 from .interactive_filter import select_data
-from .utils import jit, vectorize, HAS_NUMBA
+from .utils import jit, vectorize, HAS_NUMBA, running_median
+from .plotter import get_plotter, submit_plot, DEFAULT_PLOT_JOBS
 
 import warnings
 import logging
+import collections
+import copy
+import hashlib
+import itertools
+from multiprocessing.pool import ThreadPool
+import json
 import astropy.units as u
+from ._astropy_init import __version__
 
 
 __all__ = ["Scan", "interpret_frequency_range", "clean_scan_using_variability",
-           "list_scans"]
+           "clean_scans_using_variability", "list_scans",
+           "spectral_statistics", "fitszilla_spectral_statistics",
+           "processed_scan_key", "prefetch_scan"]
 
 
 if HAS_NUMBA:
@@ -158,32 +171,492 @@ def interpret_frequency_range(freqsplat, bandwidth, nbin):
     return freqmin, freqmax, binmin, binmax
 
 
-def _clean_dyn_spec(dynamical_spectrum, bad_intervals):
-    cleaned_dynamical_spectrum = dynamical_spectrum.copy()
+def _row_chunks(array, chunk_size=None):
+    """Iterate over chunks of consecutive rows of an array.
+
+    If ``chunk_size`` is None, chunks of about a million elements are used.
+
+    Examples
+    --------
+    >>> [len(c) for c in _row_chunks(np.zeros((10, 3)), 4)]
+    [4, 4, 2]
+    """
+    if chunk_size is None:
+        chunk_size = max(1, 2 ** 20 // max(1, np.prod(array.shape[1:])))
+    for start in range(0, len(array), chunk_size):
+        yield array[start:start + chunk_size]
+
+
+def spectral_statistics(chunks):
+    """Mean spectrum and spectral variability of a dynamical spectrum.
+
+    The statistics are accumulated over chunks of consecutive spectra,
+    merging the means and the sums of squared deviations of each chunk
+    (Chan, Golub & LeVeque 1979). Only one chunk at a time needs to be in
+    memory.
+
+    Parameters
+    ----------
+    chunks : iterable of 2-d arrays
+        Consecutive chunks of the dynamical spectrum, each containing M
+        spectra of N elements
+
+    Returns
+    -------
+    meanspec : array
+        The mean spectrum
+    spectral_var : array
+        The rms variability of each spectral bin, divided by the mean
+        spectrum
+
+    Examples
+    --------
+    >>> dynspec = np.random.RandomState(0).normal(10, 1, (100, 8))
+    >>> meanspec, var = spectral_statistics([dynspec[:30], dynspec[30:]])
+    >>> np.allclose(meanspec, np.mean(dynspec, axis=0))
+    True
+    >>> np.allclose(var, np.std(dynspec, axis=0) / meanspec)
+    True
+    """
+    nsamples = 0
+    meanspec = sqdev = None
+    for chunk in chunks:
+        chunk = np.asarray(chunk)
+        nchunk = len(chunk)
+        if nchunk == 0:
+            continue
+        chunk_mean = np.sum(chunk, axis=0, dtype=float) / nchunk
+        chunk_sqdev = np.sum((chunk - chunk_mean) ** 2, axis=0)
+        if meanspec is None:
+            meanspec, sqdev = chunk_mean, chunk_sqdev
+        else:
+            total = nsamples + nchunk
+            delta = chunk_mean - meanspec
+            meanspec = meanspec + delta * nchunk / total
+            sqdev = sqdev + chunk_sqdev + \
+                delta ** 2 * nsamples * nchunk / total
+        nsamples += nchunk
+
+    if meanspec is None:
+        raise ValueError('Empty dynamical spectrum')
+
+    return meanspec, np.sqrt(sqdev / nsamples) / meanspec
+
+
+def fitszilla_spectral_statistics(fname, chunk_size=4096, **kwargs):
+    """Mean spectrum and spectral variability of the channels of a file.
+
+    The file is read in chunks of consecutive spectra (see
+    :func:`srttools.io.read_data_fitszilla_chunks`), and the statistics of
+    all channels are accumulated over them with :func:`spectral_statistics`,
+    so that the memory needed depends on the chunk size and not on the
+    length of the scan.
+
+    Parameters
+    ----------
+    fname : str
+        The fitszilla file
+
+    Other parameters
+    ----------------
+    chunk_size : int
+        Number of spectra in each chunk
+    kwargs : dict
+        Additional keyword arguments (channel selection, data type), see
+        :func:`srttools.io.read_data_fitszilla`
+
+    Returns
+    -------
+    statistics : dict
+        The mean spectrum and the spectral variability (as returned by
+        :func:`spectral_statistics`) of each channel with spectral
+        information, by channel name
+    """
+    chunks = read_data_fitszilla_chunks(fname, chunk_size=chunk_size,
+                                        convert_coordinates=False, **kwargs)
+    try:
+        first = next(chunks, None)
+        if first is None:
+            return {}
+        chans = [ch for ch in get_chan_columns(first)
+                 if len(first[ch].shape) == 2]
+        if len(chans) == 0:
+            return {}
+
+        # Chunks of consecutive spectra, for all channels at once
+        meanspec, spectral_var = spectral_statistics(
+            np.stack([chunk[ch] for ch in chans], axis=1)
+            for chunk in itertools.chain([first], chunks))
+    finally:
+        chunks.close()
+
+    return dict((ch, (meanspec[i], spectral_var[i]))
+                for i, ch in enumerate(chans))
+
+
+def _fill_channels(nbin, bad_intervals):
+    """Channels used to fill the bad intervals of a dynamical spectrum.
+
+    Each channel of the cleaned spectrum is the mean of the channels
+    ``left`` and ``right`` of the original spectrum. Good channels map to
+    themselves; bad intervals are filled with the mean of the two channels
+    around them, or with the closest valid channel at the band edges.
+
+    Examples
+    --------
+    >>> left, right = _fill_channels(8, [[0, 2], [4, 6]])
+    >>> left
+    array([2, 2, 2, 3, 3, 3, 6, 7])
+    >>> right
+    array([2, 2, 2, 3, 6, 6, 6, 7])
+    """
+    left = np.arange(nbin)
+    right = np.arange(nbin)
     for b in bad_intervals:
         if b[0] == 0:
-            fill_lc = np.array(dynamical_spectrum[:, b[1]])
-        elif b[1] >= dynamical_spectrum.shape[1]:
-            fill_lc = np.array(dynamical_spectrum[:, b[0]])
+            left[b[0]:b[1]] = right[b[0]:b[1]] = b[1]
+        elif b[1] >= nbin:
+            left[b[0]:b[1]] = right[b[0]:b[1]] = b[0]
         else:
-            previous = np.array(dynamical_spectrum[:, b[0] - 1])
-            next_bin = np.array(dynamical_spectrum[:, b[1]])
-            fill_lc = (previous + next_bin) / 2
+            left[b[0]:b[1]] = b[0] - 1
+            right[b[0]:b[1]] = b[1]
+    return left, right
 
-        for bsub in range(b[0], np.min([b[1], dynamical_spectrum.shape[1]])):
-            cleaned_dynamical_spectrum[:, bsub] = fill_lc
-        if b[0] == 0 or b[1] >= dynamical_spectrum.shape[1]:
-            continue
+
+def _clean_dyn_spec(dynamical_spectrum, bad_intervals, freqmask=None,
+                    light_curve_only=False):
+    """Fill the bad intervals of a dynamical spectrum.
+
+    Parameters
+    ----------
+    dynamical_spectrum : 2-d array
+        Array of shape MxN, with M spectra of N elements each.
+    bad_intervals : list of ``[start, stop]`` pairs
+        Intervals of bad channels, as returned by
+        :func:`srttools.fit.contiguous_regions`
+
+    Other parameters
+    ----------------
+    freqmask : boolean array
+        Channels to sum in the light curve. Default all
+    light_curve_only : bool
+        Only return the light curve of the cleaned spectrum, without building
+        the cleaned spectrum
+
+    Returns
+    -------
+    cleaned : array
+        The cleaned dynamical spectrum or, if ``light_curve_only`` is True,
+        its light curve
+
+    Examples
+    --------
+    >>> dynspec = np.array([[1., 10., 3., 5.], [2., 10., 4., 6.]])
+    >>> _clean_dyn_spec(dynspec, [[1, 2]])
+    array([[1., 2., 3., 5.],
+           [2., 3., 4., 6.]])
+    >>> _clean_dyn_spec(dynspec, [[1, 2]], light_curve_only=True)
+    array([11., 15.])
+    """
+    nbin = dynamical_spectrum.shape[1]
+    left, right = _fill_channels(nbin, bad_intervals)
+    if light_curve_only:
+        if freqmask is None:
+            freqmask = np.ones(nbin, dtype=bool)
+        return _weighted_light_curve(
+            dynamical_spectrum,
+            _cleaned_spectrum_weights(freqmask, bad_intervals))
+
+    values = np.asarray(dynamical_spectrum)
+    if len(bad_intervals) == 0:
+        return values.copy()
+
+    # A single gather of all channels is much faster than assigning the
+    # bad channels in place. Good channels are unchanged, as (x + x) / 2 == x
+    cleaned_dynamical_spectrum = np.take(values, left, axis=1)
+    cleaned_dynamical_spectrum += np.take(values, right, axis=1)
+    cleaned_dynamical_spectrum /= 2
     return cleaned_dynamical_spectrum
 
 
+def _cleaned_spectrum_weights(freqmask, bad_intervals):
+    """Weights of the channels in the light curve of the cleaned spectrum.
+
+    Summing the cleaned dynamical spectrum (see :func:`_clean_dyn_spec`) over
+    the channels in ``freqmask`` is equivalent to a weighted sum of the
+    channels of the original dynamical spectrum, with these weights.
+
+    Examples
+    --------
+    >>> freqmask = np.array([0, 1, 1, 1, 1, 1, 1, 0], dtype=bool)
+    >>> bad_intervals = [[0, 2], [4, 6]]
+    >>> weights = _cleaned_spectrum_weights(freqmask, bad_intervals)
+    >>> np.allclose(weights, [0, 0, 2, 2, 0, 0, 2, 0])
+    True
+    """
+    nbin = len(freqmask)
+    left, right = _fill_channels(nbin, bad_intervals)
+    return (np.bincount(left[freqmask], minlength=nbin) +
+            np.bincount(right[freqmask], minlength=nbin)) / 2
+
+
+def _weighted_light_curve(dynamical_spectrum, weights):
+    """Weighted sum of the channels of a dynamical spectrum.
+
+    The spectrum is processed in chunks of rows, so that no temporary copy
+    of the full spectrum is created.
+
+    Parameters
+    ----------
+    dynamical_spectrum : array
+        Array of shape MxN, with M spectra of N elements each
+    weights : array
+        Array of N weights
+
+    Examples
+    --------
+    >>> dynspec = np.arange(12.).reshape(4, 3)
+    >>> _weighted_light_curve(dynspec, [1, 0, 2])
+    array([ 4., 13., 22., 31.])
+    """
+    values = np.asarray(dynamical_spectrum)
+    weights = np.asarray(weights, dtype=float)
+    return np.concatenate(
+        [np.dot(chunk, weights) for chunk in _row_chunks(values)])
+
+
+def _thread_map(func, iterable, jobs=None):
+    """Apply a function to all elements of an iterable, in threads.
+
+    The results are returned in the same order as the input. Numpy and
+    scipy release the GIL in most of the heavy numerical operations, so
+    that threads can run them concurrently without the overhead of sending
+    the data to other processes.
+
+    Parameters
+    ----------
+    func : function
+        The function to apply
+    iterable : iterable
+        The inputs
+
+    Other parameters
+    ----------------
+    jobs : int
+        Number of threads. If None or 1, run serially in the current thread
+
+    Examples
+    --------
+    >>> _thread_map(lambda x: x ** 2, range(5), jobs=3)
+    [0, 1, 4, 9, 16]
+    """
+    items = list(iterable)
+    if jobs is None or jobs <= 1 or len(items) <= 1:
+        return [func(item) for item in items]
+    pool = ThreadPool(min(jobs, len(items)))
+    try:
+        return pool.map(func, items)
+    finally:
+        pool.close()
+        pool.join()
+
+
+class _CleaningResults(object):
+    """Results of :func:`clean_scans_using_variability` for one channel.
+
+    A module-level class, so that the results can be sent to the processes
+    rendering the diagnostic plots.
+    """
+    pass
+
+
+def clean_scans_using_variability(dynamical_spectra, length, bandwidth,
+                                  good_mask=None, freqsplat=None,
+                                  noise_threshold=5., nofilt=False,
+                                  smoothing_window=0.05, save_spectrum=False,
+                                  jobs=None, statistics=None):
+    """Clean the dynamical spectra of many channels at once.
+
+    This is the engine of :func:`clean_scan_using_variability`. The
+    channels must share the same bandwidth and number of spectral bins. The
+    statistics and light curves are accumulated channel by channel, from
+    the dynamical spectra as they are, while the baselines, thresholds and
+    masks of all channels are calculated in the same vectorized operations
+    on the (small) spectral statistics. The dynamical spectra are never
+    stacked in a new array.
+
+    Parameters
+    ----------
+    dynamical_spectra : 3-d array or list of 2-d arrays
+        Array of shape CxMxN, or list of C arrays (e.g. the columns of a
+        table), with the M spectra of N elements of each of the C channels.
+    length : float
+        Duration in seconds of the scan (assumed to have constant sample time)
+    bandwidth : float
+        Bandwidth in MHz
+
+    Other parameters
+    ----------------
+    good_mask : boolean array
+        this mask specifies spectral bins that should never be discarded as
+        RFI, for example because they contain spectral lines
+    freqsplat : str
+        List of frequencies to be merged into one. See
+        :func:`srttools.scan.interpret_frequency_range`
+    noise_threshold : float
+        The threshold, in sigmas, over which a given channel is
+        considered noisy
+    nofilt : bool
+        Do not filter noisy channels (set noise_threshold to 1e32)
+    smoothing_window : float
+        Width of smoothing window, in fraction of spectral length
+    save_spectrum : bool
+        Return the cleaned dynamical spectra
+    jobs : int
+        Fit the baselines of the light curves of this number of channels
+        concurrently, in threads
+    statistics : list of tuples
+        The mean spectrum and the spectral variability of each channel, as
+        returned by :func:`spectral_statistics` (e.g. accumulated while
+        reading the file in chunks, see
+        :func:`fitszilla_spectral_statistics`). If None, they are
+        calculated from the dynamical spectra
+
+    Returns
+    -------
+    results : list of objects
+        One per channel, as returned by :func:`clean_scan_using_variability`.
+
+    Examples
+    --------
+    >>> dynspec = np.random.RandomState(0).normal(10, 0.1, (2, 50, 64))
+    >>> dynspec[1, :, 20] += np.random.RandomState(1).normal(0, 5, 50)
+    >>> results = clean_scans_using_variability(dynspec, 10, 500)
+    >>> bool(results[0].mask[20]), bool(results[1].mask[20])
+    (True, False)
+    """
+    try:
+        bandwidth = bandwidth.value
+    except AttributeError:
+        pass
+
+    # Views of the data of each channel, with no copies
+    dynamical_spectra = [np.asarray(spec) for spec in dynamical_spectra]
+    nchan = len(dynamical_spectra)
+    dynspec_len, nbin = dynamical_spectra[0].shape
+    for spec in dynamical_spectra:
+        if spec.shape != (dynspec_len, nbin):
+            raise ValueError('All dynamical spectra must have the same '
+                             'shape')
+
+    times = length * np.arange(dynspec_len) / dynspec_len
+
+    # Calculate spectral variability curves, accumulating the statistics
+    # over chunks of consecutive spectra of each channel
+
+    if statistics is None:
+        statistics = _thread_map(
+            lambda spec: spectral_statistics(_row_chunks(spec)),
+            dynamical_spectra, jobs=jobs)
+    meanspec = np.array([stats[0] for stats in statistics])
+    spectral_var = np.array([stats[1] for stats in statistics])
+
+    # Mask frequencies -- avoid those excluded from splat
+
+    freqmask = np.ones(nbin, dtype=bool)
+    freqmin, freqmax, binmin, binmax = \
+        interpret_frequency_range(freqsplat, bandwidth, nbin)
+    freqmask[0:binmin] = False
+    freqmask[binmax:] = False
+
+    # Set up corrected spectral var
+
+    mod_spectral_var = spectral_var.copy()
+    mod_spectral_var[:, 0:binmin] = spectral_var[:, binmin:binmin + 1]
+    mod_spectral_var[:, binmax:] = spectral_var[:, binmax:binmax + 1]
+
+    # Some statistical information on spectral var
+
+    stdref = ref_mad(mod_spectral_var[:, freqmask], 20, axis=-1)
+
+    # Calculate baseline of spectral var ---------------
+    # Empyrical formula, with no physical meaning
+
+    smoothing_window_int = int(nbin * smoothing_window) // 2 * 2 + 1
+    smoothing_window_int = np.max([smoothing_window_int, 11])
+    # Each channel is filtered independently
+    baseline = running_median(mod_spectral_var[:, binmin:binmax],
+                              smoothing_window_int)
+
+    baseline = \
+        np.concatenate((np.zeros((nchan, binmin)) + baseline[:, :1],
+                        baseline,
+                        np.zeros((nchan, nbin - binmax)) + baseline[:, -1:]
+                        ), axis=1)
+
+    # Set threshold
+
+    if nofilt:
+        mask = np.ones_like(spectral_var, dtype=bool)
+    else:
+        threshold = baseline + noise_threshold * stdref[:, np.newaxis]
+        mask = spectral_var < threshold
+        threshold = baseline - noise_threshold * stdref[:, np.newaxis]
+        mask = mask & (spectral_var > threshold)
+
+    wholemask = freqmask & mask
+
+    if good_mask is not None:
+        wholemask[:, good_mask] = 1
+        if nofilt:
+            # Without filtering, the bins in good_mask are also summed in
+            # the light curves, even if outside the frequency range
+            freqmask[good_mask] = 1
+
+    all_bad_intervals = [contiguous_regions(np.logical_not(m))
+                         for m in wholemask]
+
+    def finish_channel(i):
+        # Calculate the light curve of the cleaned dynamical spectrum,
+        # directly from the original one
+        weights = _cleaned_spectrum_weights(freqmask, all_bad_intervals[i])
+        lc_corr = _weighted_light_curve(dynamical_spectra[i], weights)
+        if len(lc_corr) > 10:
+            lc_corr = baseline_als(times, lc_corr, outlier_purging=False)
+        else:
+            lc_corr -= np.median(lc_corr)
+
+        results = _CleaningResults()
+        results.lc = lc_corr
+        results.freqmin = freqmin * u.MHz
+        results.freqmax = freqmax * u.MHz
+        results.mask = wholemask[i]
+        results.spectrum = None
+        if save_spectrum:
+            results.spectrum = \
+                _clean_dyn_spec(dynamical_spectra[i], all_bad_intervals[i])
+
+        # Intermediate products, used in the diagnostic plots
+        results.meanspec = meanspec[i]
+        results.spectral_var = spectral_var[i]
+        results.baseline = baseline[i]
+        results.stdref = stdref[i]
+        results.varmask = mask[i]
+        results.freqmask = freqmask
+        results.bad_intervals = all_bad_intervals[i]
+        return results
+
+    return _thread_map(finish_channel, range(nchan), jobs=jobs)
+
+
 def clean_scan_using_variability(dynamical_spectrum, length, bandwidth,
                                  good_mask=None, freqsplat=None,
                                  noise_threshold=5., debug=True, nofilt=False,
                                  outfile="out", label="",
                                  smoothing_window=0.05,
                                  debug_file_format='pdf',
-                                 info_string="Empty info string"):
+                                 info_string="Empty info string",
+                                 save_spectrum=False):
     """Clean a spectroscopic scan using the difference of channel variability.
 
     From the dynamical spectrum, i.e. the list of spectra obtained in each
@@ -229,6 +702,11 @@ def clean_scan_using_variability(dynamical_spectrum, length, bandwidth,
         Label to append to the filename (outfile_label.png)
     smoothing_window : float
         Width of smoothing window, in fraction of spectral length
+    save_spectrum : bool
+        Return the cleaned dynamical spectrum. Otherwise, unless diagnostic
+        plots are produced, it is never created and the analysis only needs
+        memory proportional to the number of spectral bins, in addition to
+        the light curves.
 
     Returns
     -------
@@ -241,18 +719,17 @@ def clean_scan_using_variability(dynamical_spectrum, length, bandwidth,
             Minimum frequency in MHz, referred to local oscillator
         freqmax : float
             Maximum frequency in MHz, referred to local oscillator
+        mask : array-like
+            The channels that were not flagged as RFI
+        spectrum : 2-d array or None
+            The cleaned dynamical spectrum, if ``save_spectrum`` is True
 
     See Also
     --------
+    clean_scans_using_variability
     srttools.fit.baseline_als
     srttools.fit.ref_mad
     """
-    try:
-        bandwidth_unit = bandwidth.unit
-        bandwidth = bandwidth.value
-    except AttributeError:
-        bandwidth_unit = u.MHz
-
     if len(dynamical_spectrum.shape) == 1:
         if not debug or not HAS_MPL:
             return None
@@ -273,130 +750,178 @@ def clean_scan_using_variability(dynamical_spectrum, length, bandwidth,
         plt.close(fig)
         return None
 
-    dynspec_len, nbin = dynamical_spectrum.shape
-
-    # Calculate first light curve
-
-    times = length * np.arange(dynspec_len) / dynspec_len
-    lc = np.sum(dynamical_spectrum, axis=1)
-    if len(lc) > 10:
-        lc = baseline_als(times, lc)
-    else:
-        lc -= np.median(lc)
-    lcbins = np.arange(len(lc))
-
-    # Calculate spectral variability curve
-
-    meanspec = np.sum(dynamical_spectrum, axis=0) / dynspec_len
-    spectral_var = \
-        np.sqrt(np.sum((dynamical_spectrum - meanspec) ** 2,
-                       axis=0) / dynspec_len) / meanspec
-
-    df = bandwidth / len(meanspec)
-    allbins = np.arange(len(meanspec)) * df
-
-    # Mask frequencies -- avoid those excluded from splat
-
-    freqmask = np.ones(len(meanspec), dtype=bool)
-    freqmin, freqmax, binmin, binmax = \
-        interpret_frequency_range(freqsplat, bandwidth, nbin)
-    freqmask[0:binmin] = False
-    freqmask[binmax:] = False
-
-    # Calculate the variability image
-
-    varimg = np.sqrt((dynamical_spectrum - meanspec) ** 2) / meanspec
-
-    # Set up corrected spectral var
-
-    mod_spectral_var = spectral_var.copy()
-    mod_spectral_var[0:binmin] = spectral_var[binmin]
-    mod_spectral_var[binmax:] = spectral_var[binmax]
-
-    # Some statistical information on spectral var
+    results = clean_scans_using_variability(
+        np.asarray(dynamical_spectrum)[np.newaxis], length, bandwidth,
+        good_mask=good_mask, freqsplat=freqsplat,
+        noise_threshold=noise_threshold, nofilt=nofilt,
+        smoothing_window=smoothing_window, save_spectrum=save_spectrum)[0]
+
+    if debug and HAS_MPL:
+        submit_plot(_plot_variability,
+                    _variability_plot_data(dynamical_spectrum, results),
+                    length, bandwidth,
+                    noise_threshold=noise_threshold, outfile=outfile,
+                    label=label, debug_file_format=debug_file_format,
+                    info_string=info_string)
+    return results
 
-    # median_spectral_var = np.median(mod_spectral_var[freqmask])
-    stdref = ref_mad(mod_spectral_var[freqmask], 20)
 
-    # Calculate baseline of spectral var ---------------
-    # Empyrical formula, with no physical meaning
+class _VariabilityPlotData(object):
+    """Data of the diagnostic plots of :func:`_plot_variability`.
 
-    smoothing_window_int = int(nbin * smoothing_window) // 2 * 2 + 1
-    smoothing_window_int = np.max([smoothing_window_int, 11])
-    baseline = medfilt(mod_spectral_var[binmin:binmax],
-                       smoothing_window_int)
+    A module-level class, so that it can be sent to the processes rendering
+    the plots.
+    """
+    pass
 
-    baseline = \
-        np.concatenate((np.zeros(binmin) + baseline[0],
-                        baseline,
-                        np.zeros(nbin - binmax) + baseline[-1]
-                        ))
 
-    # Set threshold
+def _block_mean(image, factor, axis):
+    """Average blocks of ``factor`` consecutive elements along an axis.
 
-    if nofilt:
-        wholemask = freqmask
-    else:
-        threshold = baseline + noise_threshold * stdref
-        mask = spectral_var < threshold
-        threshold = baseline - noise_threshold * stdref
-        mask = mask & (spectral_var > threshold)
+    Examples
+    --------
+    >>> _block_mean(np.arange(10.).reshape(5, 2), 2, 0)
+    array([[1., 2.],
+           [5., 6.],
+           [8., 9.]])
+    """
+    if factor <= 1:
+        return image
+    length = image.shape[axis]
+    starts = np.arange(0, length, factor)
+    counts = np.diff(np.append(starts, length))
+    shape = [1] * image.ndim
+    shape[axis] = len(counts)
+    means = np.add.reduceat(image, starts, axis=axis) / counts.reshape(shape)
+    return means.astype(image.dtype, copy=False)
+
+
+def _variability_plot_data(dynamical_spectrum, results,
+                           max_shape=(1000, 2000)):
+    """Prepare the data of the diagnostic plots of a channel.
+
+    This runs in the process that cleaned the data, so that only small
+    arrays are sent to the processes rendering the plots: the light
+    curves, the statistics of the cleaned spectrum, and the variability
+    images, averaged in blocks of consecutive spectra and spectral bins to
+    at most ``max_shape`` pixels. The dynamical spectrum is processed in
+    chunks of rows.
 
-        wholemask = freqmask & mask
+    Parameters
+    ----------
+    dynamical_spectrum : 2-d array
+        Array of shape MxN, with M spectra of N elements each
+    results : object
+        The results of :func:`clean_scans_using_variability` for this
+        channel
 
-    if good_mask is None:
-        good_mask = np.zeros_like(freqmask, dtype=bool)
-    wholemask[good_mask] = 1
+    Other parameters
+    ----------------
+    max_shape : (int, int)
+        The maximum shape of the variability images
 
-    # Calculate frequency-masked lc
-    lc_masked = np.sum(dynamical_spectrum[:, freqmask], axis=1)
-    # lc_masked = baseline_als(times, lc_masked, outlier_purging=False)
-    if len(lc_masked) > 10:
-        lc_masked = baseline_als(times, lc_masked, outlier_purging=False)
+    Returns
+    -------
+    data : object
+        The input of :func:`_plot_variability`
+    """
+    values = np.asarray(dynamical_spectrum)
+    dynspec_len, nbin = values.shape
+
+    data = _VariabilityPlotData()
+    data.dynspec_len = dynspec_len
+    # The cleaned spectrum is never needed by the plots
+    data.results = copy.copy(results)
+    data.results.spectrum = None
+    if dynspec_len < 10:
+        # Too few spectra for the images. All of them are plotted
+        data.spectra = values.copy()
+        return data
+
+    freqmask = results.freqmask
+    bad_intervals = results.bad_intervals
+    data.lc = _weighted_light_curve(values, np.ones(nbin))
+    data.lc_masked = _weighted_light_curve(values, freqmask)
+
+    row_factor = int(np.ceil(dynspec_len / max_shape[0]))
+    bin_factor = int(np.ceil(nbin / max_shape[1]))
+    # Chunks of whole blocks of rows
+    chunk_size = row_factor * max(1, 2 ** 20 // (nbin * row_factor))
+
+    data.cleaned_meanspec, data.cleaned_spectral_var = spectral_statistics(
+        _clean_dyn_spec(chunk, bad_intervals)
+        for chunk in _row_chunks(values, chunk_size))
+
+    # Calculate the variability images, in the precision of the spectrum
+    dtype = np.result_type(values.dtype, np.float32)
+    meanspec = results.meanspec.astype(dtype)
+    cleaned_meanspec = np.abs(data.cleaned_meanspec.astype(dtype))
+    varimg, cleaned_varimg = [], []
+    total = total_sq = 0.
+    for chunk in _row_chunks(values, chunk_size):
+        image = np.abs(chunk - meanspec) / meanspec
+        varimg.append(_block_mean(_block_mean(image, row_factor, 0),
+                                  bin_factor, 1))
+        image = np.abs(_clean_dyn_spec(chunk, bad_intervals) -
+                       data.cleaned_meanspec.astype(dtype)) / \
+            cleaned_meanspec
+        cleaned_varimg.append(_block_mean(_block_mean(image, row_factor, 0),
+                                          bin_factor, 1))
+        # The color scale is set by the full-resolution cleaned image
+        selected = image[:, freqmask].astype(float)
+        total += np.sum(selected)
+        total_sq += np.sum(selected ** 2)
+
+    data.varimg = np.concatenate(varimg)
+    data.cleaned_varimg = np.concatenate(cleaned_varimg)
+    count = dynspec_len * np.count_nonzero(freqmask)
+    if count == 0:
+        data.mean_varimg = data.std_varimg = np.nan
     else:
-        lc_masked -= np.median(lc_masked)
-
-    bad_intervals = contiguous_regions(np.logical_not(wholemask))
+        data.mean_varimg = total / count
+        data.std_varimg = \
+            np.sqrt(max(total_sq / count - data.mean_varimg ** 2, 0))
+    return data
 
-    # Calculate cleaned dynamical spectrum
 
-    cleaned_dynamical_spectrum = \
-        _clean_dyn_spec(dynamical_spectrum, bad_intervals)
+def _plot_variability(data, length, bandwidth, noise_threshold=5.,
+                      outfile="out", label="", debug_file_format='pdf',
+                      info_string="Empty info string"):
+    """Plot the diagnostics of :func:`clean_scans_using_variability`.
 
-    cleaned_meanspec = \
-        np.sum(cleaned_dynamical_spectrum,
-               axis=0) / len(cleaned_dynamical_spectrum)
-    cleaned_varimg = \
-        np.sqrt((cleaned_dynamical_spectrum - cleaned_meanspec) ** 2 /
-                cleaned_meanspec ** 2)
-    cleaned_spectral_var = \
-        np.sqrt(np.sum((cleaned_dynamical_spectrum - cleaned_meanspec) ** 2,
-                       axis=0) / dynspec_len) / cleaned_meanspec
-
-    mean_varimg = np.mean(cleaned_varimg[:, freqmask])
-    std_varimg = np.std(cleaned_varimg[:, freqmask])
+    ``data`` is prepared by :func:`_variability_plot_data`.
+    """
+    try:
+        bandwidth_unit = bandwidth.unit
+        bandwidth = bandwidth.value
+    except AttributeError:
+        bandwidth_unit = u.MHz
 
-    lc_corr = np.sum(cleaned_dynamical_spectrum[:, freqmask], axis=1)
-    if len(lc_corr) > 10:
-        lc_corr = baseline_als(times, lc_corr, outlier_purging=False)
-    else:
-        lc_corr -= np.median(lc_corr)
+    results = data.results
+    dynspec_len = data.dynspec_len
+    times = length * np.arange(dynspec_len) / dynspec_len
 
-    results = type('test', (), {})()  # create empty object
-    results.lc = lc_corr
-    results.freqmin = freqmin * u.MHz
-    results.freqmax = freqmax * u.MHz
-    results.mask = wholemask
+    lc_corr = results.lc
+    meanspec = results.meanspec
+    spectral_var = results.spectral_var
+    baseline = results.baseline
+    stdref = results.stdref
+    mask = results.varmask
+    freqmask = results.freqmask
+    wholemask = results.mask
+    bad_intervals = results.bad_intervals
+    freqmin = results.freqmin.value
+    freqmax = results.freqmax.value
 
-    if not debug or not HAS_MPL:
-        return results
+    df = bandwidth / len(meanspec)
+    allbins = np.arange(len(meanspec)) * df
 
     # Now, PLOT IT ALL --------------------------------
     # Prepare subplots
     fig = plt.figure("{}_{}".format(outfile, label), figsize=(15, 15))
 
-    if len(lc_corr) < 10:
-        for i in dynamical_spectrum:
+    if dynspec_len < 10:
+        for i in data.spectra:
             plt.plot(allbins[1:], i[1:])
 
         plt.plot(allbins[1:], meanspec[1:])
@@ -408,7 +933,30 @@ def clean_scan_using_variability(dynamical_spectrum, length, bandwidth,
                 transform=ax.transAxes, fontsize=20)
         plt.savefig("{}_{}.{}".format(outfile, label, debug_file_format))
         plt.close(fig)
-        return results
+        return
+
+    # Calculate first light curve
+
+    lc = data.lc
+    if len(lc) > 10:
+        lc = baseline_als(times, lc)
+    else:
+        lc = lc - np.median(lc)
+    lcbins = np.arange(len(lc))
+
+    # Calculate frequency-masked lc
+    lc_masked = data.lc_masked
+    if len(lc_masked) > 10:
+        lc_masked = baseline_als(times, lc_masked, outlier_purging=False)
+    else:
+        lc_masked = lc_masked - np.median(lc_masked)
+
+    varimg = data.varimg
+    cleaned_varimg = data.cleaned_varimg
+    cleaned_meanspec = data.cleaned_meanspec
+    cleaned_spectral_var = data.cleaned_spectral_var
+    mean_varimg = data.mean_varimg
+    std_varimg = data.std_varimg
 
     gs = GridSpec(4, 3, hspace=0, wspace=0,
                   height_ratios=(1.5, 1.5, 1.5, 1.5),
@@ -446,14 +994,14 @@ def clean_scan_using_variability(dynamical_spectrum, length, bandwidth,
                       vmin=mean_varimg - 5 * std_varimg,
                       vmax=mean_varimg + 5 * std_varimg,
                       extent=(0, bandwidth,
-                              0, varimg.shape[0]), interpolation='none')
+                              0, dynspec_len), interpolation='none')
 
     ax_cleanspec.imshow(cleaned_varimg, origin="lower", aspect='auto',
                         cmap=cmap,
                         vmin=mean_varimg - 5 * std_varimg,
                         vmax=mean_varimg + 5 * std_varimg,
                         extent=(0, bandwidth,
-                                0, varimg.shape[0]), interpolation='none')
+                                0, dynspec_len), interpolation='none')
 
     # Plot variability
 
@@ -484,7 +1032,7 @@ def clean_scan_using_variability(dynamical_spectrum, length, bandwidth,
     for b in bad_intervals:
         maxsp = np.max(meanspec)
         ax_meanspec.plot(b * df, [maxsp] * 2, color='k', lw=2)
-        middleimg = [varimg.shape[0] / 2]
+        middleimg = [dynspec_len / 2]
         ax_dynspec.plot(b * df, [middleimg] * 2, color='k', lw=2)
         maxsp = np.max(spectral_var)
         ax_var.plot(b * df, [maxsp] * 2, color='k', lw=2)
@@ -511,7 +1059,15 @@ def clean_scan_using_variability(dynamical_spectrum, length, bandwidth,
     plt.savefig(
         "{}_{}.{}".format(outfile, label, debug_file_format))
     plt.close(fig)
-    return results
+
+
+def _plot_baseline_subtraction(time, before, after, outfile, label="Sub"):
+    """Plot a light curve before and after the baseline subtraction."""
+    fig = plt.figure(label)
+    plt.plot(time, before - np.min(before), alpha=0.5)
+    plt.plot(time, after)
+    plt.savefig(outfile)
+    plt.close(fig)
 
 
 def frequency_filter(dynamical_spectrum, mask):
@@ -549,34 +1105,200 @@ def list_scans(datadir, dirlist):
     return scan_list
 
 
+# Config keys that change the content of a processed scan
+PROCESSING_CONFIG_KEYS = ['select_feeds', 'select_ifs', 'select_chans',
+                          'coordinate_tolerance', 'noise_threshold',
+                          'smooth_window', 'filtering_factor', 'goodchans',
+                          'precision', 'hdf5_dtypes']
+
+
+def _file_hash(fname, block_size=1048576):
+    """SHA-1 hex digest of the content of a file, read in blocks."""
+    sha = hashlib.sha1()
+    with open(fname, 'rb') as fobj:
+        for block in iter(lambda: fobj.read(block_size), b''):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+def _file_stamp(fname):
+    """Size and modification time of a file, as a string."""
+    stat = os.stat(fname)
+    return '{}-{:.6f}'.format(stat.st_size, stat.st_mtime)
+
+
+def _parameters_hash(parameters):
+    """SHA-1 hex digest of the processing parameters and srttools version."""
+    canonical = json.dumps([__version__, parameters], sort_keys=True,
+                           default=_json_default)
+    return hashlib.sha1(canonical.encode('utf-8')).hexdigest()
+
+
+def processed_scan_key(fname, parameters):
+    """Key identifying the processing of a given input file.
+
+    The key is built from the content of the input file, a canonical
+    representation of the processing parameters and the version of
+    srttools. Processed scans store it in ``meta['cache_key']``, and they
+    are reused only if the key is unchanged (see :func:`prefetch_scan`).
+
+    Parameters
+    ----------
+    fname : str
+        The input file
+    parameters : dict
+        The processing parameters
+
+    Returns
+    -------
+    key : str
+        A string like ``<file hash>-<parameter hash>``
+
+    Examples
+    --------
+    >>> fname = 'bubu_cache_key.txt'
+    >>> with open(fname, 'w') as fobj:
+    ...     _ = fobj.write('bubu')
+    >>> key0 = processed_scan_key(fname, {'a': 1, 'b': np.array([1, 2])})
+    >>> key1 = processed_scan_key(fname, {'b': np.array([1, 2]), 'a': 1})
+    >>> key0 == key1
+    True
+    >>> key0 == processed_scan_key(fname, {'a': 2, 'b': np.array([1, 2])})
+    False
+    >>> os.utime(fname, (0, 0))
+    >>> key0 == processed_scan_key(fname, {'a': 1, 'b': np.array([1, 2])})
+    True
+    >>> with open(fname, 'w') as fobj:
+    ...     _ = fobj.write('buba')
+    >>> key0 == processed_scan_key(fname, {'a': 1, 'b': np.array([1, 2])})
+    False
+    >>> os.unlink(fname)
+    """
+    return '{}-{}'.format(_file_hash(fname), _parameters_hash(parameters))
+
+
+def _is_up_to_date(meta, fname, parameters):
+    """Check if a processed scan, with this meta, can be reused.
+
+    The content of the input file is only hashed if its size or
+    modification time changed since the scan was processed.
+    """
+    key = meta.get('cache_key')
+    if key is None or \
+            not key.endswith('-' + _parameters_hash(parameters)):
+        return False
+    if meta.get('cache_stamp') == _file_stamp(fname):
+        return True
+    return key == processed_scan_key(fname, parameters)
+
+
+def _processing_parameters(config, freqsplat=None, nofilt=False,
+                           nosub=False, avoid_regions=None):
+    """Collect the parameters that change the content of a processed scan."""
+    parameters = dict((key, config[key]) for key in PROCESSING_CONFIG_KEYS)
+    parameters.update({'freqsplat': freqsplat, 'nofilt': nofilt,
+                       'nosub': nosub})
+    if not nosub:
+        parameters['avoid_regions'] = avoid_regions
+    return parameters
+
+
+def prefetch_scan(fname, config_file=None, norefilt=True, freqsplat=None,
+                  nofilt=False, nosub=False, avoid_regions=None, **kwargs):
+    """Read the data needed to create a `Scan` from a file.
+
+    This is the input stage of `Scan`: the data are read from an existing
+    processed scan, if it is up to date (see :func:`processed_scan_key`),
+    or from the original file, with the feed and channel selection of the
+    config file. The output can be passed to `Scan` as ``prefetched``, so
+    that the next scans can be read (e.g. in a background thread) while
+    one is processed.
+
+    Parameters
+    ----------
+    fname : str
+        The input file
+    config_file : str
+        The config file. Default: the last one read
+
+    Other Parameters
+    ----------------
+    norefilt, freqsplat, nofilt, nosub, avoid_regions :
+        See `Scan`
+    kwargs : additional arguments
+        Other arguments of `Scan`, ignored
+
+    Returns
+    -------
+    fname : str
+        The file that was actually read
+    table : `astropy.table.Table`
+        The data
+    """
+    if config_file is None:
+        config_file = get_config_file()
+    config = read_config(config_file)
+    table = None
+    if detect_data_kind(fname) == 'fitszilla':
+        h5name = root_name(fname) + '.' + config['scan_format']
+        if os.path.exists(h5name) and norefilt:
+            # but only if it was obtained from the same data, with
+            # the same parameters. Only the meta is read for the check
+            parameters = _processing_parameters(
+                config, freqsplat=freqsplat, nofilt=nofilt, nosub=nosub,
+                avoid_regions=avoid_regions)
+            if _is_up_to_date(read_data_meta(h5name), fname, parameters):
+                fname = h5name
+                table = read_data(h5name, memmap=config['memmap'])
+            else:
+                logging.info('{} is outdated. Processing {} '
+                             'again'.format(h5name, fname))
+    if table is None:
+        table = read_data(fname, feeds=config['select_feeds'],
+                          ifs=config['select_ifs'],
+                          chans=config['select_chans'],
+                          coordinate_tolerance=config['coordinate_tolerance'],
+                          memmap=config['memmap'],
+                          dtype=config['precision'])
+    return fname, table
+
+
 class Scan(Table):
     """Class containing a single scan."""
 
     def __init__(self, data=None, config_file=None, norefilt=True,
                  interactive=False, nosave=False, debug=False,
                  freqsplat=None, nofilt=False, nosub=False, avoid_regions=None,
-                 save_spectrum=False, **kwargs):
+                 save_spectrum=False, jobs=None, prefetched=None,
+                 **kwargs):
         """Load a Scan object
 
         Parameters
         ----------
         data : str or None
             data can be one of the following: None, in which case an empty Scan
-            object is created; a FITS or HDF5 archive, containing an on-the-fly
-            or cross scan in one of the accepted formats; another `Scan` or
-            `astropy.Table` object
+            object is created; a FITS or HDF5 archive, or a ``.npyscan``
+            directory, containing an on-the-fly or cross scan in one of the
+            accepted formats; another `Scan` or `astropy.Table` object
         config_file : str
             Config file containing the parameters for the images and the
             directories containing the image and calibration data
         norefilt : bool
             If an HDF5 archive is present with the same basename as the input
-            FITS file, do not re-run the filtering (default True)
+            FITS file, and it was produced from the same file and with the
+            same parameters (see :func:`processed_scan_key`), do not re-run
+            the filtering (default True)
         freqsplat : str
             See :class:`srttools.scan.interpret_frequency_range`
         nofilt : bool
             See :class:`srttools.scan.clean_scan_using_variability`
         nosub : bool
             Do not run the baseline subtraction.
+        jobs : int
+            Process this number of channels concurrently, in threads (see
+            :meth:`clean_and_splat` and :meth:`baseline_subtract`)
+        prefetched : tuple
+            The data of the file, as already read by :func:`prefetch_scan`
 
         Other Parameters
         ----------------
@@ -586,34 +1308,52 @@ class Scan(Table):
         if config_file is None:
             config_file = get_config_file()
 
-        if isinstance(data, Table):
+        if isinstance(data, (Table, collections.Mapping)):
+            # Mappings of columns are also used when unpickling, e.g. when
+            # scans are loaded by worker processes
             Table.__init__(self, data, **kwargs)
         elif data is None:
             Table.__init__(self, **kwargs)
             self.meta['config_file'] = config_file
             self.meta.update(read_config(self.meta['config_file']))
         else:  # if data is a filename
-            h5name = root_name(data) + '.hdf5'
-            if os.path.exists(h5name) and norefilt:
-                # but only if the modification time is later than the
-                # original file (e.g. the fits file was not modified later)
-                if os.path.getmtime(h5name) > os.path.getmtime(data):
-                    data = h5name
+            if prefetched is None:
+                prefetched = prefetch_scan(
+                    data, config_file=config_file, norefilt=norefilt,
+                    freqsplat=freqsplat, nofilt=nofilt, nosub=nosub,
+                    avoid_regions=avoid_regions)
+            data, table = prefetched
             if debug:
-                logging.info('Loading file {}'.format(data))
-            table = read_data(data)
+                logging.info('Loaded file {}'.format(data))
+            # The table was just read, no need to copy it. This also keeps
+            # the per-feed coordinates as views of the boresight pointing
+            # when possible
+            kwargs.setdefault('copy', False)
             Table.__init__(self, table, masked=True, **kwargs)
-            if not data.endswith('hdf5'):
+            if detect_data_kind(data) == 'fitszilla':
                 self.meta['filename'] = os.path.abspath(data)
             self.meta['config_file'] = config_file
 
             self.meta.update(read_config(self.meta['config_file']))
+            is_fitszilla = detect_data_kind(data) == 'fitszilla'
 
             self.check_order()
 
+            statistics = None
+            if is_fitszilla:
+                # Accumulated reading the file in chunks, so that the
+                # memory needed does not grow with the length of the scan
+                statistics = fitszilla_spectral_statistics(
+                    data, feeds=self.meta['select_feeds'],
+                    ifs=self.meta['select_ifs'],
+                    chans=self.meta['select_chans'],
+                    dtype=self.meta['precision'])
+
             self.clean_and_splat(freqsplat=freqsplat, nofilt=nofilt,
                                  noise_threshold=self.meta['noise_threshold'],
-                                 debug=debug, save_spectrum=save_spectrum)
+                                 debug=debug, save_spectrum=save_spectrum,
+                                 statistics=statistics,
+                                 jobs=jobs)
 
             if interactive:
                 self.interactive_filter()
@@ -622,9 +1362,18 @@ class Scan(Table):
                     not self.meta['backsub'])) and not nosub:
                 logging.info('Subtracting the baseline')
                 self.baseline_subtract(avoid_regions=avoid_regions,
-                                       plot=debug)
+                                       plot=debug, jobs=jobs)
 
             if not nosave:
+                if is_fitszilla:
+                    # Identify the processing, to reuse the processed scan
+                    # only if it is up to date (see prefetch_scan)
+                    parameters = _processing_parameters(
+                        self.meta, freqsplat=freqsplat, nofilt=nofilt,
+                        nosub=nosub, avoid_regions=avoid_regions)
+                    self.meta['cache_stamp'] = _file_stamp(data)
+                    self.meta['cache_key'] = \
+                        processed_scan_key(data, parameters)
                 self.save()
 
     def chan_columns(self):
@@ -650,7 +1399,8 @@ class Scan(Table):
 
     def clean_and_splat(self, good_mask=None, freqsplat=None,
                         noise_threshold=5, debug=True,
-                        save_spectrum=False, nofilt=False):
+                        save_spectrum=False, nofilt=False, jobs=None,
+                        statistics=None):
         """Clean from RFI.
 
         Very rough now, it will become complicated eventually.
@@ -682,6 +1432,14 @@ class Scan(Table):
         nofilt : bool
             Do not filter noisy channels (see
             :func:`clean_scan_using_variability`)
+        jobs : int
+            Number of threads processing the channels concurrently (see
+            :func:`clean_scans_using_variability`)
+        statistics : dict
+            The mean spectrum and the spectral variability of the channels,
+            by channel, as returned by :func:`fitszilla_spectral_statistics`.
+            If None, or for missing channels, they are calculated from the
+            data in the scan
         """
         logging.debug("Noise threshold: {}".format(noise_threshold))
 
@@ -690,42 +1448,73 @@ class Scan(Table):
             return
 
         chans = self.chan_columns()
+        dtype = counts_dtype(self.meta.get('precision', None))
         is_polarized = False
         mask = True
+        length = 86400 * (self['time'][-1] - self['time'][0])
+        outfile = root_name(self.meta['filename'])
+        plotter = self.get_plotter()
+
+        # Channels with the same bandwidth and number of spectral bins are
+        # cleaned together
+        groups = collections.OrderedDict()
         for ic, ch in enumerate(chans):
             if '_Q' in ch or '_U' in ch:
                 is_polarized = True
                 continue
-
-            results = \
+            if len(self[ch].shape) == 1:
+                # No spectral information. Only plot the light curve
+                if not debug:
+                    continue
                 clean_scan_using_variability(
-                    self[ch], 86400 * (self['time'][-1] - self['time'][0]),
-                    self[ch].meta['bandwidth'],
+                    self[ch], length, self[ch].meta['bandwidth'],
+                    debug=debug, outfile=outfile, label="{}".format(ic),
+                    debug_file_format=self.meta['debug_file_format'],
+                    info_string=self.get_info_string(ch))
+                continue
+            key = (self[ch].shape, str(self[ch].meta['bandwidth']))
+            groups.setdefault(key, []).append((ic, ch))
+
+        for group in groups.values():
+            bandwidth = self[group[0][1]].meta['bandwidth']
+            group_statistics = None
+            if statistics is not None and \
+                    np.all([ch in statistics for _, ch in group]):
+                group_statistics = [statistics[ch] for _, ch in group]
+            all_results = \
+                clean_scans_using_variability(
+                    [self[ch] for _, ch in group], length, bandwidth,
                     good_mask=good_mask,
                     freqsplat=freqsplat,
                     noise_threshold=noise_threshold,
-                    debug=debug, nofilt=nofilt,
-                    outfile=root_name(self.meta['filename']),
-                    label="{}".format(ic),
+                    nofilt=nofilt,
                     smoothing_window=self.meta['smooth_window'],
-                    debug_file_format=self.meta['debug_file_format'],
-                    info_string=self.get_info_string(ch))
+                    jobs=jobs, statistics=group_statistics)
 
-            if results is None:
-                continue
-            mask = mask & results.mask
-            lc_corr = results.lc
-            freqmin, freqmax = results.freqmin, results.freqmax
+            for (ic, ch), results in zip(group, all_results):
+                if debug and HAS_MPL:
+                    plotter.submit(
+                        _plot_variability,
+                        _variability_plot_data(self[ch], results), length,
+                        bandwidth,
+                        noise_threshold=noise_threshold, outfile=outfile,
+                        label="{}".format(ic),
+                        debug_file_format=self.meta['debug_file_format'],
+                        info_string=self.get_info_string(ch))
 
-            self[ch + 'TEMP'] = Column(lc_corr)
+                mask = mask & results.mask
+                lc_corr = results.lc
+                freqmin, freqmax = results.freqmin, results.freqmax
 
-            self[ch + 'TEMP'].meta.update(self[ch].meta)
-            if save_spectrum:
-                self[ch].name = ch + "_spec"
-            else:
-                self.remove_column(ch)
-            self[ch + 'TEMP'].name = ch
-            self[ch].meta['bandwidth'] = freqmax - freqmin
+                self[ch + 'TEMP'] = Column(np.asarray(lc_corr, dtype=dtype))
+
+                self[ch + 'TEMP'].meta.update(self[ch].meta)
+                if save_spectrum:
+                    self[ch].name = ch + "_spec"
+                else:
+                    self.remove_column(ch)
+                self[ch + 'TEMP'].name = ch
+                self[ch].meta['bandwidth'] = freqmax - freqmin
 
         if is_polarized:
             for ic, ch in enumerate(chans):
@@ -733,7 +1522,7 @@ class Scan(Table):
                     continue
                 lc_corr = frequency_filter(self[ch], mask)
 
-                self[ch + 'TEMP'] = Column(lc_corr)
+                self[ch + 'TEMP'] = Column(np.asarray(lc_corr, dtype=dtype))
 
                 self[ch + 'TEMP'].meta.update(self[ch].meta)
                 if save_spectrum:
@@ -743,7 +1532,7 @@ class Scan(Table):
                 self[ch + 'TEMP'].name = ch
 
     def baseline_subtract(self, kind='als', plot=False, avoid_regions=None,
-                          **kwargs):
+                          jobs=None, baseline_guess=None, **kwargs):
         """Subtract the baseline.
 
         Parameters
@@ -762,18 +1551,30 @@ class Scan(Table):
             PNG format.
         avoid_regions: [[r0_ra, r0_dec, r0_radius], [r1_ra, r1_dec, r1_radius]]
             Avoid these regions from the fit
+        jobs : int
+            Fit the baselines of this number of channels concurrently, in
+            threads. The channels are then updated in order. The ALS
+            baselines of all channels are fitted together (see
+            :func:`srttools.fit.baseline_als`), split in ``jobs`` batches
+        baseline_guess : dict
+            Initial guess of the ALS baselines, by channel, e.g. the output
+            of a previous call on similar data (after zapping some
+            intervals, for example). The fit converges in fewer iterations
+            from a good guess
+
+        Returns
+        -------
+        baselines : dict
+            The ALS baselines, by channel. The number of iterations of each
+            fit is saved in the ``als_niter`` meta of the channel
         """
-        for ch in self.chan_columns():
-            if plot and HAS_MPL:
-                fig = plt.figure("Sub" + ch)
-                plt.plot(self['time'], self[ch] - np.min(self[ch]),
-                         alpha=0.5)
-            force_rough = False
-            if 'Q' in ch or 'U' in ch:
-                force_rough = True
-            if len(self[ch]) < 10:
-                self[ch] = self[ch] - np.median(self[ch])
-                continue
+        dtype = counts_dtype(self.meta.get('precision', None))
+        plotter = self.get_plotter()
+        chans = self.chan_columns()
+        if baseline_guess is None:
+            baseline_guess = {}
+
+        def fit_mask(ch):
             mask = np.ones(len(self[ch]), dtype=bool)
             feed = get_channel_feed(ch)
             if avoid_regions is not None:
@@ -784,21 +1585,78 @@ class Scan(Table):
                     dec_dist = angular_distance(decs, r[1])
                     dist = np.sqrt((ra_dist * np.cos(decs))**2 + dec_dist**2)
                     mask[dist < r[2]] = 0
-            if kind == 'als' and not force_rough:
-                self[ch] = baseline_als(self['time'], self[ch], mask=mask,
-                                        **kwargs)
-            elif kind == 'rough' or force_rough:
-                self[ch] = baseline_rough(self['time'], self[ch], mask=mask)
+            return mask
+
+        def subtract(ch):
+            if len(self[ch]) < 10:
+                return self[ch] - np.median(self[ch]), None, None
+            force_rough = False
+            if 'Q' in ch or 'U' in ch:
+                force_rough = True
+            if kind == 'rough' or force_rough:
+                return baseline_rough(self['time'], self[ch],
+                                      mask=fit_mask(ch)), None, None
             else:
                 raise ValueError('Unknown baseline technique')
 
-            if plot and HAS_MPL:
-                plt.plot(self['time'], self[ch])
+        def subtract_als(batch):
+            # All channels have the same length: fit them together
+            guesses = None
+            if any(ch in baseline_guess for ch in batch):
+                guesses = [baseline_guess.get(ch) for ch in batch]
+            _, batch_baselines, niters = baseline_als(
+                self['time'], np.array([self[ch] for ch in batch]),
+                mask=np.array([fit_mask(ch) for ch in batch]),
+                baseline_guess=guesses, return_baseline=True,
+                return_niter=True, **kwargs)
+            return [(self[ch] - baseline, baseline, niter)
+                    for ch, baseline, niter in zip(batch, batch_baselines,
+                                                   niters)]
+
+        als_chans = [ch for ch in chans
+                     if kind == 'als' and len(self[ch]) >= 10 and
+                     not ('Q' in ch or 'U' in ch)]
+        other_chans = [ch for ch in chans if ch not in als_chans]
+        # With more jobs, the ALS channels are split in as many batches,
+        # fitted in parallel threads
+        nbatches = min(max(jobs or 1, 1), len(als_chans))
+        batches = [als_chans[i::nbatches] for i in range(nbatches)]
+
+        results = dict(zip(other_chans,
+                           _thread_map(subtract, other_chans, jobs=jobs)))
+        for batch, batch_results in zip(
+                batches, _thread_map(subtract_als, batches, jobs=jobs)):
+            results.update(zip(batch, batch_results))
+        all_subtracted = [results[ch] for ch in chans]
+
+        baselines = {}
+        for ch, (subtracted, baseline, niter) in zip(chans, all_subtracted):
+            before = None
+            if plot and HAS_MPL and len(self[ch]) >= 10:
+                before = np.array(self[ch])
+            # astype keeps the channel metadata of the column
+            self[ch] = subtracted.astype(dtype, copy=False)
+            if niter is not None:
+                baselines[ch] = baseline
+                self[ch].meta['als_niter'] = niter
+
+            if before is not None:
                 out = self.meta['filename'].replace('.fits',
                                                     '_{}.png'.format(ch))
-                plt.savefig(out)
-                plt.close(fig)
+                plotter.submit(_plot_baseline_subtraction,
+                               np.asarray(self['time']), before,
+                               np.asarray(self[ch]), out, label="Sub" + ch)
         self.meta['backsub'] = True
+        return baselines
+
+    def get_plotter(self):
+        """Diagnostic plotter, configured from the ``debug_plot_*`` options.
+
+        See :func:`srttools.plotter.get_plotter`.
+        """
+        return get_plotter(jobs=self.meta.get('debug_plot_jobs',
+                                              DEFAULT_PLOT_JOBS),
+                           max_rate=self.meta.get('debug_plot_rate', None))
 
     def __repr__(self):
         """Give the print() function something to print."""
@@ -808,18 +1666,34 @@ class Scan(Table):
         return reprstring
 
     def write(self, fname, *args, **kwargs):
-        """Same as Table.write, but adds path information for HDF5."""
+        """Same as Table.write, but adds path information for HDF5.
+
+        The HDF5 compression, chunking and column data types are taken from
+        the ``hdf5_*`` config options in the meta (see
+        :func:`srttools.io.hdf5_write_options` and
+        :func:`srttools.io.cast_columns`), unless overridden by ``kwargs``.
+
+        If ``fname`` ends with ``.npyscan``, the scan is saved as a
+        directory of memory-mappable columns (see
+        :func:`srttools.io.write_data_npyscan`).
+        """
         logging.info('Saving to {}'.format(fname))
-        if fname.endswith('.hdf5'):
-            Table.write(self, fname, *args, path='scan', serialize_meta=True,
-                        **kwargs)
+        kind = detect_data_kind(fname)
+        if kind == 'hdf5':
+            options = hdf5_write_options(self.meta)
+            options.update(kwargs)
+            table = cast_columns(self, self.meta.get('hdf5_dtypes', None))
+            write_hdf5_table(table, fname, 'scan', *args, **options)
+        elif kind == 'npyscan':
+            write_data_npyscan(self, fname,
+                               overwrite=kwargs.get('overwrite', False))
         else:
-            raise TypeError("Saving to anything else than HDF5 is not "
-                            "supported at the moment")
+            raise TypeError("Saving to anything else than HDF5 or npyscan is "
+                            "not supported at the moment")
 
     def check_order(self):
         """Check that times in a scan are monotonically increasing."""
-        if not np.all(self['time'] == np.sort(self['time'])):
+        if not np.all(np.diff(np.asarray(self['time'])) >= 0):
             raise ValueError('The order of times in the table is wrong')
 
     def interactive_filter(self, save=True, test=False):
@@ -875,7 +1749,12 @@ class Scan(Table):
         self.meta['ifilt'] = True
 
     def save(self, fname=None):
-        """Call self.write with a default filename, or specify it."""
+        """Call self.write with a default filename, or specify it.
+
+        The default filename has the extension of the ``scan_format`` in the
+        config file (``.hdf5`` if not specified).
+        """
         if fname is None:
-            fname = root_name(self.meta['filename']) + '.hdf5'
+            fname = root_name(self.meta['filename']) + '.' + \
+                self.meta.get('scan_format', 'hdf5')
         self.write(fname, overwrite=True)
@@ -1,5 +1,6 @@
 from __future__ import division, print_function
 from srttools import CalibratorTable
+from srttools import calibration
 from srttools.calibration import main_lcurve, _get_flux_quantity, main_cal
 from srttools.read_config import read_config
 from srttools.scan import list_scans
@@ -156,6 +157,16 @@ class TestCalibration(object):
                                           'calibrators', 'bubu.fits')])
         assert "Error while processing" in caplog.text
 
+    def test_fit_errors_are_raised(self, monkeypatch):
+        def bad_scan(scan_path, **kwargs):
+            raise ValueError('Unknown scan type')
+
+        # Errors that are not about reading the scans are not skipped
+        monkeypatch.setattr(calibration, '_treat_scan', bad_scan)
+        caltable = CalibratorTable()
+        with pytest.raises(ValueError):
+            caltable.from_scans(self.scan_list)
+
     def test_calibration_counts(self):
         """Simple calibration from scans."""
 
@@ -1,4 +1,5 @@
 from srttools.convert import convert_to_complete_fitszilla, main_convert
+from srttools.convert import _convert_to_complete_fitszilla
 from srttools.scan import Scan
 import numpy as np
 import os
@@ -60,6 +61,22 @@ class Test1_Scan(object):
             assert np.allclose(scan0[col], scan1[col])
         os.unlink('converted.fits')
 
+    def test_conversion_interpolated_coords(self):
+        convert_to_complete_fitszilla(self.fname, 'converted',
+                                      coordinate_tolerance=0.1)
+        with fits.open(self.fname) as hdul:
+            _convert_to_complete_fitszilla(hdul, 'converted_exact')
+            exact = [hdul['Coord{}'.format(i)].data
+                     for i in range(1, 7)]
+        with fits.open('converted.fits') as hdul:
+            for i in range(1, 7):
+                ext = hdul['Coord{}'.format(i)]
+                assert ext.header['COORDERR'] < 0.1
+                diff = np.degrees(np.abs(ext.data['decj2000'] -
+                                         exact[i - 1]['decj2000'])) * 3600
+                assert np.all(diff < 0.1)
+        os.unlink('converted.fits')
+
     def test_conversion_same_name_fails(self):
         with pytest.raises(ValueError):
             convert_to_complete_fitszilla(self.fname, self.fname)
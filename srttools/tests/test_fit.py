@@ -5,6 +5,7 @@ from __future__ import (absolute_import, division,
 from srttools.fit import fit_baseline_plus_bell, purge_outliers, align
 from srttools.fit import baseline_rough, ref_mad, ref_std, _rolling_window
 from srttools.fit import linear_fit, offset_fit, detrend_spectroscopic_data
+from srttools.fit import baseline_als, _als, fit_baselines_plus_bells
 
 import numpy as np
 import pytest
@@ -154,6 +155,68 @@ class TestFit(object):
             model, _ = fit_baseline_plus_bell(x, y, ye=10, kind='zxcdf')
         assert 'kind has to be one of: gauss, lorentz' in str(excinfo)
 
+    @pytest.mark.parametrize('kind', ['gauss', 'lorentz'])
+    def test_fit_baselines_plus_bells(self, kind):
+        """Test that the batched fit gives the same results."""
+        xs, ys = [], []
+        for i, (slope, center) in enumerate([(6, 50), (-2, 44), (0, 41)]):
+            x = np.arange(0, len(self.series) - 100 * i) * 0.1
+            xs.append(x)
+            ys.append(self.series[:len(x)] + _test_shape(x - center + 50) +
+                      x * slope + 20)
+
+        results = fit_baselines_plus_bells(xs, ys, kind=kind)
+        assert len(results) == 3
+        for x, y, (model, fit_info) in zip(xs, ys, results):
+            expected, expected_info = fit_baseline_plus_bell(x, y, kind=kind)
+            uncert = np.sqrt(expected_info['param_cov'].diagonal())
+            assert np.all(np.abs(model.parameters - expected.parameters) <
+                          1e-3 * uncert)
+            np.testing.assert_allclose(fit_info['param_cov'],
+                                       expected_info['param_cov'],
+                                       rtol=1e-3, atol=1e-10)
+
+    @pytest.mark.parametrize('kind', ['gauss', 'lorentz'])
+    @pytest.mark.parametrize('center', [0.3, -0.3, None])
+    def test_fit_baselines_plus_bells_off_center(self, kind, center):
+        """Test noisy series with an off-center bell, or with no bell.
+
+        Here the fit often stops at zero amplitude, where the covariance
+        matrix is singular, and the two fitters can end in different minima.
+        """
+        rs = np.random.RandomState(0)
+        x = np.linspace(-1, 1, 100)
+        ys = []
+        for i in range(30):
+            y = 0.5 * x + 2 + rs.normal(0, 0.3, x.size)
+            if center is not None:
+                y += np.exp(-(x - center) ** 2 / (2 * 0.1 ** 2))
+            ys.append(y)
+
+        results = fit_baselines_plus_bells([x] * len(ys), ys, kind=kind)
+        costs, expected_costs = [], []
+        for y, (model, fit_info) in zip(ys, results):
+            # Also at the bounds, the covariance is always returned
+            assert fit_info['param_cov'].shape == (5, 5)
+            assert np.all(np.isfinite(fit_info['param_cov']))
+            assert np.all(fit_info['param_cov'].diagonal() >= 0)
+            expected, _ = fit_baseline_plus_bell(x, y, kind=kind)
+            costs.append(np.sum((y - model(x)) ** 2))
+            expected_costs.append(np.sum((y - expected(x)) ** 2))
+        assert any(model.amplitude_1.value == 0 for model, _ in results)
+        if center is None:
+            assert np.isclose(np.sum(costs), np.sum(expected_costs),
+                              rtol=0.01)
+        else:
+            # The bell is found more often
+            assert np.sum(costs) < np.sum(expected_costs)
+
+    def test_fit_baselines_plus_bells_invalid(self):
+        x = np.arange(0, len(self.series)) * 0.1
+        with pytest.raises(ValueError) as excinfo:
+            fit_baselines_plus_bells([x], [self.series], kind='zxcdf')
+        assert 'kind has to be one of: gauss, lorentz' in str(excinfo)
+
     def test_fit_baseline_rough_return_baseline(self):
         """Test that the fit procedure works."""
 
@@ -216,3 +279,47 @@ class TestFit(object):
             _, err = offset_fit(x, y, 0, return_err=True)
             assert "return_err not implemented" in record[0].message.args[0]
         assert err is None
+
+    def test_als_same_as_sparse_solution(self):
+        from scipy import sparse
+        from scipy.sparse.linalg import spsolve
+        x = np.arange(300)
+        y = np.sin(x / 50) + np.random.normal(0, 0.1, x.size)
+        y[150:160] += 5
+        lam, p = 1e5, 0.01
+        # Reference: the original, sparse formulation of the algorithm
+        D = sparse.diags([1., -2., 1.], [0, 1, 2], shape=(x.size - 2, x.size))
+        w = np.ones(x.size)
+        for _ in range(30):
+            W = sparse.spdiags(w, 0, x.size, x.size)
+            z = spsolve(sparse.csc_matrix(W + lam * D.T.dot(D)), w * y)
+            w = p * (y > z) + (1 - p) * (y < z)
+        np.testing.assert_allclose(_als(y, lam, p), z, atol=1e-8)
+
+    def test_baseline_als_long_scan(self):
+        x = np.arange(100000)
+        trend = 2 * x / x.size
+        y = trend + np.random.normal(0, 0.1, x.size)
+        y_sub, baseline = baseline_als(x, y, return_baseline=True)
+        assert np.allclose(baseline, trend, atol=0.1)
+        assert np.allclose(np.median(y_sub), 0, atol=0.01)
+
+    def test_baseline_als_many_series(self):
+        x = np.arange(2000)
+        y = np.array([np.sin(x / (300 + 100 * i)) * (i + 1) +
+                      np.random.normal(0, 0.1, x.size) for i in range(4)])
+        y[:, 1000:1010] += 10
+        mask = np.ones(y.shape, dtype=bool)
+        mask[2, 500:600] = False
+        y_sub, baseline, niter = \
+            baseline_als(x, y, mask=mask, return_baseline=True,
+                         return_niter=True)
+        assert y_sub.shape == baseline.shape == y.shape
+        assert len(niter) == 4
+        for i in range(4):
+            ys, bs, ns = baseline_als(x, y[i], mask=mask[i],
+                                      return_baseline=True,
+                                      return_niter=True)
+            assert ns == niter[i]
+            assert np.allclose(ys, y_sub[i])
+            assert np.allclose(bs, baseline[i])
@@ -1,6 +1,9 @@
 from srttools.inspect_observations import split_observation_table
 from srttools.inspect_observations import dump_config_files
 from srttools.inspect_observations import main_inspector
+from srttools.inspect_observations import inspect_directories
+from srttools.inspect_observations import update_observation_index
+from srttools.inspect_observations import read_observation_index
 from astropy.table import Table, Column
 import numpy as np
 import os
@@ -148,6 +151,38 @@ class TestRun(object):
         assert 'Skydip' in out
         assert 'gauss_skydip' in out
 
+    def test_index_is_updated_incrementally(self):
+        dirs = sorted(glob.glob(os.path.join(self.datadir, 'gauss_*/')))
+        if os.path.exists('index.db'):
+            os.unlink('index.db')
+        info = inspect_directories(dirs, index_file='index.db')
+        assert len(info) == len(dirs)
+        assert np.any(info['Source'] == 'Dummy')
+
+        index = update_observation_index(dirs, index_file='index.db')
+        path = index.execute("SELECT path FROM subscans").fetchone()[0]
+        # Unchanged files are not read again...
+        index.execute("UPDATE subscans SET source = 'Fake' WHERE path = ?",
+                      (path,))
+        index.commit()
+        index.close()
+        index = update_observation_index(dirs, index_file='index.db')
+        assert index.execute("SELECT source FROM subscans WHERE path = ?",
+                             (path,)).fetchone()[0] == 'Fake'
+        # ...while modified ones are
+        index.execute("UPDATE subscans SET mtime = 0 WHERE path = ?",
+                      (path,))
+        index.commit()
+        index.close()
+        index = update_observation_index(dirs, index_file='index.db')
+        assert index.execute("SELECT source FROM subscans WHERE path = ?",
+                             (path,)).fetchone()[0] == 'Dummy'
+        index.close()
+
+        new_info = read_observation_index('index.db', dirs)
+        assert np.all(new_info['Sample File'] == info['Sample File'])
+        os.unlink('index.db')
+
     def test_run_date_filter_after(self, logger, caplog):
         main_inspector(glob.glob(os.path.join(self.datadir, 'gauss_*/')) +
                        '--only-after 20000101-000000'.split(' '))
@@ -10,9 +10,17 @@ from astropy.io import fits
 import astropy.units as u
 import pytest
 
-from srttools.scan import Scan, HAS_MPL
+from srttools.scan import Scan, HAS_MPL, spectral_statistics
+from srttools.scan import fitszilla_spectral_statistics
+from srttools.scan import clean_scan_using_variability
+from srttools.scan import clean_scans_using_variability
+from srttools.scan import _clean_dyn_spec, _cleaned_spectrum_weights
+from srttools.scan import _weighted_light_curve, prefetch_scan
 from srttools.io import print_obs_info_fitszilla, bulk_change, main_bulk_change
-from srttools.io import locations, read_data_fitszilla
+from srttools.io import locations, read_data_fitszilla, altaz_to_icrs
+from srttools.io import get_channel_meta, read_data_fitszilla_chunks
+from srttools.io import read_many, read_data, detect_data_kind
+from srttools.io import read_data_npyscan, write_data_npyscan
 from srttools.utils import compare_anything
 import os
 import numpy as np
@@ -95,6 +103,275 @@ class Test1_Scan(object):
                                                 'skydip_mod.fits'))
         assert np.all(scan['Feed0_RCP-Temp'] > 0.)
 
+    def test_read_selected_feeds(self):
+        fname = os.path.join(self.datadir, 'srt_data_tp_multif.fits')
+        full = read_data_fitszilla(fname)
+        scan = read_data_fitszilla(fname, feeds=[1], ifs=[0])
+        assert 'Feed1_LCP' in scan.colnames
+        assert 'Feed1_RCP' not in scan.colnames
+        assert 'Feed0_LCP' not in scan.colnames
+        for col in scan.colnames:
+            if col in ['ra', 'dec', 'el', 'az']:
+                # Only the coordinates of the selected feed are converted
+                assert np.all(scan[col][:, 1] == full[col][:, 1])
+                continue
+            assert np.all(scan[col] == full[col])
+            assert scan[col].meta == full[col].meta
+
+    def test_read_selected_chans(self):
+        fname = os.path.join(self.datadir, 'spectrum', 'srt_data.fits')
+        full = read_data_fitszilla(fname)
+        scan = read_data_fitszilla(fname, chans=['Feed0_RCP'])
+        assert 'Feed0_LCP' not in scan.colnames
+        assert np.all(scan['Feed0_RCP'] == full['Feed0_RCP'])
+        assert np.all(scan['Feed0_RCP-Temp'] == full['Feed0_RCP-Temp'])
+
+    def test_read_meta_only(self):
+        fname = os.path.join(self.datadir, 'srt_data_tp_multif.fits')
+        full = read_data_fitszilla(fname)
+        scan = read_data_fitszilla(fname, meta_only=True)
+        assert scan.meta['SOURCE'] == full.meta['SOURCE']
+        assert 'Feed0_LCP' not in scan.colnames
+        assert np.all(scan['time'] == full['time'])
+        for ch in ['Feed0_LCP', 'Feed1_RCP']:
+            assert scan.meta['channel_meta'][ch]['frequency'] == \
+                full[ch].meta['frequency']
+
+    def test_header_is_not_copied_to_channels(self):
+        fname = os.path.join(self.datadir, 'srt_data_tp_multif.fits')
+        scan = read_data_fitszilla(fname)
+        for ch in ['Feed0_LCP', 'Feed1_RCP']:
+            assert 'SOURCE' not in scan[ch].meta
+            assert 'backend' not in scan[ch].meta
+            meta = get_channel_meta(scan, ch)
+            assert meta['SOURCE'] == scan.meta['SOURCE']
+            assert meta['frequency'] == scan[ch].meta['frequency']
+
+    def test_read_memmap(self):
+        import mmap
+        fname = os.path.join(self.datadir, 'spectrum', 'srt_data_xarcos.fits')
+        full = read_data_fitszilla(fname)
+        scan = read_data_fitszilla(fname, memmap=True)
+        for col in full.colnames:
+            assert np.all(scan[col] == full[col])
+        # Unless the file is explicitly mapped, data are in the native
+        # byte order
+        for ch in ['Feed0_LCP_0', 'Feed0_LCP_0-Temp']:
+            assert full[ch].dtype.isnative
+        # Channels with unit relative power are views of the mapped file
+        assert scan['Feed0_LCP_0'].meta['relpower'] == 1
+        base = scan['Feed0_LCP_0'].data
+        while getattr(base, 'base', None) is not None:
+            base = base.base
+        assert isinstance(base, mmap.mmap)
+
+    def test_read_chunks(self):
+        fname = os.path.join(self.datadir, 'spectrum', 'srt_data.fits')
+        full = read_data_fitszilla(fname)
+        chunks = list(read_data_fitszilla_chunks(fname, chunk_size=100))
+        assert len(chunks) == int(np.ceil(len(full) / 100))
+        for chunk in chunks:
+            assert chunk.meta == full.meta
+        for col in full.colnames:
+            assert np.all(np.concatenate([c[col] for c in chunks]) ==
+                          full[col])
+        meanspec, spectral_var = \
+            spectral_statistics(c['Feed0_LCP'] for c in chunks)
+        assert np.allclose(meanspec, np.mean(full['Feed0_LCP'], axis=0))
+        assert np.allclose(spectral_var,
+                           np.std(full['Feed0_LCP'], axis=0) / meanspec)
+
+    def test_read_chunks_coordinate_tolerance(self):
+        fname = os.path.join(self.datadir, 'srt_data_tp_multif.fits')
+        full = read_data_fitszilla(fname, coordinate_tolerance=1)
+        chunks = list(read_data_fitszilla_chunks(fname, chunk_size=100,
+                                                 coordinate_tolerance=1))
+        assert 'coordinate_max_deviation' in full.meta
+        # The coordinates are converted once for the whole file
+        for chunk in chunks:
+            assert chunk.meta == full.meta
+        for col in ['ra', 'dec', 'el', 'az']:
+            assert np.all(np.concatenate([c[col] for c in chunks]) ==
+                          full[col])
+
+    def test_fitszilla_spectral_statistics(self):
+        fname = os.path.join(self.datadir, 'spectrum', 'srt_data.fits')
+        full = read_data_fitszilla(fname)
+        statistics = fitszilla_spectral_statistics(fname, chunk_size=100)
+        assert sorted(statistics.keys()) == ['Feed0_LCP', 'Feed0_RCP']
+        for ch, (meanspec, spectral_var) in statistics.items():
+            expected = spectral_statistics([full[ch]])
+            assert np.allclose(meanspec, expected[0])
+            assert np.allclose(spectral_var, expected[1])
+
+        spectra = [full[ch] for ch in ['Feed0_LCP', 'Feed0_RCP']]
+        expected = clean_scans_using_variability(spectra, 10, 500)
+        results = clean_scans_using_variability(
+            spectra, 10, 500,
+            statistics=[statistics['Feed0_LCP'], statistics['Feed0_RCP']])
+        for res, exp in zip(results, expected):
+            assert np.all(res.mask == exp.mask)
+            assert np.allclose(res.lc, exp.lc)
+
+    def test_tp_file_has_no_spectral_statistics(self):
+        fname = os.path.join(self.datadir, 'srt_data_tp_multif.fits')
+        assert fitszilla_spectral_statistics(fname) == {}
+
+    def test_cleaned_light_curve_without_cleaned_spectrum(self):
+        dynspec = np.random.RandomState(1).normal(10, 1, (50, 32))
+        freqmask = np.ones(32, dtype=bool)
+        freqmask[:2] = freqmask[30:] = False
+        for bad_intervals in [[[0, 3], [10, 12]], [[5, 6], [28, 32]],
+                              [[15, 20]]]:
+            cleaned = _clean_dyn_spec(dynspec, bad_intervals)
+            lc = _weighted_light_curve(
+                dynspec, _cleaned_spectrum_weights(freqmask, bad_intervals))
+            assert np.allclose(lc, np.sum(cleaned[:, freqmask], axis=1))
+
+    def test_clean_dyn_spec(self):
+        dynspec = np.random.RandomState(4).normal(10, 1, (20, 16))
+        for bad_intervals in [[], [[0, 3], [10, 12]], [[5, 6], [14, 16]],
+                              [[1, 2], [3, 4], [15, 20]]]:
+            expected = dynspec.copy()
+            for b in bad_intervals:
+                if b[0] == 0:
+                    fill_lc = dynspec[:, b[1]]
+                elif b[1] >= 16:
+                    fill_lc = dynspec[:, b[0]]
+                else:
+                    fill_lc = (dynspec[:, b[0] - 1] + dynspec[:, b[1]]) / 2
+                for bsub in range(b[0], min(b[1], 16)):
+                    expected[:, bsub] = fill_lc
+            cleaned = _clean_dyn_spec(dynspec, bad_intervals)
+            assert np.all(cleaned == expected)
+            lc = _clean_dyn_spec(dynspec, bad_intervals,
+                                 light_curve_only=True)
+            assert np.allclose(lc, np.sum(expected, axis=1))
+
+    def test_clean_scan_save_spectrum(self):
+        dynspec = np.random.RandomState(2).normal(10, 0.1, (50, 64))
+        dynspec[:, 20] += np.random.RandomState(3).normal(0, 5, 50)
+        results = clean_scan_using_variability(dynspec, 10, 500,
+                                               debug=False)
+        assert results.spectrum is None
+        assert not results.mask[20]
+        results_spec = clean_scan_using_variability(dynspec, 10, 500,
+                                                    debug=False,
+                                                    save_spectrum=True)
+        assert np.allclose(results_spec.lc, results.lc)
+        assert np.allclose(results_spec.spectrum[:, 20],
+                           (dynspec[:, 19] + dynspec[:, 21]) / 2)
+
+    def test_clean_scans_batched(self):
+        rs = np.random.RandomState(5)
+        dynspec = rs.normal(10, 0.1, (3, 100, 128))
+        dynspec[0, :, 20] += rs.normal(0, 5, 100)
+        dynspec[2, :, 70:75] += rs.normal(0, 5, (100, 1))
+        batched = clean_scans_using_variability(dynspec, 10, 500)
+        for spec, results in zip(dynspec, batched):
+            single = clean_scan_using_variability(spec, 10, 500, debug=False)
+            assert np.all(single.mask == results.mask)
+            assert np.allclose(single.lc, results.lc)
+        assert not batched[0].mask[20]
+        assert batched[1].mask[20]
+        assert not np.any(batched[2].mask[70:75])
+        # Lists of columns are processed one by one, as they are
+        from astropy.table import Column
+        columns = [Column(spec, name='ch{}'.format(i))
+                   for i, spec in enumerate(dynspec)]
+        for results, expected in zip(
+                clean_scans_using_variability(columns, 10, 500, jobs=2),
+                batched):
+            assert np.all(results.mask == expected.mask)
+            assert np.allclose(results.lc, expected.lc)
+        with pytest.raises(ValueError):
+            clean_scans_using_variability([dynspec[0], dynspec[1, :50]],
+                                          10, 500)
+
+    @pytest.mark.skipif('not HAS_MPL')
+    def test_variability_plot_data_is_small(self):
+        import pickle
+        from srttools.plotter import wait_for_plots
+        from srttools.scan import _variability_plot_data
+        rs = np.random.RandomState(6)
+        dynspec = rs.normal(10, 0.1, (3000, 512)).astype(np.float32)
+        dynspec[:, 100] += rs.normal(0, 5, 3000).astype(np.float32)
+        results = clean_scan_using_variability(
+            dynspec, 10, 500, debug=True, outfile='bubu_variability',
+            save_spectrum=True, debug_file_format='png')
+        data = _variability_plot_data(dynspec, results,
+                                      max_shape=(500, 256))
+        assert data.varimg.shape == data.cleaned_varimg.shape == (500, 256)
+        assert data.results.spectrum is None
+        assert data.varimg.dtype == dynspec.dtype
+        assert len(pickle.dumps(data)) < dynspec.nbytes / 5
+        # Plots are rendered in the background, by default
+        wait_for_plots()
+        assert os.path.exists('bubu_variability_.png')
+        os.unlink('bubu_variability_.png')
+
+    def test_read_many(self):
+        fnames = sorted(glob.glob(os.path.join(self.datadir,
+                                               'nodding_xarcos', '*_00*.fits')))
+        fnames += ['nonexistent.fits']
+        serial = list(read_many(fnames))
+        parallel = list(read_many(fnames, jobs=2))
+        prefetched = list(read_many(fnames, prefetch=2))
+        assert serial[-1] is None
+        assert parallel[-1] is None
+        assert prefetched[-1] is None
+        # Results are in input order
+        for f, s, p, pf in zip(fnames[:-1], serial[:-1], parallel[:-1],
+                               prefetched[:-1]):
+            data = read_data(f)
+            for col in data.colnames:
+                assert np.all(s[col] == data[col])
+                assert np.all(p[col] == data[col])
+                assert np.all(pf[col] == data[col])
+
+    def test_feed_coordinates_are_not_copied(self):
+        fname = os.path.join(self.datadir, 'srt_data_tp_multif.fits')
+        scan = read_data_fitszilla(fname, meta_only=True)
+        for col in ['ra', 'dec', 'el', 'az']:
+            assert scan[col].shape[1] == 7
+            # All feeds share the memory of the boresight pointing
+            assert scan[col].strides[1] == 0
+            assert np.all(scan[col][:, 3] == scan[col][:, 0])
+
+    def test_scan_feed_coordinates_are_not_copied(self):
+        fname = os.path.join(self.datadir, 'srt_data_tp_multif.fits')
+        config_file = os.path.join(self.datadir, 'test_config_feed0.ini')
+        with open(self.config_file) as fobj:
+            config = fobj.read()
+        with open(config_file, 'w') as fobj:
+            print(config.replace('[analysis]',
+                                 '[analysis]\nselect_feeds : 0'), file=fobj)
+        scan = Scan(fname, config_file=config_file, nosave=True, debug=False)
+        os.unlink(config_file)
+        read_config(self.config_file)
+
+        assert list(scan.chan_columns()) == ['Feed0_LCP', 'Feed0_RCP']
+        for col in ['ra', 'dec']:
+            assert scan[col].shape[1] == 7
+            # Feed 0 has no offset: the other feeds are not converted, and
+            # all share the memory of the boresight pointing
+            assert scan[col].strides[1] == 0
+
+    def test_interpolated_coordinate_transform(self):
+        nsamples = 3000
+        obstimes = Time(57000 + np.arange(nsamples) * 0.04 / 86400,
+                        format='mjd', scale='utc')
+        az = np.radians(np.linspace(100, 102, nsamples))
+        el = np.radians(40 + 0.5 * np.sin(np.linspace(0, 3, nsamples)))
+        ra0, dec0, dev0 = altaz_to_icrs(obstimes, az, el, locations['srt'])
+        assert dev0 == 0
+        ra, dec, maxdev = altaz_to_icrs(obstimes, az, el, locations['srt'],
+                                        tolerance=0.1 * u.arcsec)
+        assert maxdev < 0.1 * u.arcsec
+        coords0 = SkyCoord(ra=ra0 * u.rad, dec=dec0 * u.rad)
+        coords = SkyCoord(ra=ra * u.rad, dec=dec * u.rad)
+        assert np.all(coords.separation(coords0) < 0.1 * u.arcsec)
+
     def test_print_info(self, capsys):
         print_obs_info_fitszilla(self.fname)
         out, err = capsys.readouterr()
@@ -121,11 +398,140 @@ class Test1_Scan(object):
         for col in scan.colnames:
             assert scan[col].meta == scan2[col].meta
 
+    def test_scan_npyscan(self):
+        scan = Scan(self.fname)
+        scan.write('scan.npyscan', overwrite=True)
+        assert detect_data_kind('scan.npyscan') == 'npyscan'
+        table = read_data_npyscan('scan.npyscan')
+        # Columns are read-only memory maps of the files
+        assert not np.asarray(table['time']).flags.writeable
+        scan2 = Scan('scan.npyscan')
+        assert scan.meta == scan2.meta
+        for col in scan.colnames:
+            assert scan[col].meta == scan2[col].meta
+            assert np.all(scan[col] == scan2[col])
+        with pytest.raises(IOError):
+            scan.write('scan.npyscan')
+        shutil.rmtree('scan.npyscan')
+
+    def test_npyscan_load_modes(self):
+        from astropy.table import Table, MaskedColumn
+        import json
+        table = Table()
+        table['a'] = np.arange(6.).reshape(3, 2)
+        table['a'].unit = 'K'
+        table['a'].description = 'bubu'
+        table['b'] = np.asfortranarray(np.arange(6).reshape(3, 2))
+        table['c'] = MaskedColumn([1, 2, 3], mask=[False, True, False])
+        table['c'].meta['frequency'] = 5 * u.MHz
+        table.meta['bandwidth'] = 3 * u.MHz
+        write_data_npyscan(table, 'bubu.npyscan', overwrite=True)
+
+        def check(new):
+            assert new.meta == table.meta
+            for col in table.colnames:
+                assert np.all(new[col] == table[col])
+                assert new[col].unit == table[col].unit
+                assert new[col].description == table[col].description
+                assert new[col].meta == table[col].meta
+            assert np.all(new['c'].mask == table['c'].mask)
+
+        for mmap_mode in [None, 'r', 'c']:
+            new = read_data_npyscan('bubu.npyscan', mmap_mode=mmap_mode)
+            check(new)
+            assert np.asarray(new['a']).flags.writeable == (mmap_mode != 'r')
+        # Copy-on-write does not modify the file
+        new['a'][0, 0] = 10
+        check(read_data_npyscan('bubu.npyscan'))
+
+        # Directories without the layout of the columns are still read
+        metafile = os.path.join('bubu.npyscan', 'meta.json')
+        with open(metafile) as fobj:
+            info = json.load(fobj)
+        for colinfo in info['columns']:
+            colinfo.pop('offset')
+        with open(metafile, 'w') as fobj:
+            json.dump(info, fobj)
+        check(read_data_npyscan('bubu.npyscan'))
+        shutil.rmtree('bubu.npyscan')
+
+    def test_scan_hdf5_options_and_partial_read(self):
+        scan = Scan(self.fname)
+        scan.meta['hdf5_compression'] = 'gzip'
+        scan.meta['hdf5_shuffle'] = True
+        scan.meta['hdf5_chunk_rows'] = 100
+        scan.meta['hdf5_dtypes'] = [['Feed0_?CP', 'float32']]
+        scan.write('scan_compressed.hdf5', overwrite=True)
+        import h5py
+        with h5py.File('scan_compressed.hdf5', 'r') as fobj:
+            assert fobj['scan'].compression == 'gzip'
+            assert fobj['scan'].shuffle
+            assert fobj['scan'].chunks == (100,)
+        # The scan itself is not modified
+        assert scan['Feed0_LCP'].dtype == np.float64
+
+        full = read_data('scan_compressed.hdf5')
+        assert full['Feed0_LCP'].dtype == np.float32
+        assert full['time'].dtype == np.float64
+        assert np.allclose(full['Feed0_LCP'], scan['Feed0_LCP'])
+
+        part = read_data('scan_compressed.hdf5', columns=['time', 'ra'],
+                         rows=slice(10, 20))
+        assert part.colnames == ['time', 'ra']
+        assert part.meta == full.meta
+        assert part['ra'].unit == full['ra'].unit
+        assert np.all(part['time'] == full['time'][10:20])
+        assert np.all(part['ra'] == full['ra'][10:20])
+        part = read_data('scan_compressed.hdf5', columns=['Feed0_LCP'])
+        assert part['Feed0_LCP'].meta == full['Feed0_LCP'].meta
+        assert np.all(part['Feed0_LCP'] == full['Feed0_LCP'])
+        os.unlink('scan_compressed.hdf5')
+
     def test_scan_nofilt_executes(self):
         '''Test that data are read.'''
 
         scan = Scan(self.fname, nofilt=True)
 
+    def test_processed_scan_is_reused_only_if_unchanged(self):
+        h5file = self.fname.replace('.fits', '.hdf5')
+        scan = Scan(self.fname)
+        key = scan.meta['cache_key']
+        # Mark the processed scan, to recognize it when it is reused
+        table = read_data(h5file)
+        table.meta['marker'] = True
+        table.write(h5file, path='scan', serialize_meta=True, overwrite=True)
+
+        scan = Scan(self.fname)
+        assert scan.meta['marker']
+        assert scan.meta['cache_key'] == key
+
+        scan = Scan(self.fname, nofilt=True)
+        assert 'marker' not in scan.meta
+        assert scan.meta['cache_key'] != key
+
+    def test_processed_scan_is_checked_by_content(self):
+        dummyname = os.path.join(os.getcwd(), 'dummyscan.fits')
+        h5file = dummyname.replace('.fits', '.hdf5')
+        shutil.copyfile(self.fname, dummyname)
+        Scan(dummyname)
+        table = read_data(h5file)
+        table.meta['marker'] = True
+        table.write(h5file, path='scan', serialize_meta=True, overwrite=True)
+
+        # Same content, different modification time: reused
+        os.utime(dummyname, (1e9, 1e9))
+        scan = Scan(dummyname)
+        assert scan.meta['marker']
+
+        # Different content, same size and modification time: processed
+        bulk_change(dummyname, '0,header,SOURCE', 'bubu')
+        os.utime(dummyname, (1e9, 1e9))
+        scan = Scan(dummyname)
+        assert 'marker' not in scan.meta
+        assert scan.meta['SOURCE'] == 'bubu'
+        os.unlink(dummyname)
+        os.unlink(h5file)
+
     def test_scan_from_table(self):
         '''Test that data are read.'''
         from astropy.table import Table
@@ -169,6 +575,24 @@ class Test1_Scan(object):
 
         assert "with channel subdivision:" in str(excinfo)
 
+    def test_baseline_subtract_warm_start(self):
+        scan = Scan(self.fname, config_file=self.config_file, nosave=True,
+                    norefilt=False, nosub=True)
+        zapped = scan.copy()
+        baselines = scan.baseline_subtract()
+        for ch in scan.chan_columns():
+            assert 0 < scan[ch].meta['als_niter'] <= 40
+        # Small change to the data, as after zapping some points
+        cold = zapped.copy()
+        for ch in zapped.chan_columns():
+            zapped[ch][:5] = cold[ch][:5] = np.median(zapped[ch])
+        cold.baseline_subtract()
+        zapped.baseline_subtract(baseline_guess=baselines)
+        for ch in scan.chan_columns():
+            assert zapped[ch].meta['als_niter'] <= cold[ch].meta['als_niter']
+            assert np.allclose(zapped[ch], cold[ch],
+                               atol=1e-3 * np.std(cold[ch]))
+
     def test_simple_in_stokes(self):
         with pytest.warns(UserWarning) as record:
             scan = Scan(os.path.join(self.datadir, 'srt_pol_bad.fits'))
@@ -222,6 +646,73 @@ class Test2_Scan(object):
 
         Scan(os.path.join(self.datadir, 'spectrum', fname), debug=True)
 
+    def test_lsb_spectrum_is_reversed(self):
+        '''Test that spectra with negative bandwidth are flipped.'''
+        fname = os.path.join(self.datadir, 'spectrum', 'srt_data.fits')
+        dummyname = os.path.join(os.getcwd(), 'dummy_lsb.fits')
+        with fits.open(fname) as hdul:
+            hdul['RF INPUTS'].data['bandWidth'] *= -1
+            hdul.writeto(dummyname, overwrite=True)
+
+        usb = read_data_fitszilla(fname)
+        lsb = read_data_fitszilla(dummyname)
+        os.unlink(dummyname)
+        for ch in ['Feed0_LCP', 'Feed0_RCP']:
+            expected = np.array(usb[ch])
+            for i in range(expected.shape[0]):
+                expected[i, :] = expected[i, ::-1]
+            assert np.array_equal(np.array(lsb[ch]), expected)
+
+    def test_scan_single_precision(self):
+        config_file = os.path.join(self.datadir, 'spectrum_float32.ini')
+        with open(self.config_file) as fobj:
+            config = fobj.read()
+        with open(config_file, 'w') as fobj:
+            print(config.replace('[analysis]',
+                                 '[analysis]\nprecision : single'), file=fobj)
+
+        fname = os.path.join(self.datadir, 'spectrum', 'srt_data.fits')
+        single = Scan(fname, config_file=config_file, nosave=True,
+                      debug=False)
+        double = Scan(fname, config_file=self.config_file, nosave=True,
+                      debug=False)
+        os.unlink(config_file)
+        read_config(self.config_file)
+
+        for col in ['time', 'ra', 'dec', 'az', 'el']:
+            assert single[col].dtype.itemsize == 8
+        for ch in double.chan_columns():
+            assert single[ch].dtype.kind == 'f'
+            assert single[ch].dtype.itemsize == 4
+            assert np.allclose(single[ch], double[ch],
+                               atol=1e-4 * np.std(double[ch]))
+
+    def test_scan_jobs(self):
+        fname = os.path.join(self.datadir, 'spectrum', 'srt_data_xarcos.fits')
+        serial = Scan(fname, config_file=self.config_file, nosave=True,
+                      norefilt=False, debug=False)
+        parallel = Scan(fname, config_file=self.config_file, nosave=True,
+                        norefilt=False, debug=False, jobs=4)
+        assert serial.colnames == parallel.colnames
+        for ch in serial.chan_columns():
+            assert np.all(serial[ch] == parallel[ch])
+            assert serial[ch].meta == parallel[ch].meta
+
+    def test_scan_prefetch(self):
+        fnames = sorted(glob.glob(os.path.join(self.datadir,
+                                               'nodding_xarcos', '*_00*.fits')))
+        fnames += ['nonexistent.fits']
+        kwargs = dict(config_file=self.config_file, nosave=True,
+                      norefilt=False, debug=False)
+        serial = list(read_many(fnames, reader=Scan, **kwargs))
+        prefetched = list(read_many(fnames, reader=Scan, prefetch=2,
+                                    prefetcher=prefetch_scan, **kwargs))
+        assert prefetched[-1] is None
+        for s, p in zip(serial[:-1], prefetched[:-1]):
+            assert s.meta['filename'] == p.meta['filename']
+            for ch in s.chan_columns():
+                assert np.all(s[ch] == p[ch])
+
     def test_scan_baseline_unknown(self):
         '''Test that data are read.'''
 
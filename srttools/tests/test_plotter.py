@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import (absolute_import, division,
+                        print_function)
+from srttools.plotter import DiagnosticPlotter, get_plotter
+from srttools.scan import _plot_baseline_subtraction, HAS_MPL
+
+import os
+import logging
+import numpy as np
+import pytest
+
+
+def _fail():
+    raise ValueError("Plotting failed")
+
+
+class TestPlotter(object):
+    @pytest.mark.skipif('not HAS_MPL')
+    @pytest.mark.parametrize('jobs', [None, 2])
+    def test_plots_are_rendered(self, jobs):
+        time = np.arange(100.)
+        before = np.random.normal(0, 1, 100) + time / 10
+        after = before - time / 10
+        plotter = DiagnosticPlotter(jobs=jobs)
+        fnames = ['bubu_plotter_{}_{}.png'.format(jobs, i) for i in range(4)]
+        for fname in fnames:
+            assert plotter.submit(_plot_baseline_subtraction, time, before,
+                                  after, fname)
+        plotter.close()
+        for fname in fnames:
+            assert os.path.exists(fname)
+            os.unlink(fname)
+
+    @pytest.mark.parametrize('jobs', [None, 2])
+    def test_plot_errors_are_logged(self, jobs, caplog):
+        plotter = DiagnosticPlotter(jobs=jobs)
+        with caplog.at_level(logging.WARNING):
+            plotter.submit(_fail)
+            plotter.close()
+        assert "Plotting failed" in caplog.text
+
+    def test_rate_limit(self):
+        rendered = []
+        plotter = DiagnosticPlotter(max_rate=3)
+        for i in range(10):
+            plotter.submit(rendered.append, i)
+        assert rendered == [0, 1, 2]
+        assert plotter.skipped == 7
+
+    def test_max_pending(self):
+        plotter = DiagnosticPlotter(jobs=1, max_pending=2)
+        accepted = [plotter.submit(os.getpid) for i in range(100)]
+        plotter.close()
+        assert accepted[:2] == [True, True]
+        assert plotter.skipped == accepted.count(False)
+
+    def test_get_plotter(self):
+        plotter = get_plotter(jobs=2, max_rate=10)
+        assert get_plotter(jobs=2, max_rate=10) is plotter
+        new_plotter = get_plotter()
+        assert new_plotter is not plotter
+        # Plots are rendered in the background by default
+        assert new_plotter.jobs == 1
+        assert get_plotter(jobs=None).jobs is None
@@ -1,6 +1,8 @@
 import pytest
 import numpy as np
+from scipy.signal import medfilt
 from ..utils import HAS_MAHO, calculate_zernike_moments
+from ..utils import running_median, _running_median_rows
 
 
 @pytest.mark.skipif('not HAS_MAHO')
@@ -10,3 +12,57 @@ def test_zernike_moments():
                                     norder=8, label=None, use_log=False)
     assert res[1][1] < 1e-10
     assert res[3][1] < 1e-10
+
+
+@pytest.mark.parametrize('window', [1, 3, 11, 101, 301])
+def test_running_median_same_as_medfilt(window):
+    # Integer values, to have many ties
+    x = np.random.randint(-5, 5, 200).astype(float)
+    expected = medfilt(x, window)
+    assert np.all(running_median(x, window) == expected)
+    # The two-heap algorithm, also when Numba is not installed
+    half = window // 2
+    padded = np.zeros((1, x.size + 2 * half))
+    padded[0, half:half + x.size] = x
+    out = np.zeros((1, x.size))
+    _running_median_rows(padded, window, out)
+    assert np.all(out[0] == expected)
+
+
+@pytest.mark.parametrize('window', [1, 3, 11])
+def test_running_median_nan_same_as_medfilt(window):
+    x = np.random.randint(-5, 5, 200).astype(float)
+    x[[10, 11, 50]] = np.nan
+    x[100] = np.inf
+    x[150] = -np.inf
+    np.testing.assert_array_equal(running_median(x, window),
+                                  medfilt(x, window))
+
+
+def test_running_median_rows():
+    x = np.random.normal(0, 1, (3, 100)).astype(np.float32)
+    median = running_median(x, 21)
+    assert median.dtype == np.float32
+    for row, row_median in zip(x, median):
+        assert np.all(row_median == medfilt(row, 21))
+
+
+def test_running_median_rows_nan():
+    x = np.random.normal(0, 1, (3, 100))
+    x[1, 20] = np.nan
+    median = running_median(x, 21)
+    for row, row_median in zip(x, median):
+        np.testing.assert_array_equal(row_median, medfilt(row, 21))
+
+
+def test_running_median_big_endian():
+    x = np.random.normal(0, 1, (3, 100)).astype('>f8')
+    median = running_median(x, 21)
+    assert median.dtype == np.float64
+    for row, row_median in zip(x, median):
+        assert np.all(row_median == medfilt(row.astype(float), 21))
+
+
+def test_running_median_even_window_raises():
+    with pytest.raises(ValueError):
+        running_median(np.arange(10), 4)
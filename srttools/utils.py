@@ -72,7 +72,7 @@ except ImportError:
 __all__ = ["mad", "standard_string", "standard_byte", "compare_strings",
            "tqdm", "jit", "vectorize", 'interpolate_invalid_points_image',
            'get_center_of_mass', 'calculate_zernike_moments',
-           'calculate_beam_fom', 'ds9_like_log_scale']
+           'calculate_beam_fom', 'ds9_like_log_scale', 'running_median']
 
 
 try:
@@ -758,6 +758,173 @@ def median_diff(array, sorting=False):
     return np.median(np.diff(array))
 
 
+@jit(nopython=True)
+def _heap_before(a, b, is_max):
+    if is_max:
+        return a > b
+    return a < b
+
+
+@jit(nopython=True)
+def _heap_swap(heap, i, j, where):
+    si = heap[i]
+    sj = heap[j]
+    heap[i] = sj
+    heap[j] = si
+    where[sj] = i
+    where[si] = j
+
+
+@jit(nopython=True)
+def _heap_sift_up(heap, i, vals, where, is_max):
+    while i > 0:
+        parent = (i - 1) // 2
+        if not _heap_before(vals[heap[i]], vals[heap[parent]], is_max):
+            break
+        _heap_swap(heap, i, parent, where)
+        i = parent
+    return i
+
+
+@jit(nopython=True)
+def _heap_sift_down(heap, size, i, vals, where, is_max):
+    while True:
+        best = i
+        left = 2 * i + 1
+        right = left + 1
+        if left < size and \
+                _heap_before(vals[heap[left]], vals[heap[best]], is_max):
+            best = left
+        if right < size and \
+                _heap_before(vals[heap[right]], vals[heap[best]], is_max):
+            best = right
+        if best == i:
+            return i
+        _heap_swap(heap, i, best, where)
+        i = best
+
+
+@jit(nopython=True)
+def _running_median_rows(padded, window, out):
+    """Running median of each row of ``padded``, with two heaps.
+
+    The window is kept in a circular buffer. Its lowest ``window // 2 + 1``
+    values are in a max-heap, whose top is the median, and the others in a
+    min-heap. At each step, the value leaving the window is replaced by the
+    new one in the same heap position, and the heaps are fixed in
+    O(log(window)) operations.
+    """
+    nrows, n = out.shape
+    half = window // 2
+    nlow = half + 1
+    for r in range(nrows):
+        row = padded[r]
+        vals = row[:window].copy()
+        order = np.argsort(vals)
+        low = np.empty(nlow, np.int64)
+        high = np.empty(half, np.int64)
+        in_low = np.empty(window, np.bool_)
+        where = np.empty(window, np.int64)
+        # Sorted arrays are valid heaps
+        for j in range(nlow):
+            s = order[nlow - 1 - j]
+            low[j] = s
+            in_low[s] = True
+            where[s] = j
+        for j in range(half):
+            s = order[nlow + j]
+            high[j] = s
+            in_low[s] = False
+            where[s] = j
+        out[r, 0] = vals[low[0]]
+        for i in range(1, n):
+            s = (i - 1) % window
+            vals[s] = row[i + window - 1]
+            if in_low[s]:
+                j = _heap_sift_up(low, where[s], vals, where, True)
+                _heap_sift_down(low, nlow, j, vals, where, True)
+            else:
+                j = _heap_sift_up(high, where[s], vals, where, False)
+                _heap_sift_down(high, half, j, vals, where, False)
+            if half > 0 and vals[low[0]] > vals[high[0]]:
+                a = low[0]
+                b = high[0]
+                low[0] = b
+                high[0] = a
+                in_low[a] = False
+                in_low[b] = True
+                _heap_sift_down(low, nlow, 0, vals, where, True)
+                _heap_sift_down(high, half, 0, vals, where, False)
+            out[r, i] = vals[low[0]]
+
+
+def running_median(x, window):
+    """Running median, with the zero-padded edges of `scipy.signal.medfilt`.
+
+    With Numba, the median is updated with two heaps, in O(log(window))
+    operations per sample, instead of the O(window) of ``medfilt``, which is
+    used if Numba is not installed.
+
+    Parameters
+    ----------
+    x : array-like
+        The input series. If 2-D, each row is filtered independently (as by
+        ``medfilt2d`` with a ``[1, window]`` kernel)
+    window : int
+        The window size. Must be odd
+
+    Returns
+    -------
+    median : array-like
+        The running median, with the same shape and data type as ``x``
+        (in the native byte order)
+
+    Examples
+    --------
+    >>> running_median([2, 1, 5, 4, 3], 3)
+    array([1, 2, 4, 4, 3])
+    >>> running_median([[2., 1., 5.], [1., 1., 0.]], 3)
+    array([[1., 2., 1.],
+           [1., 1., 0.]])
+    >>> running_median([2, 1, 5, 4, 3], 4)
+    Traceback (most recent call last):
+        ...
+    ValueError: The window size of the running median must be odd
+    """
+    from scipy.signal import medfilt, medfilt2d
+    x = np.asarray(x)
+    # Neither Numba nor medfilt accept data in a non-native byte order
+    x = x.astype(x.dtype.newbyteorder('='), copy=False)
+    window = int(window)
+    if window < 1 or window % 2 == 0:
+        raise ValueError("The window size of the running median must be odd")
+    if not HAS_NUMBA:
+        if x.ndim == 1:
+            return medfilt(x, window)
+        return medfilt2d(x, [1, window])
+
+    rows = np.atleast_2d(x)
+    nrows, n = rows.shape
+    out = np.zeros((nrows, n), dtype=x.dtype)
+    if n == 0:
+        return out.reshape(x.shape)
+
+    # NaNs cannot be ordered in the heaps: leave these rows to medfilt
+    good = np.all(np.isfinite(rows), axis=1)
+    for i in np.flatnonzero(~good):
+        out[i] = medfilt(rows[i], window)
+
+    if np.any(good):
+        half = window // 2
+        padded = np.zeros((np.count_nonzero(good), n + 2 * half),
+                          dtype=x.dtype)
+        padded[:, half:half + n] = rows[good]
+        good_out = np.zeros((padded.shape[0], n), dtype=x.dtype)
+        _running_median_rows(padded, window, good_out)
+        out[good] = good_out
+    return out.reshape(x.shape)
+
+
 def get_mH2O(TMP, U):
     """Get the meters of H2O, using the formula from old converter.
 